@@ -0,0 +1,80 @@
+"""Cliente assíncrono (asyncio) para a API do Kernel.
+
+As corrotinas deste módulo executam `hooks.kernel_connect` em um pool de
+threads, preservando a política de novas tentativas (tenacity) e o pool de
+conexões persistentes do módulo `common.hooks`. Desta forma é possível manter
+várias requisições em andamento sem adicionar dependências ao projeto.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from common import hooks
+
+
+Logger = logging.getLogger(__name__)
+
+KERNEL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=hooks.KERNEL_POOL_MAXSIZE, thread_name_prefix="kernel"
+)
+
+
+async def kernel_connect(
+    endpoint, method, data=None, headers=hooks.DEFAULT_HEADER, timeout=1
+):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        KERNEL_EXECUTOR,
+        functools.partial(
+            hooks.kernel_connect,
+            endpoint,
+            method,
+            data=data,
+            headers=headers,
+            timeout=timeout,
+        ),
+    )
+
+
+async def get(endpoint, **kwargs):
+    return await kernel_connect(endpoint, "GET", **kwargs)
+
+
+async def put(endpoint, data=None, **kwargs):
+    return await kernel_connect(endpoint, "PUT", data=data, **kwargs)
+
+
+async def patch(endpoint, data=None, **kwargs):
+    return await kernel_connect(endpoint, "PATCH", data=data, **kwargs)
+
+
+async def delete(endpoint, **kwargs):
+    return await kernel_connect(endpoint, "DELETE", **kwargs)
+
+
+async def gather_bounded(requests, limit=10, return_exceptions=False):
+    """Executa as corrotinas de `requests` mantendo no máximo `limit` delas em
+    andamento ao mesmo tempo.
+
+    Os resultados são retornados na mesma ordem de `requests`. Caso
+    `return_exceptions` seja verdadeiro as exceções são retornadas no lugar
+    dos resultados, como em `asyncio.gather`.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _bounded(request):
+        async with semaphore:
+            return await request
+
+    return await asyncio.gather(
+        *[_bounded(request) for request in requests],
+        return_exceptions=return_exceptions
+    )
+
+
+def run_bounded(requests, limit=10, return_exceptions=False):
+    """Versão síncrona de `gather_bounded` para uso dentro das tasks."""
+    return asyncio.run(
+        gather_bounded(requests, limit=limit, return_exceptions=return_exceptions)
+    )
@@ -1,11 +1,32 @@
+import os
 import logging
 import json
+import codecs
+import functools
+import gzip
+import hashlib
+import bisect
+import math
+import mimetypes
+import tempfile
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from types import SimpleNamespace
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+
 import requests
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from tenacity import (
     retry,
     wait_exponential,
     stop_after_attempt,
-    retry_if_exception_type,
 )
 from airflow.hooks.http_hook import HttpHook
 from airflow.hooks.S3_hook import S3Hook
@@ -13,6 +34,10 @@ from airflow.hooks.base_hook import BaseHook
 
 from mongoengine import connect
 
+from common import json_codec
+from common.spool import WriteSpool, resource_path, is_rejected
+from common.upload_index import UploadIndex
+
 
 Logger = logging.getLogger(__name__)
 
@@ -20,34 +45,1312 @@ DEFAULT_HEADER = {
     "Content-Type": "application/json"
 }
 
-KERNEL_HOOK_BASE = HttpHook(http_conn_id="kernel_conn", method="GET")
+KERNEL_POOL_CONNECTIONS = int(os.environ.get("KERNEL_POOL_CONNECTIONS", 1))
+KERNEL_POOL_MAXSIZE = int(os.environ.get("KERNEL_POOL_MAXSIZE", 10))
+KERNEL_HTTP_CACHE_DIR = os.environ.get("KERNEL_HTTP_CACHE_DIR")
+KERNEL_CONCURRENCY_INITIAL = int(os.environ.get("KERNEL_CONCURRENCY_INITIAL", 4))
+KERNEL_CONCURRENCY_MIN = int(os.environ.get("KERNEL_CONCURRENCY_MIN", 1))
+KERNEL_CONCURRENCY_MAX = int(
+    os.environ.get("KERNEL_CONCURRENCY_MAX", KERNEL_POOL_MAXSIZE)
+)
+CIRCUIT_BREAKER_FAILURE_RATE = float(
+    os.environ.get("CIRCUIT_BREAKER_FAILURE_RATE", 0.5)
+)
+CIRCUIT_BREAKER_WINDOW = int(os.environ.get("CIRCUIT_BREAKER_WINDOW", 20))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get("CIRCUIT_BREAKER_MIN_CALLS", 10))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get("CIRCUIT_BREAKER_RESET_TIMEOUT", 30)
+)
+KERNEL_HEDGING_ENABLED = (
+    os.environ.get("KERNEL_HEDGING_ENABLED", "false").lower() == "true"
+)
+KERNEL_HEDGING_PERCENTILE = float(os.environ.get("KERNEL_HEDGING_PERCENTILE", 95))
+KERNEL_HEDGING_BUDGET = float(os.environ.get("KERNEL_HEDGING_BUDGET", 0.05))
+KERNEL_SINGLE_FLIGHT_ENABLED = (
+    os.environ.get("KERNEL_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+)
+KERNEL_SINGLE_FLIGHT_MAXSIZE = int(os.environ.get("KERNEL_SINGLE_FLIGHT_MAXSIZE", 128))
+CONNECTION_CACHE_TTL = float(os.environ.get("CONNECTION_CACHE_TTL", 300))
+KERNEL_GZIP_ENDPOINTS = [
+    pattern.strip()
+    for pattern in os.environ.get("KERNEL_GZIP_ENDPOINTS", "").split(",")
+    if pattern.strip()
+]
+KERNEL_GZIP_MIN_SIZE = int(os.environ.get("KERNEL_GZIP_MIN_SIZE", 1024))
+KERNEL_STREAM_CHUNK_SIZE = int(os.environ.get("KERNEL_STREAM_CHUNK_SIZE", 65536))
+KERNEL_JOURNAL_LINK_TIMEOUT = float(os.environ.get("KERNEL_JOURNAL_LINK_TIMEOUT", 60))
+KERNEL_SPOOL_DIR = os.environ.get("KERNEL_SPOOL_DIR")
+KERNEL_SPOOL_DRAINERS = int(os.environ.get("KERNEL_SPOOL_DRAINERS", 4))
+WRITE_METHODS = ("PUT", "PATCH", "DELETE")
+KERNEL_COALESCE_MERGEABLE = [
+    template.strip()
+    for template in os.environ.get(
+        "KERNEL_COALESCE_MERGEABLE", "/journals/{id},/bundles/{id}"
+    ).split(",")
+    if template.strip()
+]
+KERNEL_COALESCE_MAX_BUFFERED = int(os.environ.get("KERNEL_COALESCE_MAX_BUFFERED", 100))
+OBJECT_STORE_POOL_MAXSIZE = int(os.environ.get("OBJECT_STORE_POOL_MAXSIZE", 20))
+OBJECT_STORE_STREAM_THRESHOLD = int(os.environ.get("OBJECT_STORE_STREAM_THRESHOLD", 0))
+OBJECT_STORE_SPOOL_MAX_SIZE = int(
+    os.environ.get("OBJECT_STORE_SPOOL_MAX_SIZE", 8 * 1024 * 1024)
+)
+OBJECT_STORE_MULTIPART_CHUNK_SIZE = int(
+    os.environ.get("OBJECT_STORE_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024)
+)
+OBJECT_STORE_MULTIPART_CONCURRENCY = int(
+    os.environ.get("OBJECT_STORE_MULTIPART_CONCURRENCY", 4)
+)
+OBJECT_STORE_GZIP_EXTENSIONS = [
+    "." + extension.strip().lower().lstrip(".")
+    for extension in os.environ.get("OBJECT_STORE_GZIP_EXTENSIONS", "").split(",")
+    if extension.strip()
+]
+OBJECT_STORE_UPLOAD_WORKERS = int(os.environ.get("OBJECT_STORE_UPLOAD_WORKERS", 1))
+OBJECT_STORE_PACKAGE_WORKERS = int(os.environ.get("OBJECT_STORE_PACKAGE_WORKERS", 1))
+OBJECT_STORE_PACKAGE_QUEUE_SIZE = int(
+    os.environ.get("OBJECT_STORE_PACKAGE_QUEUE_SIZE", 4 * OBJECT_STORE_PACKAGE_WORKERS)
+)
+OBJECT_STORE_DEFER_MEDIA = (
+    os.environ.get("OBJECT_STORE_DEFER_MEDIA", "false").lower() == "true"
+)
+OBJECT_STORE_KEY_LAYOUT = os.environ.get("OBJECT_STORE_KEY_LAYOUT", "document")
+OBJECT_STORE_KEY_HASH_LENGTH = int(os.environ.get("OBJECT_STORE_KEY_HASH_LENGTH", 2))
+OBJECT_STORE_INDEX_PATH = os.environ.get("OBJECT_STORE_INDEX_PATH")
+OBJECT_STORE_INDEX_VERIFY_AFTER = float(
+    os.environ.get("OBJECT_STORE_INDEX_VERIFY_AFTER", 0)
+)
+OBJECT_STORE_LIST_PREFIXES = (
+    os.environ.get("OBJECT_STORE_LIST_PREFIXES", "false").lower() == "true"
+)
+OBJECT_STORE_LISTINGS_MAXSIZE = int(
+    os.environ.get("OBJECT_STORE_LISTINGS_MAXSIZE", 256)
+)
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN_RETRIES = int(os.environ.get("RETRY_BUDGET_MIN_RETRIES", 10))
+REQUEST_RATE_LIMIT = float(os.environ.get("REQUEST_RATE_LIMIT", 0))
+REQUEST_RATE_BURST = float(
+    os.environ.get("REQUEST_RATE_BURST", max(1, REQUEST_RATE_LIMIT))
+)
+
+
+class ConnectionCache:
+    """Cache, por processo, das conexões cadastradas no Airflow.
+
+    Evita que cada requisição ao Kernel, ao object store ou ao MongoDB
+    consulte a base de metadados do Airflow. As conexões são consultadas
+    novamente após `ttl` segundos.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn_id, loader):
+        with self._lock:
+            cached = self._connections.get(conn_id)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self.hits += 1
+                return cached[1]
+
+        connection = loader(conn_id)
+        with self._lock:
+            self.misses += 1
+            self._connections[conn_id] = (time.monotonic(), connection)
+        return connection
+
+    def invalidate(self, conn_id=None):
+        with self._lock:
+            if conn_id is None:
+                self._connections.clear()
+            else:
+                self._connections.pop(conn_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+CONNECTION_CACHE = ConnectionCache(CONNECTION_CACHE_TTL)
+
+
+def cached_connection(conn_id):
+    """Obtém a conexão `conn_id` do Airflow por meio do `CONNECTION_CACHE`."""
+    return CONNECTION_CACHE.get(conn_id, BaseHook.get_connection)
+
+
+class KernelConnectionPool:
+    """Pool de conexões HTTP persistentes (keep-alive) compartilhado por todas
+    as requisições ao Kernel feitas no processo.
+
+    O `HTTPAdapter` é montado em cada `requests.Session` criada pelo
+    `HttpHook`, de forma que as conexões TCP/TLS abertas são reaproveitadas
+    entre chamadas em vez de serem estabelecidas a cada requisição.
+    """
+
+    def __init__(self, pool_connections, pool_maxsize):
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+        )
+
+    def mount(self, session):
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        return session
+
+    def stats(self):
+        """Retorna os contadores do pool.
+
+        `misses` é o número de conexões abertas e `hits` o número de
+        requisições que reaproveitaram uma conexão já estabelecida.
+        """
+        pools = self.adapter.poolmanager.pools
+        requests_count = connections = 0
+        for key in pools.keys():
+            pool = pools[key]
+            requests_count += pool.num_requests
+            connections += pool.num_connections
+        return {
+            "hits": max(requests_count - connections, 0),
+            "misses": connections,
+        }
+
+
+KERNEL_POOL = KernelConnectionPool(KERNEL_POOL_CONNECTIONS, KERNEL_POOL_MAXSIZE)
+
+
+class KernelResponseCache:
+    """Cache em disco das respostas das requisições GET ao Kernel.
+
+    Os corpos das respostas são armazenados junto com os seus validadores
+    (`ETag` e `Last-Modified`), que são enviados nas requisições seguintes
+    para o mesmo recurso (`If-None-Match` e `If-Modified-Since`). Quando o
+    Kernel responde `304 Not Modified` o corpo armazenado é devolvido.
 
-@retry(
-    wait=wait_exponential(),
-    stop=stop_after_attempt(4),
-    retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)),
+    O cache fica desabilitado enquanto `path` não for informado.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _filepath(self, url):
+        return os.path.join(
+            self.path, "{}.json".format(hashlib.sha1(url.encode("utf-8")).hexdigest())
+        )
+
+    def load(self, url):
+        try:
+            with open(self._filepath(url)) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": response.headers.get("Content-Type"),
+            "body": response.content.decode("utf-8"),
+        }
+        os.makedirs(self.path, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path, suffix=".tmp", delete=False
+        ) as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(cache_file.name, self._filepath(url))
+
+    def response_from(self, entry, not_modified):
+        """Produz uma resposta `200 OK` a partir de uma entrada do cache."""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        response.headers = CaseInsensitiveDict(not_modified.headers)
+        if entry.get("content_type"):
+            response.headers["Content-Type"] = entry["content_type"]
+        response.headers["X-Cache"] = "HIT"
+        return response
+
+    def conditional_send(self, prepped_request, send):
+        """Envia `prepped_request` por meio de `send` utilizando os
+        validadores armazenados para a URL requisitada."""
+        url = prepped_request.url
+        entry = self.load(url)
+        if entry is not None:
+            if entry.get("etag"):
+                prepped_request.headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                prepped_request.headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = send()
+
+        if entry is not None and response.status_code == 304:
+            response = self.response_from(entry, response)
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(response.content)
+        else:
+            with self._lock:
+                self.misses += 1
+            try:
+                self.store(url, response)
+            except (OSError, UnicodeDecodeError) as exc:
+                Logger.warning('Could not cache response of "%s": %s', url, exc)
+        return response
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+KERNEL_CACHE = KernelResponseCache(KERNEL_HTTP_CACHE_DIR)
+
+
+def is_overload_status(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+class AIMDLimiter:
+    """Limita a quantidade de requisições simultâneas ao Kernel de forma
+    adaptativa (Additive Increase / Multiplicative Decrease).
+
+    Enquanto a latência observada permanecer estável (até `tolerance` vezes a
+    latência média) o limite cresce de forma aditiva, aproximadamente
+    `increase` requisição a cada janela completa. Timeouts e respostas
+    429 ou 5xx reduzem o limite multiplicando-o por `decrease`, no máximo
+    uma vez por intervalo de latência média.
+    """
+
+    def __init__(
+        self, initial, minimum, maximum, increase=1.0, decrease=0.5, tolerance=2.0
+    ):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.latency = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def release(self, latency=None, overloaded=False):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease >= (self.latency or 0.0):
+                    self.limit = max(float(self.minimum), self.limit * self.decrease)
+                    self.decreases += 1
+                    self._last_decrease = now
+            elif latency is not None:
+                if self.latency is None or latency <= self.latency * self.tolerance:
+                    self.limit = min(
+                        float(self.maximum), self.limit + self.increase / self.limit
+                    )
+                    self.increases += 1
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else 0.9 * self.latency + 0.1 * latency
+                )
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Ocupa uma vaga durante a execução de uma requisição.
+
+        O bloco deve marcar `slot.overloaded` conforme a resposta obtida.
+        """
+        self.acquire()
+        slot = SimpleNamespace(overloaded=False)
+        started = time.monotonic()
+        latency = None
+        try:
+            yield slot
+            latency = time.monotonic() - started
+        except requests.Timeout:
+            slot.overloaded = True
+            raise
+        finally:
+            self.release(latency, slot.overloaded)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "latency": round(self.latency, 4) if self.latency else None,
+            }
+
+
+KERNEL_LIMITER = AIMDLimiter(
+    KERNEL_CONCURRENCY_INITIAL, KERNEL_CONCURRENCY_MIN, KERNEL_CONCURRENCY_MAX
 )
+
+
+class CircuitOpenError(Exception):
+    ...
+
+
+class CircuitBreaker:
+    """Disjuntor (closed/open/half-open) compartilhado pelas chamadas a um
+    serviço.
+
+    No estado `closed` as chamadas são registradas em uma janela deslizante
+    de `window` resultados. Quando a taxa de falhas da janela atinge
+    `failure_rate` (com ao menos `min_calls` chamadas) o disjuntor abre e
+    as chamadas seguintes falham imediatamente com `CircuitOpenError`.
+    Após `reset_timeout` segundos uma única chamada de teste é permitida
+    (`half-open`): se tiver sucesso o disjuntor fecha, caso contrário volta
+    a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        name,
+        failure_exceptions,
+        failure_rate=0.5,
+        window=20,
+        min_calls=10,
+        reset_timeout=30,
+    ):
+        self.name = name
+        self.failure_exceptions = failure_exceptions
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.rejected = 0
+        self.opened = 0
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        Logger.warning(
+            'Circuit breaker "%s" changed from %s to %s', self.name, self.state, state
+        )
+        self.state = state
+        if state == self.OPEN:
+            self.opened += 1
+            self._opened_at = time.monotonic()
+        elif state == self.CLOSED:
+            self._results.clear()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at >= self.reset_timeout:
+                    self._transition(self.HALF_OPEN)
+                else:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        'Circuit breaker "{}" is open'.format(self.name)
+                    )
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        'Circuit breaker "{}" is half-open'.format(self.name)
+                    )
+                self._probing = True
+
+    def after_call(self, failed):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                self._transition(self.OPEN if failed else self.CLOSED)
+                return
+
+            self._results.append(failed)
+            failures = sum(self._results)
+            if (
+                self.state == self.CLOSED
+                and len(self._results) >= self.min_calls
+                and failures / len(self._results) >= self.failure_rate
+            ):
+                self._transition(self.OPEN)
+
+    @contextmanager
+    def guard(self):
+        """Protege uma chamada ao serviço.
+
+        O bloco pode marcar `call.failed` para registrar como falha uma
+        chamada que não levantou exceção (ex.: respostas 5xx).
+        """
+        self.before_call()
+        call = SimpleNamespace(failed=False)
+        try:
+            yield call
+        except self.failure_exceptions:
+            call.failed = True
+            raise
+        finally:
+            self.after_call(call.failed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": sum(self._results),
+                "calls": len(self._results),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+KERNEL_BREAKER = CircuitBreaker(
+    "kernel",
+    (requests.ConnectionError, requests.Timeout),
+    failure_rate=CIRCUIT_BREAKER_FAILURE_RATE,
+    window=CIRCUIT_BREAKER_WINDOW,
+    min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+    reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+
+OBJECT_STORE_BREAKER = CircuitBreaker(
+    "object_store",
+    (Exception,),
+    failure_rate=CIRCUIT_BREAKER_FAILURE_RATE,
+    window=CIRCUIT_BREAKER_WINDOW,
+    min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+    reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+
+
+class RetryBudget:
+    """Orçamento de novas tentativas compartilhado por todos os hooks
+    durante a execução de uma task.
+
+    São permitidas `min_retries` novas tentativas mais `ratio` vezes a
+    quantidade de chamadas bem sucedidas. Esgotado o orçamento, as falhas
+    são propagadas imediatamente em vez de multiplicar a carga sobre um
+    serviço já degradado.
+    """
+
+    def __init__(self, ratio, min_retries):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.successes = 0
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+
+    def allow_retry(self):
+        with self._lock:
+            if self.retries < self.min_retries + self.ratio * self.successes:
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "successes": self.successes,
+                "retries": self.retries,
+                "denied": self.denied,
+            }
+
+
+RETRY_BUDGET = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_RETRIES)
+
+
+class TokenBucket:
+    """Limita a taxa de chamadas a `rate` por segundo, permitindo rajadas de
+    até `burst` chamadas. Com `rate` igual a 0 não há limite."""
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.acquired = 0
+        self.waited = 0.0
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self.tokens -= 1
+            self.acquired += 1
+            # O saldo negativo reserva a ficha para esta chamada
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.waited += delay
+        if delay:
+            self.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {"rate": self.rate, "acquired": self.acquired, "waited": self.waited}
+
+
+REQUEST_RATE = TokenBucket(REQUEST_RATE_LIMIT, REQUEST_RATE_BURST)
+
+
+def budgeted_retry(exceptions, attempts):
+    """Política de novas tentativas dos hooks.
+
+    Repete a chamada decorada até `attempts` vezes quando ela lança uma das
+    `exceptions`, desde que o `RETRY_BUDGET` permita. Cada tentativa
+    aguarda o `REQUEST_RATE` e as chamadas bem sucedidas aumentam o
+    orçamento.
+    """
+
+    def _should_retry(retry_state):
+        outcome = retry_state.outcome
+        if not outcome.failed or not isinstance(outcome.exception(), exceptions):
+            return False
+        if retry_state.attempt_number >= attempts:
+            # Última tentativa: não há nova tentativa a ser descontada
+            return False
+        if RETRY_BUDGET.allow_retry():
+            return True
+        Logger.warning(
+            "Retry budget exhausted, giving up after: %s", outcome.exception()
+        )
+        return False
+
+    def decorator(func):
+        @retry(
+            wait=wait_exponential(),
+            stop=stop_after_attempt(attempts),
+            retry=_should_retry,
+        )
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            REQUEST_RATE.acquire()
+            result = func(*args, **kwargs)
+            RETRY_BUDGET.record_success()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def percentile(samples, p):
+    """Percentil `p` (0-100) de uma coleção de amostras."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class HedgingPolicy:
+    """Requisições GET "hedged" para reduzir a latência de cauda do Kernel.
+
+    A requisição original é enviada e, se não houver resposta até o percentil
+    `percentile` das latências observadas, uma segunda requisição idêntica é
+    enviada. A primeira resposta obtida é utilizada. A quantidade de
+    requisições extras é limitada a `budget` (fração) do total de requisições.
+
+    São mantidas as latências das requisições originais (antes) e as
+    latências percebidas pelo chamador (depois) para comparação.
+    """
+
+    def __init__(
+        self, enabled, percentile, budget, min_samples=20, window=1000, workers=20
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._primary_latencies = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="kernel-hedge"
+        )
+
+    def threshold(self):
+        with self._lock:
+            if len(self._primary_latencies) < self.min_samples:
+                return None
+            return percentile(self._primary_latencies, self.percentile)
+
+    def _take_budget(self):
+        with self._lock:
+            if self.hedges < self.budget * self.requests:
+                self.hedges += 1
+                return True
+            return False
+
+    def _timed(self, send, request):
+        started = time.monotonic()
+        response = send(request)
+        with self._lock:
+            self._primary_latencies.append(time.monotonic() - started)
+        return response
+
+    def run(self, send, request):
+        """Executa `send(request)`, enviando uma cópia de `request` caso a
+        resposta demore mais do que o limiar atual."""
+        started = time.monotonic()
+        threshold = self.threshold()
+        with self._lock:
+            self.requests += 1
+
+        primary = self._executor.submit(self._timed, send, request)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._take_budget():
+            response = primary.result()
+        else:
+            hedge = self._executor.submit(send, request.copy())
+            response = self._first_result(primary, hedge)
+
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return response
+
+    def _first_result(self, primary, hedge):
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            primary = list(self._primary_latencies)
+            latencies = list(self._latencies)
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "before": {
+                    "p50": percentile(primary, 50),
+                    "p99": percentile(primary, 99),
+                },
+                "after": {
+                    "p50": percentile(latencies, 50),
+                    "p99": percentile(latencies, 99),
+                },
+            }
+
+
+KERNEL_HEDGING = HedgingPolicy(
+    KERNEL_HEDGING_ENABLED,
+    KERNEL_HEDGING_PERCENTILE,
+    KERNEL_HEDGING_BUDGET,
+    workers=2 * KERNEL_POOL_MAXSIZE,
+)
+
+
+def resource_url(url):
+    """URL do recurso principal do Kernel ao qual `url` se refere.
+
+    >>> resource_url("http://kernel/bundles/0034-8910-2014-v48-n2/documents")
+    'http://kernel/bundles/0034-8910-2014-v48-n2'
+    """
+    parts = urlsplit(url)
+    path = "/".join(parts.path.split("/")[:3])
+    return "{}://{}{}".format(parts.scheme, parts.netloc, path)
+
+
+class SingleFlight:
+    """Agrupa requisições GET idênticas feitas durante uma execução.
+
+    Chamadas concorrentes para a mesma chave aguardam e compartilham uma única
+    requisição em andamento, e os resultados aceitos por `remember` são
+    reaproveitados pelas chamadas seguintes. Somente os `maxsize` resultados
+    usados mais recentemente são mantidos. `forget` descarta os resultados
+    de um recurso, devendo ser chamado sempre que ele for alterado.
+    """
+
+    def __init__(self, enabled=True, maxsize=128):
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.saved = 0
+        self._calls = {}
+        self._results = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, remember=None):
+        with self._lock:
+            if key in self._results:
+                self.saved += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                generation = self._generation
+            else:
+                self.saved += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(exc)
+            raise
+
+        with self._lock:
+            del self._calls[key]
+            if self.maxsize > 0 and generation == self._generation and (
+                remember is None or remember(result)
+            ):
+                self._results[key] = result
+                if len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def forget(self, prefix):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._results if key.startswith(prefix)]:
+                del self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"saved": self.saved, "remembered": len(self._results)}
+
+
+KERNEL_SINGLE_FLIGHT = SingleFlight(
+    KERNEL_SINGLE_FLIGHT_ENABLED, KERNEL_SINGLE_FLIGHT_MAXSIZE
+)
+
+
+class KernelCompression:
+    """Compressão gzip dos corpos das requisições enviadas ao Kernel.
+
+    Somente os corpos com ao menos `min_size` bytes enviados aos endpoints
+    que casam com um dos padrões de `patterns` (ex.: `/documents/*`) são
+    comprimidos. As respostas comprimidas são anunciadas com
+    `Accept-Encoding` e os bytes trafegados são contabilizados para medir a
+    economia de banda.
+    """
+
+    def __init__(self, patterns, min_size):
+        self.patterns = patterns
+        self.min_size = min_size
+        self.request_raw_bytes = 0
+        self.request_sent_bytes = 0
+        self.response_raw_bytes = 0
+        self.response_received_bytes = 0
+        self._lock = threading.Lock()
+
+    def matches(self, url):
+        path = urlsplit(url).path
+        return any(fnmatch(path, pattern) for pattern in self.patterns)
+
+    def compress_request(self, prepped_request):
+        prepped_request.headers.setdefault("Accept-Encoding", "gzip, deflate")
+        body = prepped_request.body
+        if not body:
+            return
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        sent = body
+        if len(body) >= self.min_size and self.matches(prepped_request.url):
+            sent = gzip.compress(body)
+            prepped_request.body = sent
+            prepped_request.headers["Content-Encoding"] = "gzip"
+            prepped_request.headers["Content-Length"] = str(len(sent))
+            Logger.debug(
+                "%s %s - gzip request body: %d bytes raw, %d bytes sent",
+                prepped_request.method,
+                prepped_request.url,
+                len(body),
+                len(sent),
+            )
+
+        with self._lock:
+            self.request_raw_bytes += len(body)
+            self.request_sent_bytes += len(sent)
+
+    def record_response(self, response):
+        raw = getattr(response, "raw", None)
+        if raw is None or not hasattr(raw, "tell"):
+            return
+        received = raw.tell()
+        decoded = len(response.content)
+        Logger.debug(
+            "%s - response body (%s): %d bytes raw, %d bytes received",
+            response.url,
+            response.headers.get("Content-Encoding", "identity"),
+            decoded,
+            received,
+        )
+        with self._lock:
+            self.response_raw_bytes += decoded
+            self.response_received_bytes += received
+
+    def stats(self):
+        with self._lock:
+            return {
+                "request_raw_bytes": self.request_raw_bytes,
+                "request_sent_bytes": self.request_sent_bytes,
+                "response_raw_bytes": self.response_raw_bytes,
+                "response_received_bytes": self.response_received_bytes,
+            }
+
+
+KERNEL_COMPRESSION = KernelCompression(KERNEL_GZIP_ENDPOINTS, KERNEL_GZIP_MIN_SIZE)
+
+
+def endpoint_template(endpoint):
+    """Modelo do endpoint do Kernel, sem os identificadores e parâmetros,
+    usado para agrupar as métricas.
+
+    >>> endpoint_template("/documents/S0034-89102014000200001/renditions")
+    '/documents/{id}/renditions'
+    """
+    segments = urlsplit(endpoint).path.split("/")
+    if len(segments) > 2 and segments[2]:
+        segments[2] = "{id}"
+    return "/".join(segments)
+
+
+class LatencyHistogram:
+    """Histograma de latências (em segundos) com intervalos fixos."""
+
+    BOUNDS = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+    )
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Limite superior do intervalo que contém o quantil `q` (0-1)."""
+        if not self.count:
+            return None
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for bound, count in zip(self.BOUNDS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(map(str, self.BOUNDS + ("+Inf",)), self.counts)),
+        }
+
+
+class EndpointMetrics:
+    """Métricas das chamadas ao Kernel ou ao object store agrupadas por
+    método e modelo do endpoint: histograma de latências, bytes enviados e
+    recebidos e quantidade de respostas por status."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, endpoint, status, elapsed, sent_bytes, received_bytes):
+        key = "{} {}".format(method, endpoint_template(endpoint))
+        with self._lock:
+            metrics = self.endpoints.get(key)
+            if metrics is None:
+                metrics = self.endpoints[key] = {
+                    "latency": LatencyHistogram(),
+                    "sent_bytes": 0,
+                    "received_bytes": 0,
+                    "status": {},
+                }
+            metrics["latency"].observe(elapsed)
+            metrics["sent_bytes"] += sent_bytes
+            metrics["received_bytes"] += received_bytes
+            metrics["status"][status] = metrics["status"].get(status, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                key: dict(metrics, latency=metrics["latency"].stats())
+                for key, metrics in self.endpoints.items()
+            }
+
+
+KERNEL_METRICS = EndpointMetrics()
+OBJECT_STORE_METRICS = EndpointMetrics()
+
+
+class LazyJSON:
+    """Serializa `data` somente quando a mensagem de log for formatada."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        data = self.data or ""
+        if isinstance(data, (str, bytes)):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                return str(data)
+        return json.dumps(data, indent=2)
+
+
+class JSONStream:
+    """Leitor incremental de um documento JSON recebido em partes (`bytes`
+    ou `str`).
+
+    Mantém em memória somente o trecho ainda não consumido do documento,
+    lendo novas partes de `chunks` apenas quando necessário.
+    """
+
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            text = self.decoder.decode(b"", final=True)
+            self.eof = True
+        else:
+            text = chunk if isinstance(chunk, str) else self.decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos :] + text
+        self.pos = 0
+
+    def peek(self):
+        """Retorna o próximo caractere que não é espaço em branco."""
+        while True:
+            while (
+                self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON stream")
+            self._read()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                "Expecting %r, found %r in JSON stream" % (char, self.buffer[self.pos])
+            )
+        self.pos += 1
+
+    def skip(self, char):
+        if self.peek() == char:
+            self.pos += 1
+
+    def value(self):
+        """Decodifica o próximo valor JSON completo."""
+        while True:
+            self.peek()
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self._read()
+                continue
+            if end == len(self.buffer) and not self.eof:
+                # Um número no final do buffer pode estar incompleto
+                self._read()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_items(chunks, key):
+    """Produz os elementos da lista `key` de um objeto JSON à medida que suas
+    partes (`chunks`) são recebidas, por exemplo, os `results` de `/changes`
+    ou os `items` de `/bundles/{id}`.
+
+    A leitura é interrompida ao final da lista. Nenhum elemento é produzido
+    caso o objeto não possua `key`.
+    """
+    stream = JSONStream(chunks)
+    stream.expect("{")
+    while stream.peek() != "}":
+        name = stream.value()
+        stream.expect(":")
+        if name == key:
+            stream.expect("[")
+            while stream.peek() != "]":
+                yield stream.value()
+                stream.skip(",")
+            return
+        stream.value()
+        stream.skip(",")
+
+
+class KernelHttpHook(HttpHook):
+    """`HttpHook` que utiliza o pool de conexões, o cache de respostas, o
+    limitador de concorrência, o disjuntor, o "hedging", o agrupamento de
+    GETs e a compressão das requisições do Kernel."""
+
+    @classmethod
+    def get_connection(cls, conn_id):
+        return cached_connection(conn_id)
+
+    def get_conn(self, headers=None):
+        return KERNEL_POOL.mount(super().get_conn(headers))
+
+    def run_and_check(self, session, prepped_request, extra_options):
+        extra_options = dict(extra_options or {})
+        check_response = extra_options.get("check_response", True)
+        extra_options["check_response"] = False
+        # Respostas lidas incrementalmente (`stream`) não passam pelo cache,
+        # pelo "hedging" nem pelo agrupamento de GETs, pois todos eles
+        # dependem do corpo completo da resposta.
+        stream = extra_options.get("stream", False)
+        cacheable = self.method == "GET" and not stream
+
+        KERNEL_COMPRESSION.compress_request(prepped_request)
+
+        def _attempt(request):
+            def _send():
+                response = super(KernelHttpHook, self).run_and_check(
+                    session, request, extra_options
+                )
+                if not stream:
+                    KERNEL_COMPRESSION.record_response(response)
+                return response
+
+            with KERNEL_BREAKER.guard() as call, KERNEL_LIMITER.slot() as slot:
+                if cacheable and KERNEL_CACHE.enabled:
+                    response = KERNEL_CACHE.conditional_send(request, _send)
+                else:
+                    response = _send()
+                slot.overloaded = call.failed = is_overload_status(
+                    response.status_code
+                )
+            return response
+
+        def _request():
+            if cacheable and KERNEL_HEDGING.enabled:
+                return KERNEL_HEDGING.run(_attempt, prepped_request)
+            return _attempt(prepped_request)
+
+        if cacheable and KERNEL_SINGLE_FLIGHT.enabled:
+            response = KERNEL_SINGLE_FLIGHT.do(
+                prepped_request.url, _request, remember=lambda response: response.ok
+            )
+        elif self.method != "GET":
+            KERNEL_SINGLE_FLIGHT.forget(resource_url(prepped_request.url))
+            try:
+                response = _request()
+            finally:
+                KERNEL_SINGLE_FLIGHT.forget(resource_url(prepped_request.url))
+        else:
+            response = _request()
+
+        if check_response:
+            self.check_response(response)
+        return response
+
+
+def kernel_stats():
+    """Retorna o estado dos mecanismos de acesso ao Kernel e ao object store
+    do processo."""
+    return {
+        "pool": KERNEL_POOL.stats(),
+        "cache": KERNEL_CACHE.stats(),
+        "limiter": KERNEL_LIMITER.stats(),
+        "breaker": KERNEL_BREAKER.stats(),
+        "object_store_breaker": OBJECT_STORE_BREAKER.stats(),
+        "hedging": KERNEL_HEDGING.stats(),
+        "single_flight": KERNEL_SINGLE_FLIGHT.stats(),
+        "connections": CONNECTION_CACHE.stats(),
+        "compression": KERNEL_COMPRESSION.stats(),
+        "spool": KERNEL_SPOOL.stats() if KERNEL_SPOOL is not None else {},
+        "coalescing": KERNEL_COALESCER.stats(),
+        "retry_budget": RETRY_BUDGET.stats(),
+        "request_rate": REQUEST_RATE.stats(),
+        "endpoints": KERNEL_METRICS.stats(),
+        "object_store": OBJECT_STORE_METRICS.stats(),
+        "upload_index": (
+            OBJECT_STORE_INDEX.stats() if OBJECT_STORE_INDEX is not None else {}
+        ),
+        "listings": OBJECT_STORE_LISTINGS.stats(),
+    }
+
+
+def report_kernel_stats(context):
+    """Callback de task que registra no log e no XCom (`kernel_stats`) o
+    estado dos mecanismos de acesso ao Kernel ao final da execução."""
+    stats = kernel_stats()
+    Logger.info("Kernel stats: %s", stats)
+    context["ti"].xcom_push(key="kernel_stats", value=stats)
+
+
+KERNEL_HOOK_BASE = KernelHttpHook(http_conn_id="kernel_conn", method="GET")
+
+
+class ObjectStoreHook(S3Hook):
+    """`S3Hook` que obtém a conexão por meio do `CONNECTION_CACHE` e
+    compartilha, no processo, um cliente S3 por conexão com um pool de até
+    `OBJECT_STORE_POOL_MAXSIZE` conexões persistentes."""
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    @classmethod
+    def get_connection(cls, conn_id):
+        return cached_connection(conn_id)
+
+    def get_conn(self):
+        with self._clients_lock:
+            client = self._clients.get(self.aws_conn_id)
+            if client is None:
+                client = self._clients[self.aws_conn_id] = self.get_client_type(
+                    "s3", config=Config(max_pool_connections=OBJECT_STORE_POOL_MAXSIZE)
+                )
+            return client
+
+
+def object_store_base_url(bucket_name, aws_conn_id="aws_default"):
+    """URL base dos objetos de `bucket_name` no object store, obtida da
+    conexão mantida no `CONNECTION_CACHE`, de forma que as alterações da
+    conexão são consideradas após `CONNECTION_CACHE_TTL`."""
+    s3_host = cached_connection(aws_conn_id).extra_dejson.get("host")
+    return "{}/{}".format(s3_host, bucket_name)
+
+
+@budgeted_retry((requests.ConnectionError, requests.Timeout), attempts=4)
 def http_hook_run(api_hook, method, endpoint, data=None, headers=DEFAULT_HEADER, timeout=1):
-    response = api_hook.run(
-        endpoint=endpoint,
-        data=data,
-        headers=headers,
-        extra_options={"timeout": timeout, "check_response": False}
+    sent_bytes = len(data) if isinstance(data, (str, bytes)) else 0
+    started_at = time.perf_counter()
+    try:
+        response = api_hook.run(
+            endpoint=endpoint,
+            data=data,
+            headers=headers,
+            extra_options={"timeout": timeout, "check_response": False}
+        )
+    except Exception as exc:
+        KERNEL_METRICS.record(
+            method,
+            endpoint,
+            type(exc).__name__,
+            time.perf_counter() - started_at,
+            sent_bytes,
+            0,
+        )
+        raise
+
+    KERNEL_METRICS.record(
+        method,
+        endpoint,
+        str(response.status_code),
+        time.perf_counter() - started_at,
+        sent_bytes,
+        len(response.content or b""),
     )
     Logger.debug(
         "%s %s - Payload: %s - status_code: %s",
-        method, endpoint, json.dumps((data or ""), indent=2), response.status_code
+        method, endpoint, LazyJSON(data), response.status_code
     )
     return response
 
 
-def kernel_connect(endpoint, method, data=None, headers=DEFAULT_HEADER, timeout=1):
-    api_hook = HttpHook(http_conn_id="kernel_conn", method=method)
+def _kernel_connect(endpoint, method, data=None, headers=DEFAULT_HEADER, timeout=1):
+    api_hook = KernelHttpHook(http_conn_id="kernel_conn", method=method)
     response = http_hook_run(
         api_hook=api_hook,
         method=method,
         endpoint=endpoint,
-        data=json.dumps(data) if data else None,
+        data=json_codec.dumpb(data) if data else None,
         headers=headers,
         timeout=timeout
     )
@@ -55,22 +1358,552 @@ def kernel_connect(endpoint, method, data=None, headers=DEFAULT_HEADER, timeout=
     return response
 
 
-@retry(
-    wait=wait_exponential(),
-    stop=stop_after_attempt(4),
-    retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)),
+KERNEL_SPOOL = WriteSpool(KERNEL_SPOOL_DIR) if KERNEL_SPOOL_DIR else None
+_SPOOL_SESSION = None
+
+
+class KernelSpoolError(Exception):
+    ...
+
+
+def send_spooled_write(entry):
+    """Envia ao Kernel uma escrita registrada no `KERNEL_SPOOL`."""
+    return _kernel_connect(
+        entry["endpoint"],
+        entry["method"],
+        data=entry["data"],
+        headers=entry["headers"] or DEFAULT_HEADER,
+        timeout=entry["timeout"],
+    )
+
+
+def accepted_response(endpoint):
+    """Resposta entregue às escritas registradas no spool."""
+    response = requests.Response()
+    response.status_code = 202
+    response.reason = "Accepted"
+    response.url = endpoint
+    return response
+
+
+def drain_spool(session, resource=None):
+    rejected = KERNEL_SPOOL.drain(
+        send_spooled_write, workers=KERNEL_SPOOL_DRAINERS, resource=resource
+    )
+    session.rejected.update(resource_path(entry["endpoint"]) for entry in rejected)
+
+
+@contextmanager
+def spooled_writes():
+    """Registra no spool (`KERNEL_SPOOL_DIR`) as escritas realizadas por
+    `kernel_connect` dentro do bloco, que recebem imediatamente a resposta
+    202, e as envia ao Kernel ao final do bloco.
+
+    Os recursos cujas escritas foram recusadas pelo Kernel são adicionados a
+    `rejected` do objeto produzido. Caso restem escritas pendentes (Kernel
+    indisponível) `KernelSpoolError` é lançada; elas são mantidas em disco e
+    enviadas na próxima execução. Sem `KERNEL_SPOOL_DIR` as escritas são
+    enviadas diretamente.
+    """
+    global _SPOOL_SESSION
+
+    session = SimpleNamespace(rejected=set())
+    if KERNEL_SPOOL is None:
+        yield session
+        return
+
+    # Escritas pendentes de execuções anteriores encerradas
+    drain_spool(session)
+    _SPOOL_SESSION = session
+    try:
+        yield session
+    finally:
+        _SPOOL_SESSION = None
+        drain_spool(session)
+        Logger.info("Kernel write spool: %s", KERNEL_SPOOL.stats())
+
+    pending = KERNEL_SPOOL.pending(own=True)
+    if pending:
+        raise KernelSpoolError(
+            "%d writes are still pending in %s" % (len(pending), KERNEL_SPOOL.path)
+        )
+
+
+def _spooled_connect(endpoint, method, data=None, headers=DEFAULT_HEADER, timeout=1):
+    session = _SPOOL_SESSION
+    if session is not None:
+        if method in WRITE_METHODS:
+            KERNEL_SPOOL.enqueue(method, endpoint, data, headers, timeout)
+            return accepted_response(endpoint)
+        # As leituras de um recurso devem refletir as escritas já realizadas
+        drain_spool(session, resource=resource_path(endpoint))
+    return _kernel_connect(endpoint, method, data, headers, timeout)
+
+
+class WriteCoalescer:
+    """Acumula, por recurso, as escritas destinadas ao Kernel descartando as
+    que são substituídas por escritas posteriores.
+
+    - PUT substitui as escritas anteriores do mesmo endpoint, mantendo a
+      posição da primeira delas;
+    - PATCH em endpoints cujo modelo está em `mergeable` (ex.:
+      `/journals/{id}`) é combinado com a escrita anterior do endpoint. Os
+      demais (ex.: `/documents/{id}/renditions`) são mantidos;
+    - DELETE do recurso descarta todas as escritas anteriores do recurso.
+    """
+
+    def __init__(self, mergeable, max_buffered):
+        self.mergeable = set(mergeable)
+        self.max_buffered = max_buffered
+        self.resources = OrderedDict()
+        self.received = 0
+        self.eliminated = 0
+        self.flushed = 0
+        self._lock = threading.Lock()
+
+    def _coalesce(self, entries, entry):
+        endpoint = entry["endpoint"]
+        if entry["method"] == "DELETE":
+            if endpoint == resource_path(endpoint):
+                self.eliminated += len(entries)
+                entries.clear()
+            return False
+
+        previous = [
+            index
+            for index, buffered in enumerate(entries)
+            if buffered["endpoint"] == endpoint and buffered["method"] != "DELETE"
+        ]
+        if not previous:
+            return False
+
+        if entry["method"] == "PUT":
+            entries[previous[0]] = entry
+            for index in reversed(previous[1:]):
+                del entries[index]
+            self.eliminated += len(previous)
+            return True
+
+        last = entries[previous[-1]]
+        if (
+            endpoint_template(endpoint) in self.mergeable
+            and isinstance(last["data"], dict)
+            and isinstance(entry["data"], dict)
+        ):
+            entries[previous[-1]] = dict(
+                entry, method=last["method"], data=dict(last["data"], **entry["data"])
+            )
+            self.eliminated += 1
+            return True
+        return False
+
+    def add(self, method, endpoint, data=None, headers=DEFAULT_HEADER, timeout=1):
+        entry = {
+            "method": method,
+            "endpoint": endpoint,
+            "data": data,
+            "headers": headers,
+            "timeout": timeout,
+        }
+        with self._lock:
+            self.received += 1
+            entries = self.resources.setdefault(resource_path(endpoint), [])
+            if not self._coalesce(entries, entry):
+                entries.append(entry)
+
+    def buffered(self):
+        with self._lock:
+            return sum(len(entries) for entries in self.resources.values())
+
+    def oldest(self):
+        with self._lock:
+            return next(iter(self.resources), None)
+
+    def pop(self, resource=None):
+        """Remove e retorna as escritas do recurso `resource` ou, se omitido,
+        do recurso mais antigo. Retorna `(None, [])` se não houver escritas."""
+        with self._lock:
+            if resource is None:
+                resource = next(iter(self.resources), None)
+            entries = self.resources.pop(resource, [])
+            self.flushed += len(entries)
+            return resource, entries
+
+    def restore(self, resource, entries):
+        """Devolve ao início do recurso as escritas que não foram enviadas."""
+        with self._lock:
+            self.flushed -= len(entries)
+            self.resources[resource] = entries + self.resources.get(resource, [])
+            self.resources.move_to_end(resource, last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.received,
+                "eliminated": self.eliminated,
+                "flushed": self.flushed,
+                "buffered": sum(len(entries) for entries in self.resources.values()),
+            }
+
+
+KERNEL_COALESCER = WriteCoalescer(
+    KERNEL_COALESCE_MERGEABLE, KERNEL_COALESCE_MAX_BUFFERED
+)
+_COALESCE_SESSION = None
+
+
+def flush_writes(session, resource=None, raise_errors=True):
+    """Envia ao Kernel as escritas acumuladas no `KERNEL_COALESCER`, de um
+    recurso ou de todos.
+
+    Os recursos com escritas recusadas pelo Kernel são adicionados a
+    `session.rejected` e as escritas seguintes do recurso são descartadas;
+    se `session.strict` a recusa é lançada. Nas falhas transitórias as
+    escritas não enviadas permanecem acumuladas e a exceção é lançada caso
+    `raise_errors` seja verdadeiro.
+    """
+    while True:
+        current, entries = KERNEL_COALESCER.pop(resource)
+        if not entries:
+            return
+        for index, entry in enumerate(entries):
+            try:
+                _spooled_connect(
+                    entry["endpoint"],
+                    entry["method"],
+                    entry["data"],
+                    entry["headers"],
+                    entry["timeout"],
+                )
+            except Exception as exc:
+                if is_rejected(exc):
+                    if session.strict:
+                        raise
+                    Logger.error(
+                        "Kernel rejected coalesced %s %s: %s",
+                        entry["method"],
+                        entry["endpoint"],
+                        exc,
+                    )
+                    session.rejected.add(current)
+                    break
+                KERNEL_COALESCER.restore(current, entries[index:])
+                if raise_errors:
+                    raise
+                Logger.warning(
+                    "Could not flush coalesced %s %s: %s",
+                    entry["method"],
+                    entry["endpoint"],
+                    exc,
+                )
+                return
+        if resource is not None:
+            return
+
+
+@contextmanager
+def coalesced_writes(strict=False):
+    """Acumula no `KERNEL_COALESCER` as escritas realizadas por
+    `kernel_connect` dentro do bloco, que recebem imediatamente a resposta
+    202, e as envia ao Kernel ao final do bloco, ao ultrapassar
+    `KERNEL_COALESCE_MAX_BUFFERED` escritas ou antes da leitura de um
+    recurso com escritas acumuladas.
+
+    Os recursos cujas escritas foram recusadas pelo Kernel são adicionados a
+    `rejected` do objeto produzido. Com `strict` a recusa (`HTTPError`) é
+    lançada, como nas escritas realizadas diretamente.
+    """
+    global _COALESCE_SESSION
+
+    session = SimpleNamespace(rejected=set(), strict=strict)
+    _COALESCE_SESSION = session
+    try:
+        yield session
+    finally:
+        _COALESCE_SESSION = None
+        flush_writes(session)
+        Logger.info("Kernel write coalescing: %s", KERNEL_COALESCER.stats())
+
+
+def kernel_connect(endpoint, method, data=None, headers=DEFAULT_HEADER, timeout=1):
+    session = _COALESCE_SESSION
+    if session is not None:
+        if method in WRITE_METHODS:
+            KERNEL_COALESCER.add(method, endpoint, data, headers, timeout)
+            if KERNEL_COALESCER.buffered() > KERNEL_COALESCER.max_buffered:
+                flush_writes(
+                    session, resource=KERNEL_COALESCER.oldest(), raise_errors=False
+                )
+            return accepted_response(endpoint)
+        # As leituras de um recurso devem refletir as escritas acumuladas
+        flush_writes(session, resource=resource_path(endpoint))
+    return _spooled_connect(endpoint, method, data, headers, timeout)
+
+
+def flush_kernel_writes(endpoint):
+    """Envia imediatamente ao Kernel as escritas do recurso de `endpoint`
+    acumuladas pelos blocos `coalesced_writes` e `spooled_writes` em
+    execução, sem aguardar o final dos blocos."""
+    resource = resource_path(endpoint)
+    session = _COALESCE_SESSION
+    if session is not None:
+        flush_writes(session, resource=resource, raise_errors=False)
+    session = _SPOOL_SESSION
+    if session is not None:
+        drain_spool(session, resource=resource)
+
+
+OBJECT_STORE_INDEX = (
+    UploadIndex(OBJECT_STORE_INDEX_PATH, OBJECT_STORE_INDEX_VERIFY_AFTER)
+    if OBJECT_STORE_INDEX_PATH
+    else None
 )
+
+
+def document_key_layout(filepath):
+    """`{issn}/{scielo_id}/{sha1}{ext}`: os objetos de um mesmo periódico
+    compartilham o prefixo."""
+    return filepath
+
+
+def hash_key_layout(filepath):
+    """`{hash}/{issn}/{scielo_id}/{sha1}{ext}`: distribui os objetos entre
+    16 ** `OBJECT_STORE_KEY_HASH_LENGTH` prefixos, de forma determinística."""
+    shard = hashlib.md5(filepath.encode("utf-8")).hexdigest()
+    return "{}/{}".format(shard[:OBJECT_STORE_KEY_HASH_LENGTH], filepath)
+
+
+def date_key_layout(filepath):
+    """`{aaaa}/{mm}/{dd}/{issn}/{scielo_id}/{sha1}{ext}`: particiona os objetos
+    pela data (UTC) do envio."""
+    return "{}/{}".format(time.strftime("%Y/%m/%d", time.gmtime()), filepath)
+
+
+KEY_LAYOUTS = {
+    "document": document_key_layout,
+    "hash": hash_key_layout,
+    "date": date_key_layout,
+}
+
+if OBJECT_STORE_KEY_LAYOUT not in KEY_LAYOUTS:
+    raise ValueError(
+        "OBJECT_STORE_KEY_LAYOUT must be one of: %s" % ", ".join(sorted(KEY_LAYOUTS))
+    )
+if OBJECT_STORE_KEY_LAYOUT == "date" and OBJECT_STORE_INDEX is None:
+    # Sem o índice, os objetos reenviados em outra data teriam novas URLs
+    raise ValueError(
+        "OBJECT_STORE_KEY_LAYOUT=date requires OBJECT_STORE_INDEX_PATH"
+    )
+
+
+def object_store_key(filepath, layout=None):
+    """Chave sob a qual o objeto de chave canônica `filepath`
+    (`{issn}/{scielo_id}/{sha1}{ext}`) é armazenado, conforme o `layout` ou
+    `OBJECT_STORE_KEY_LAYOUT`."""
+    return KEY_LAYOUTS[layout or OBJECT_STORE_KEY_LAYOUT](filepath)
+
+
+def object_store_exists(bucket_name, filepath):
+    """Indica se o objeto `filepath` existe no bucket."""
+    return ObjectStoreHook(aws_conn_id="aws_default").check_for_key(
+        filepath, bucket_name
+    )
+
+
+class ObjectStoreListings:
+    """Chaves existentes no object store sob os prefixos listados por
+    `list_object_keys`, mantidas para os `maxsize` prefixos mais recentes."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._prefixes = OrderedDict()
+        self._listed = 0
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, bucket_name, prefix, keys):
+        with self._lock:
+            self._prefixes[(bucket_name, prefix)] = set(keys)
+            self._prefixes.move_to_end((bucket_name, prefix))
+            while len(self._prefixes) > self.maxsize:
+                self._prefixes.popitem(last=False)
+            self._listed += 1
+
+    def contains(self, bucket_name, key):
+        prefix = key.rpartition("/")[0] + "/"
+        with self._lock:
+            found = key in self._prefixes.get((bucket_name, prefix), ())
+            if found:
+                self._hits += 1
+            return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefixes": len(self._prefixes),
+                "listed": self._listed,
+                "hits": self._hits,
+            }
+
+
+OBJECT_STORE_LISTINGS = ObjectStoreListings(OBJECT_STORE_LISTINGS_MAXSIZE)
+
+
+@budgeted_retry((requests.ConnectionError, requests.Timeout), attempts=4)
+def object_store_list_keys(bucket_name, prefix):
+    s3_hook = ObjectStoreHook(aws_conn_id="aws_default")
+    started_at = time.perf_counter()
+    with OBJECT_STORE_BREAKER.guard():
+        keys = s3_hook.list_keys(bucket_name, prefix=prefix) or []
+    OBJECT_STORE_METRICS.record(
+        "LIST", "/" + bucket_name, "ok", time.perf_counter() - started_at, 0, 0
+    )
+    return keys
+
+
+def list_object_keys(bucket_name, prefix):
+    """Obtém, em uma única listagem, as chaves existentes sob `prefix`, cujo
+    envio passa a ser dispensado.
+
+    A listagem ocorre somente se `OBJECT_STORE_LIST_PREFIXES` estiver
+    habilitada, com o layout `document`, e o `OBJECT_STORE_INDEX` não
+    conhecer objetos sob o prefixo, devendo portanto ser realizada antes do
+    envio do primeiro objeto do documento (o XML).
+    Falhas são registradas no log e não impedem o envio dos objetos."""
+    if not OBJECT_STORE_LIST_PREFIXES or OBJECT_STORE_KEY_LAYOUT != "document":
+        # Nos demais layouts, os objetos do documento não compartilham o prefixo
+        return
+    if OBJECT_STORE_INDEX is not None and OBJECT_STORE_INDEX.has_prefix(
+        bucket_name, prefix
+    ):
+        return
+    try:
+        keys = object_store_list_keys(bucket_name, prefix)
+    except Exception as exc:
+        Logger.warning("Could not list %s/%s: %s", bucket_name, prefix, exc)
+    else:
+        OBJECT_STORE_LISTINGS.add(bucket_name, prefix, keys)
+
+
+def indexed_object_url(filepath, bucket_name, size=None):
+    """URL do objeto `filepath` caso o `OBJECT_STORE_INDEX` ou a listagem do
+    seu prefixo indiquem que ele já foi enviado ao bucket, dispensando o seu
+    reenvio.
+
+    O índice é consultado pela chave canônica, portanto a URL de um objeto
+    já enviado não é alterada por mudanças de `OBJECT_STORE_KEY_LAYOUT` ou
+    pela data do reenvio."""
+    url = None
+    if OBJECT_STORE_INDEX is not None:
+        url = OBJECT_STORE_INDEX.lookup(
+            bucket_name, filepath, exists=object_store_exists
+        )
+    if url is None and OBJECT_STORE_LISTINGS.contains(bucket_name, filepath):
+        url = index_object(filepath, bucket_name, size)
+    if url is not None:
+        Logger.debug("Skipping upload of %s/%s, already stored", bucket_name, filepath)
+    return url
+
+
+def index_object(filepath, bucket_name, size, key=None):
+    """Registra no `OBJECT_STORE_INDEX` o objeto de chave canônica `filepath`,
+    armazenado sob `key`, e retorna a sua URL."""
+    key = key or filepath
+    url = "{}/{}".format(object_store_base_url(bucket_name), key)
+    if OBJECT_STORE_INDEX is not None:
+        OBJECT_STORE_INDEX.add(bucket_name, filepath, url, size, location=key)
+    return url
+
+
+@contextmanager
+def object_store_put(filepath, bucket_name, size):
+    """Registra em `OBJECT_STORE_METRICS` o envio de `size` bytes para
+    `filepath`, protegido por `OBJECT_STORE_BREAKER`."""
+    started_at = time.perf_counter()
+    status = "ok"
+    try:
+        with OBJECT_STORE_BREAKER.guard():
+            yield
+    except Exception as exc:
+        status = type(exc).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        OBJECT_STORE_METRICS.record("PUT", "/" + bucket_name, status, elapsed, size, 0)
+        Logger.debug(
+            "PUT %s/%s - %d bytes - %s in %.3fs",
+            bucket_name,
+            filepath,
+            size,
+            status,
+            elapsed,
+        )
+
+
+def is_gzip_object(filepath):
+    """Indica se `filepath` deve ser armazenado com `Content-Encoding: gzip`,
+    conforme `OBJECT_STORE_GZIP_EXTENSIONS`. A chave e a URL do objeto não
+    são alteradas; os clientes HTTP o descompactam de forma transparente."""
+    return os.path.splitext(filepath)[1].lower() in OBJECT_STORE_GZIP_EXTENSIONS
+
+
+@budgeted_retry((requests.ConnectionError, requests.Timeout), attempts=4)
 def object_store_connect(bytes_data, filepath, bucket_name):
-    s3_hook = S3Hook(aws_conn_id="aws_default")
-    s3_hook.load_bytes(bytes_data, key=filepath, bucket_name=bucket_name, replace=True)
-    s3_host = s3_hook.get_connection("aws_default").extra_dejson.get("host")
-    return "{}/{}/{}".format(s3_host, bucket_name, filepath)
+    url = indexed_object_url(filepath, bucket_name, len(bytes_data))
+    if url is not None:
+        return url
+    key = object_store_key(filepath)
+    s3_hook = ObjectStoreHook(aws_conn_id="aws_default")
+    if is_gzip_object(filepath):
+        body = gzip.compress(bytes_data)
+        with object_store_put(key, bucket_name, len(body)):
+            s3_hook.get_conn().put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=body,
+                ContentEncoding="gzip",
+                ContentType=mimetypes.guess_type(filepath)[0]
+                or "application/octet-stream",
+            )
+    else:
+        with object_store_put(key, bucket_name, len(bytes_data)):
+            s3_hook.load_bytes(bytes_data, key=key, bucket_name=bucket_name, replace=True)
+    return index_object(filepath, bucket_name, len(bytes_data), key)
+
+
+OBJECT_STORE_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=OBJECT_STORE_MULTIPART_CHUNK_SIZE,
+    multipart_chunksize=OBJECT_STORE_MULTIPART_CHUNK_SIZE,
+    max_concurrency=OBJECT_STORE_MULTIPART_CONCURRENCY,
+)
+
+
+@budgeted_retry((requests.ConnectionError, requests.Timeout), attempts=4)
+def object_store_upload_fileobj(fileobj, filepath, bucket_name, size):
+    """Envia o conteúdo de `fileobj`, com `size` bytes, para `filepath`.
+
+    Arquivos maiores que `OBJECT_STORE_MULTIPART_CHUNK_SIZE` são enviados por
+    meio de multipart upload, em partes desse tamanho transmitidas por até
+    `OBJECT_STORE_MULTIPART_CONCURRENCY` threads, de modo que a memória
+    utilizada não depende do tamanho do arquivo."""
+    url = indexed_object_url(filepath, bucket_name, size)
+    if url is not None:
+        return url
+    key = object_store_key(filepath)
+    client = ObjectStoreHook(aws_conn_id="aws_default").get_conn()
+    # Uma nova tentativa deve reenviar o arquivo desde o início
+    fileobj.seek(0)
+    with object_store_put(key, bucket_name, size):
+        client.upload_fileobj(
+            fileobj, bucket_name, key, Config=OBJECT_STORE_TRANSFER_CONFIG
+        )
+    return index_object(filepath, bucket_name, size, key)
 
 
-@retry(wait=wait_exponential(), stop=stop_after_attempt(10))
+@budgeted_retry(Exception, attempts=10)
 def mongo_connect():
     # TODO: Necessário adicionar um commando para adicionar previamente uma conexão, ver: https://github.com/puckel/docker-airflow/issues/75
-    conn = BaseHook.get_connection("opac_conn")
+    conn = cached_connection("opac_conn")
 
     uri = "mongodb://{creds}{host}{port}/{database}".format(
         creds="{}:{}@".format(conn.login, conn.password) if conn.login else "",
@@ -0,0 +1,82 @@
+"""Codificação e decodificação de JSON com a implementação mais rápida
+disponível no ambiente.
+
+A implementação é escolhida na importação do módulo, na ordem de `CODECS`
+(orjson, rapidjson, ujson e, por fim, o módulo `json` da biblioteca
+padrão). A variável de ambiente `JSON_CODEC` força o uso de uma delas.
+
+- `loads` aceita `str` ou `bytes`;
+- `dumps` retorna `str`, para gravação em arquivos;
+- `dumpb` retorna `bytes` codificados em UTF-8, para corpos de requisições.
+"""
+import os
+import json
+import logging
+from collections import namedtuple, OrderedDict
+
+
+Logger = logging.getLogger(__name__)
+
+Codec = namedtuple("Codec", "name loads dumps dumpb")
+
+CODECS = OrderedDict()
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    CODECS["orjson"] = Codec(
+        "orjson",
+        orjson.loads,
+        lambda obj: orjson.dumps(obj).decode("utf-8"),
+        orjson.dumps,
+    )
+
+try:
+    import rapidjson
+except ImportError:
+    pass
+else:
+    CODECS["rapidjson"] = Codec(
+        "rapidjson",
+        rapidjson.loads,
+        rapidjson.dumps,
+        lambda obj: rapidjson.dumps(obj).encode("utf-8"),
+    )
+
+try:
+    import ujson
+except ImportError:
+    pass
+else:
+    CODECS["ujson"] = Codec(
+        "ujson",
+        ujson.loads,
+        lambda obj: ujson.dumps(obj, escape_forward_slashes=False),
+        lambda obj: ujson.dumps(obj, escape_forward_slashes=False).encode("utf-8"),
+    )
+
+CODECS["json"] = Codec(
+    "json", json.loads, json.dumps, lambda obj: json.dumps(obj).encode("utf-8")
+)
+
+
+def select_codec(name=None):
+    """Retorna a implementação `name` ou, se omitida ou indisponível, a mais
+    rápida das disponíveis."""
+    if name and name not in CODECS:
+        Logger.warning("JSON codec %s is not available, using the fastest one", name)
+    return CODECS.get(name) or next(iter(CODECS.values()))
+
+
+CODEC = select_codec(os.environ.get("JSON_CODEC"))
+
+loads = CODEC.loads
+dumps = CODEC.dumps
+dumpb = CODEC.dumpb
+
+
+def response_json(response):
+    """Decodifica o corpo JSON de uma resposta HTTP (`requests.Response`)."""
+    return loads(response.content)
@@ -0,0 +1,349 @@
+"""Spool em disco das escritas (PUT, PATCH e DELETE) enviadas ao Kernel.
+
+As escritas são registradas em um log somente de acréscimo (`writes.log`)
+e o resultado do envio de cada uma delas em um índice (`writes.idx`). As
+escritas que não constam no índice continuam pendentes, inclusive após a
+interrupção do processo, e podem ser reenviadas por meio de:
+
+    python -m common.spool status --path /caminho/do/spool
+    python -m common.spool replay --path /caminho/do/spool
+"""
+import os
+import json
+import fcntl
+import logging
+import argparse
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from common import json_codec
+
+
+Logger = logging.getLogger(__name__)
+
+LOG_FILENAME = "writes.log"
+INDEX_FILENAME = "writes.idx"
+SEQ_FILENAME = "writes.seq"
+LOCK_FILENAME = "writes.lock"
+
+
+def resource_path(endpoint):
+    """Caminho do recurso principal do Kernel ao qual `endpoint` se refere.
+
+    >>> resource_path("/documents/S0034-89102014000200001/renditions")
+    '/documents/S0034-89102014000200001'
+    """
+    return "/".join(urlsplit(endpoint).path.split("/")[:3])
+
+
+def is_rejected(exc):
+    """Indica se o Kernel recusou a escrita de forma definitiva (4xx), caso
+    em que reenviá-la não alteraria o resultado."""
+    response = getattr(exc, "response", None)
+    return (
+        isinstance(exc, requests.HTTPError)
+        and response is not None
+        and response.status_code < 500
+        and response.status_code != 429
+    )
+
+
+def owner_is_alive(owner):
+    """Indica se o processo identificado por `owner` (`{pid}:{token}`)
+    ainda está em execução."""
+    try:
+        pid = int(str(owner).split(":")[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WriteSpool:
+    """Fila durável de escritas destinadas ao Kernel.
+
+    As escritas de um mesmo recurso (ex.: `/documents/{id}` e
+    `/documents/{id}/renditions`) são enviadas na ordem em que foram
+    registradas; recursos distintos são enviados em paralelo por `drain`.
+
+    O mesmo diretório pode ser compartilhado pelos processos de uma mesma
+    máquina. O acesso aos arquivos é serializado por um lock (`fcntl.flock`)
+    em `writes.lock`, e o estado das escritas é sempre lido do disco. Cada
+    escrita pertence ao processo que a registrou ou que a reivindicou por
+    último no índice. Um processo envia somente as suas escritas e as dos
+    processos encerrados, e nunca antes das escritas anteriores do mesmo
+    recurso que pertençam a outro processo.
+
+    O diretório é acessado somente no primeiro uso.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.log_path = os.path.join(path, LOG_FILENAME)
+        self.index_path = os.path.join(path, INDEX_FILENAME)
+        self.seq_path = os.path.join(path, SEQ_FILENAME)
+        self.lock_path = os.path.join(path, LOCK_FILENAME)
+        self.owner = "%d:%s" % (os.getpid(), uuid.uuid4().hex)
+        self._enqueued = 0
+        self._sent = 0
+        self._rejected = 0
+        self._failed = 0
+        self._lock = threading.Lock()
+
+    def _read_lines(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json_codec.loads(line))
+            except ValueError:
+                # Linha incompleta, gravada durante a interrupção do processo
+                Logger.warning("Ignoring corrupted spool record: %r", line)
+        return records
+
+    @contextmanager
+    def _locked(self):
+        """Acesso exclusivo aos arquivos do spool entre os processos."""
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.lock_path, "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _pending_on_disk(self):
+        """Escritas pendentes, na ordem de registro, com o seu dono atual;
+        requer `_locked`."""
+        status = {}
+        for record in self._read_lines(self.index_path):
+            status[record["seq"]] = record
+        pending = []
+        for entry in self._read_lines(self.log_path):
+            record = status.get(entry["seq"], {})
+            if record.get("status") in ("sent", "rejected"):
+                continue
+            entry = dict(entry)
+            if record.get("status") == "claimed":
+                entry["owner"] = record["owner"]
+            pending.append(entry)
+        return pending
+
+    def _drainable(self, entry):
+        owner = entry.get("owner")
+        return owner == self.owner or not owner_is_alive(owner)
+
+    def _reserve_seq(self):
+        """Reserva o próximo número de sequência; requer `_locked`."""
+        try:
+            with open(self.seq_path, encoding="utf-8") as f:
+                last_seq = int(f.read())
+        except (FileNotFoundError, ValueError):
+            # Spools criados antes de `writes.seq`
+            last_seq = max(
+                (entry["seq"] for entry in self._read_lines(self.log_path)),
+                default=0,
+            )
+        seq = last_seq + 1
+        tmp_path = "%s.%d" % (self.seq_path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(seq))
+        os.replace(tmp_path, self.seq_path)
+        return seq
+
+    def _append(self, path, record):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json_codec.dumps(record) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def enqueue(self, method, endpoint, data=None, headers=None, timeout=1):
+        """Registra a escrita no log e retorna o seu número de sequência."""
+        with self._locked():
+            entry = {
+                "seq": self._reserve_seq(),
+                "owner": self.owner,
+                "method": method,
+                "endpoint": endpoint,
+                "data": data,
+                "headers": headers,
+                "timeout": timeout,
+                "enqueued_at": time.time(),
+            }
+            self._append(self.log_path, entry)
+            self._enqueued += 1
+        Logger.debug("Spooled %s %s (seq %d)", method, endpoint, entry["seq"])
+        return entry["seq"]
+
+    def _done(self, entry, status):
+        with self._locked():
+            self._append(self.index_path, {"seq": entry["seq"], "status": status})
+            if status == "sent":
+                self._sent += 1
+            else:
+                self._rejected += 1
+
+    def pending(self, resource=None, own=False):
+        """Escritas pendentes, na ordem de registro, opcionalmente somente as
+        do recurso `resource` ou, com `own`, somente as que este processo
+        pode enviar."""
+        with self._locked():
+            entries = self._pending_on_disk()
+        return [
+            entry
+            for entry in entries
+            if (resource is None or resource_path(entry["endpoint"]) == resource)
+            and (not own or self._drainable(entry))
+        ]
+
+    def _claim(self, resource=None):
+        """Reivindica as escritas que este processo pode enviar, agrupadas
+        por recurso. As escritas de um recurso são reivindicadas até a
+        primeira que pertença a outro processo em execução."""
+        by_resource = OrderedDict()
+        blocked = set()
+        with self._locked():
+            for entry in self._pending_on_disk():
+                path = resource_path(entry["endpoint"])
+                if path in blocked or (resource is not None and path != resource):
+                    continue
+                if not self._drainable(entry):
+                    # As escritas seguintes do recurso dependem desta
+                    blocked.add(path)
+                    continue
+                if entry.get("owner") != self.owner:
+                    self._append(
+                        self.index_path,
+                        {"seq": entry["seq"], "status": "claimed", "owner": self.owner},
+                    )
+                by_resource.setdefault(path, []).append(entry)
+        return by_resource
+
+    def _drain_resource(self, entries, send):
+        rejected = []
+        for entry in entries:
+            try:
+                send(entry)
+            except Exception as exc:
+                if not is_rejected(exc):
+                    Logger.warning(
+                        "Could not send spooled %s %s, keeping it in the spool: %s",
+                        entry["method"],
+                        entry["endpoint"],
+                        exc,
+                    )
+                    with self._lock:
+                        self._failed += 1
+                    # As próximas escritas do recurso dependem desta
+                    break
+                Logger.error(
+                    "Kernel rejected spooled %s %s: %s",
+                    entry["method"],
+                    entry["endpoint"],
+                    exc,
+                )
+                self._done(entry, "rejected")
+                rejected.append(entry)
+            else:
+                self._done(entry, "sent")
+        return rejected
+
+    def drain(self, send, workers=1, resource=None):
+        """Envia as escritas pendentes que este processo pode enviar por meio
+        de `send(entry)`.
+
+        Cada recurso é enviado por um dos `workers`, em ordem. O envio de um
+        recurso é interrompido na primeira falha transitória, mantendo no
+        spool esta escrita e as seguintes. As escritas recusadas pelo Kernel
+        são removidas do spool e retornadas.
+        """
+        by_resource = self._claim(resource)
+        if not by_resource:
+            return []
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(
+                executor.map(
+                    lambda entries: self._drain_resource(entries, send),
+                    by_resource.values(),
+                )
+            )
+
+        if resource is None:
+            self.compact()
+        return [entry for rejected in results for entry in rejected]
+
+    def compact(self):
+        """Esvazia o log e o índice caso não existam escritas pendentes,
+        inclusive as registradas por outros processos."""
+        with self._locked():
+            if self._pending_on_disk():
+                return False
+            for path in (self.log_path, self.index_path):
+                open(path, "w").close()
+            return True
+
+    def stats(self):
+        pending = self.pending()
+        oldest = pending[0] if pending else None
+        with self._lock:
+            return {
+                "depth": len(pending),
+                "resources": len({resource_path(e["endpoint"]) for e in pending}),
+                "oldest_age": time.time() - oldest["enqueued_at"] if oldest else 0,
+                "enqueued": self._enqueued,
+                "sent": self._sent,
+                "rejected": self._rejected,
+                "failed": self._failed,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Inspeciona e reenvia as escritas pendentes do spool do Kernel."
+    )
+    parser.add_argument("command", choices=["status", "list", "replay"])
+    parser.add_argument("--path", default=os.environ.get("KERNEL_SPOOL_DIR"))
+    parser.add_argument("--drainers", type=int, default=1)
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error("the spool path must be given by --path or KERNEL_SPOOL_DIR")
+
+    spool = WriteSpool(args.path)
+    if args.command == "list":
+        for entry in spool.pending():
+            print(entry["seq"], entry["method"], entry["endpoint"])
+    elif args.command == "replay":
+        from common import hooks
+
+        rejected = spool.drain(hooks.send_spooled_write, workers=args.drainers)
+        for entry in rejected:
+            print("rejected", entry["seq"], entry["method"], entry["endpoint"])
+    print(json.dumps(spool.stats(), indent=2))
+    return 1 if spool.pending() else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
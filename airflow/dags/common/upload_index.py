@@ -0,0 +1,202 @@
+"""Índice local, persistente em SQLite, dos objetos já enviados ao object store.
+
+As chaves dos objetos são derivadas do SHA-1 do seu conteúdo
+(`{issn}/{scielo_id}/{sha1}{ext}`), portanto uma chave presente no índice
+dispensa o reenvio do objeto. Opcionalmente, as entradas verificadas há mais
+de `verify_after` segundos são confrontadas com o bucket antes de serem
+utilizadas. O índice pode ser inspecionado e verificado por meio de:
+
+    python -m common.upload_index status --path /caminho/do/indice.sqlite
+    python -m common.upload_index verify --path /caminho/do/indice.sqlite
+"""
+import os
+import json
+import logging
+import argparse
+import sqlite3
+import threading
+import time
+
+
+Logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    size INTEGER,
+    stored_at REAL NOT NULL,
+    verified_at REAL NOT NULL,
+    location TEXT,
+    PRIMARY KEY (bucket, key)
+)
+"""
+
+
+class UploadIndex:
+    """Mapeamento persistente de `(bucket, chave)` para a URL do objeto.
+
+    A chave é a chave canônica do objeto; `location` é a chave sob a qual
+    ele foi de fato armazenado, conforme o layout de chaves em uso no envio.
+
+    A mesma conexão SQLite é compartilhada pelas threads do processo; o modo
+    WAL permite que processos distintos utilizem o mesmo arquivo.
+    """
+
+    def __init__(self, path, verify_after=0, clock=time.time):
+        self.path = path
+        self.verify_after = verify_after
+        self.clock = clock
+        self._hits = 0
+        self._misses = 0
+        self._stored = 0
+        self._verified = 0
+        self._stale = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(objects)")]
+            if "location" not in columns:
+                # Índices criados antes da adoção dos layouts de chaves
+                self._conn.execute("ALTER TABLE objects ADD COLUMN location TEXT")
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def lookup(self, bucket_name, key, exists=None):
+        """URL do objeto `key` caso conste no índice ou `None`.
+
+        Caso a entrada tenha sido verificada há mais de `verify_after`
+        segundos, `exists(bucket_name, location)` confirma a presença do objeto
+        no bucket; os objetos ausentes são removidos do índice.
+        """
+        rows = self._execute(
+            "SELECT url, verified_at, COALESCE(location, key) FROM objects"
+            " WHERE bucket = ? AND key = ?",
+            (bucket_name, key),
+        )
+        if not rows:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        url, verified_at, location = rows[0]
+        now = self.clock()
+        if exists is not None and self.verify_after and (
+            now - verified_at > self.verify_after
+        ):
+            if not exists(bucket_name, location):
+                Logger.info("Object %s/%s is missing from the bucket", bucket_name, key)
+                self.discard(bucket_name, key)
+                with self._lock:
+                    self._stale += 1
+                    self._misses += 1
+                return None
+            self._execute(
+                "UPDATE objects SET verified_at = ? WHERE bucket = ? AND key = ?",
+                (now, bucket_name, key),
+            )
+            with self._lock:
+                self._verified += 1
+        with self._lock:
+            self._hits += 1
+        return url
+
+    def has_prefix(self, bucket_name, prefix):
+        """Indica se o índice conhece algum objeto cuja chave inicia com
+        `prefix`."""
+        return bool(
+            self._execute(
+                "SELECT 1 FROM objects WHERE bucket = ? AND key >= ? AND key < ?"
+                " LIMIT 1",
+                (bucket_name, prefix, prefix + "\uffff"),
+            )
+        )
+
+    def add(self, bucket_name, key, url, size=None, location=None):
+        """Registra no índice o objeto `key` enviado ao bucket e armazenado
+        sob `location` (por padrão, a própria chave)."""
+        now = self.clock()
+        self._execute(
+            "INSERT OR REPLACE INTO objects"
+            " (bucket, key, url, size, stored_at, verified_at, location)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (bucket_name, key, url, size, now, now, location),
+        )
+        with self._lock:
+            self._stored += 1
+
+    def discard(self, bucket_name, key):
+        self._execute(
+            "DELETE FROM objects WHERE bucket = ? AND key = ?", (bucket_name, key)
+        )
+
+    def entries(self):
+        """Pares `(bucket, chave)` registrados no índice."""
+        return self._execute("SELECT bucket, key FROM objects ORDER BY bucket, key")
+
+    def verify(self, exists):
+        """Remove do índice os objetos ausentes do bucket e retorna as suas
+        chaves."""
+        missing = []
+        for bucket_name, key, location in self._execute(
+            "SELECT bucket, key, COALESCE(location, key) FROM objects"
+            " ORDER BY bucket, key"
+        ):
+            if exists(bucket_name, location):
+                self._execute(
+                    "UPDATE objects SET verified_at = ? WHERE bucket = ? AND key = ?",
+                    (self.clock(), bucket_name, key),
+                )
+            else:
+                self.discard(bucket_name, key)
+                missing.append((bucket_name, key))
+        return missing
+
+    def stats(self):
+        (size,) = self._execute("SELECT COUNT(*) FROM objects")[0]
+        with self._lock:
+            return {
+                "size": size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stored": self._stored,
+                "verified": self._verified,
+                "stale": self._stale,
+            }
+
+    def close(self):
+        self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Inspeciona e verifica o índice dos objetos enviados ao object store."
+    )
+    parser.add_argument("command", choices=["status", "verify"])
+    parser.add_argument("--path", default=os.environ.get("OBJECT_STORE_INDEX_PATH"))
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error(
+            "the index path must be given by --path or OBJECT_STORE_INDEX_PATH"
+        )
+
+    index = UploadIndex(args.path)
+    if args.command == "verify":
+        from common import hooks
+
+        for bucket_name, key in index.verify(hooks.object_store_exists):
+            print("missing", bucket_name, key)
+    print(json.dumps(index.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,12 @@
 import os
 import logging
 import hashlib
+import tempfile
+import functools
+import itertools
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import requests
 from lxml import etree
@@ -126,18 +132,18 @@ def files_sha1(file):
     return _sum.hexdigest()
 
 
+def object_store_filepath(sha1, journal, scielo_id, filename):
+    _, file_extension = os.path.splitext(filename)
+    return "{}/{}/{}".format(journal, scielo_id, "{}{}".format(sha1, file_extension))
+
+
 def put_object_in_object_store(file, journal, scielo_id, filename):
     """
     - Persistir no Minio
     - Adicionar em dict a URL do Minio
     """
 
-    n_filename = files_sha1(file)
-    _, file_extension = os.path.splitext(filename)
-
-    filepath = "{}/{}/{}".format(
-        journal, scielo_id, "{}{}".format(n_filename, file_extension)
-    )
+    filepath = object_store_filepath(files_sha1(file), journal, scielo_id, filename)
     try:
         return hooks.object_store_connect(file, filepath, "documentstore")
     except Exception as exc:
@@ -146,69 +152,242 @@ def put_object_in_object_store(file, journal, scielo_id, filename):
         ) from None
 
 
-def put_assets_and_pdfs_in_object_store(zipfile, xml_data):
+def put_zip_member_in_object_store(zipfile, member, journal, scielo_id):
     """
-    - Ler XML
-        - Obter dados do XML
-        - Persistir cada ativo digital
-        - Persistir cada PDF
-        - Persistir XML no Minio
-    - Retornar os dados do documento para persistir no Kernel
-    - Raise PutXMLInObjectStoreException
+    Persiste no Minio o arquivo `member` de `zipfile` sem carregá-lo
+    inteiramente em memória: o arquivo é descompactado em blocos, que
+    alimentam o SHA-1 e um arquivo temporário mantido em memória até
+    `OBJECT_STORE_SPOOL_MAX_SIZE` bytes, e enviado por meio de multipart upload.
+
+    Retorna a URL do objeto e o tamanho do arquivo.
     """
-    _assets = []
-    for asset in (xml_data or {}).get("assets", []):
-        Logger.info('Putting Asset file "%s" to Object Store', asset["asset_id"])
+    _sum = hashlib.sha1()
+    size = 0
+    with zipfile.open(member) as source, tempfile.SpooledTemporaryFile(
+        max_size=hooks.OBJECT_STORE_SPOOL_MAX_SIZE
+    ) as buffer:
+        for chunk in iter(lambda: source.read(hooks.KERNEL_STREAM_CHUNK_SIZE), b""):
+            _sum.update(chunk)
+            buffer.write(chunk)
+            size += len(chunk)
+        buffer.seek(0)
+
+        filepath = object_store_filepath(_sum.hexdigest(), journal, scielo_id, member)
         try:
-            asset_file = zipfile.read(asset["asset_id"])
-        except KeyError as exc:
-            Logger.info(
-                'Could not read asset "%s" from zipfile "%s": %s',
-                asset["asset_id"],
-                zipfile,
-                str(exc),
+            url = hooks.object_store_upload_fileobj(
+                buffer, filepath, "documentstore", size
+            )
+        except Exception as exc:
+            raise ObjectStoreError(
+                'Could not put object "{}" in object store : {}'.format(
+                    filepath, str(exc)
+                )
+            ) from None
+    return url, size
+
+
+def is_large_zip_member(zipfile, member):
+    """Indica se `member` deve ser enviado por meio de
+    `put_zip_member_in_object_store`, por ter ao menos
+    `OBJECT_STORE_STREAM_THRESHOLD` bytes."""
+    threshold = hooks.OBJECT_STORE_STREAM_THRESHOLD
+    return bool(threshold) and zipfile.getinfo(member).file_size >= threshold
+
+
+def put_asset_in_object_store(zipfile, xml_data, asset):
+    """
+    Persiste no Minio o ativo digital `asset` de `zipfile` e retorna os seus
+    dados para o Kernel ou `None`, caso o arquivo não exista em `zipfile`.
+    """
+    Logger.info('Putting Asset file "%s" to Object Store', asset["asset_id"])
+    try:
+        if is_large_zip_member(zipfile, asset["asset_id"]):
+            asset_url, _ = put_zip_member_in_object_store(
+                zipfile, asset["asset_id"], xml_data["issn"], xml_data["scielo_id"]
             )
         else:
-            _assets.append(
-                {
-                    "asset_id": asset["asset_id"],
-                    "asset_url": put_object_in_object_store(
-                        asset_file,
-                        xml_data["issn"],
-                        xml_data["scielo_id"],
-                        asset["asset_id"],
-                    ),
-                }
+            asset_url = put_object_in_object_store(
+                zipfile.read(asset["asset_id"]),
+                xml_data["issn"],
+                xml_data["scielo_id"],
+                asset["asset_id"],
             )
-    _pdfs = []
-    for pdf in (xml_data or {}).get("pdfs", []):
-        Logger.info('Putting PDF file "%s" to Object Store', pdf["filename"])
-        try:
-            pdf_file = zipfile.read(pdf["filename"])
-        except KeyError as exc:
-            Logger.info(
-                'Could not read PDF "%s" from zipfile "%s": %s',
-                pdf["filename"],
-                zipfile,
-                str(exc),
+    except KeyError as exc:
+        Logger.info(
+            'Could not read asset "%s" from zipfile "%s": %s',
+            asset["asset_id"],
+            zipfile,
+            str(exc),
+        )
+    else:
+        return {"asset_id": asset["asset_id"], "asset_url": asset_url}
+
+
+def put_pdf_in_object_store(zipfile, xml_data, pdf):
+    """
+    Persiste no Minio o PDF `pdf` de `zipfile` e retorna os seus dados para o
+    Kernel ou `None`, caso o arquivo não exista em `zipfile`.
+    """
+    Logger.info('Putting PDF file "%s" to Object Store', pdf["filename"])
+    try:
+        if is_large_zip_member(zipfile, pdf["filename"]):
+            data_url, size_bytes = put_zip_member_in_object_store(
+                zipfile, pdf["filename"], xml_data["issn"], xml_data["scielo_id"]
             )
         else:
-            _pdfs.append(
-                {
-                    "size_bytes": len(pdf_file),
-                    "filename": pdf["filename"],
-                    "lang": pdf["lang"],
-                    "mimetype": pdf["mimetype"],
-                    "data_url": put_object_in_object_store(
-                        pdf_file,
-                        xml_data["issn"],
-                        xml_data["scielo_id"],
-                        pdf["filename"],
-                    ),
-                }
+            pdf_file = zipfile.read(pdf["filename"])
+            size_bytes = len(pdf_file)
+            data_url = put_object_in_object_store(
+                pdf_file, xml_data["issn"], xml_data["scielo_id"], pdf["filename"]
             )
+    except KeyError as exc:
+        Logger.info(
+            'Could not read PDF "%s" from zipfile "%s": %s',
+            pdf["filename"],
+            zipfile,
+            str(exc),
+        )
+    else:
+        return {
+            "size_bytes": size_bytes,
+            "filename": pdf["filename"],
+            "lang": pdf["lang"],
+            "mimetype": pdf["mimetype"],
+            "data_url": data_url,
+        }
+
+
+def run_uploads(uploads, workers=1):
+    """
+    Executa as funções `uploads`, por meio de até `workers` threads, e
+    retorna os seus resultados na ordem de `uploads`.
+
+    A descompactação, o cálculo do SHA-1 e o envio liberam o GIL, portanto
+    os envios de arquivos distintos se sobrepõem.
+    """
+    if workers <= 1 or len(uploads) <= 1:
+        return [upload() for upload in uploads]
+    with ThreadPoolExecutor(max_workers=min(workers, len(uploads))) as executor:
+        futures = [executor.submit(upload) for upload in uploads]
+        return [future.result() for future in futures]
+
+
+LANE_XML, LANE_FIGURE, LANE_PDF, LANE_MEDIA = range(4)
+FIGURE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".tif", ".tiff", ".svg", ".webp")
+
+
+class UploadPipeline:
+    """
+    Fila de envios ao Minio compartilhada por todos os documentos de um
+    pacote, executada por `workers` threads.
+
+    Os envios são executados por ordem de prioridade (`lane`): XMLs, figuras,
+    PDFs e, por fim, os demais ativos digitais, como vídeos; envios de mesma
+    prioridade são executados na ordem em que foram submetidos. `submit`
+    bloqueia enquanto houver `max_pending` envios não concluídos, limitando
+    a memória ocupada pelos arquivos lidos do pacote.
+    """
 
-    return {"assets": _assets, "pdfs": _pdfs}
+    def __init__(self, workers, max_pending):
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._slots = threading.BoundedSemaphore(max(workers, max_pending))
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            _, _, upload, future = self._queue.get()
+            if upload is None:
+                return
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(upload())
+                except BaseException as exc:
+                    future.set_exception(exc)
+            self._slots.release()
+
+    def submit(self, upload, lane=LANE_XML):
+        self._slots.acquire()
+        future = Future()
+        self._queue.put((lane, next(self._sequence), upload, future))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Os envios pendentes são concluídos antes do encerramento das threads
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._sequence), None, None))
+        for thread in self._threads:
+            thread.join()
+
+
+def upload_lane(filename):
+    """Prioridade do envio do arquivo `filename` em `UploadPipeline`."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".xml":
+        return LANE_XML
+    if extension == ".pdf":
+        return LANE_PDF
+    if extension in FIGURE_EXTENSIONS:
+        return LANE_FIGURE
+    return LANE_MEDIA
+
+
+def document_upload_lanes(xml_data):
+    """Prioridades dos envios de `document_uploads`, na mesma ordem."""
+    return [
+        upload_lane(asset["asset_id"]) for asset in (xml_data or {}).get("assets", [])
+    ] + [LANE_PDF for _ in (xml_data or {}).get("pdfs", [])]
+
+
+def document_uploads(zipfile, xml_data):
+    """
+    Funções que persistem no Minio cada ativo digital e cada PDF do
+    documento, cujos resultados são reunidos por `assets_and_pdfs_data`.
+    """
+    return [
+        functools.partial(put_asset_in_object_store, zipfile, xml_data, asset)
+        for asset in (xml_data or {}).get("assets", [])
+    ] + [
+        functools.partial(put_pdf_in_object_store, zipfile, xml_data, pdf)
+        for pdf in (xml_data or {}).get("pdfs", [])
+    ]
+
+
+def assets_and_pdfs_data(xml_data, results):
+    """
+    Dados dos ativos digitais e PDFs persistidos no Minio, a partir dos
+    resultados, na mesma ordem, das funções de `document_uploads`.
+    """
+    n_assets = len((xml_data or {}).get("assets", []))
+    return {
+        "assets": [result for result in results[:n_assets] if result is not None],
+        "pdfs": [result for result in results[n_assets:] if result is not None],
+    }
+
+
+def put_assets_and_pdfs_in_object_store(zipfile, xml_data):
+    """
+    - Ler XML
+        - Obter dados do XML
+        - Persistir cada ativo digital
+        - Persistir cada PDF
+        - Persistir XML no Minio
+    - Retornar os dados do documento para persistir no Kernel
+    - Raise PutXMLInObjectStoreException
+
+    Os arquivos são enviados por até `OBJECT_STORE_UPLOAD_WORKERS` threads.
+    """
+    results = run_uploads(
+        document_uploads(zipfile, xml_data), hooks.OBJECT_STORE_UPLOAD_WORKERS
+    )
+    return assets_and_pdfs_data(xml_data, results)
 
 
 def put_xml_into_object_store(zipfile, xml_filename):
@@ -221,6 +400,11 @@ def put_xml_into_object_store(zipfile, xml_filename):
             )
         ) from None
     xml_data = get_xml_data(xml_file, os.path.splitext(xml_filename)[-2])
+    # Listagem dos objetos já existentes do documento, antes que o envio do
+    # XML o torne conhecido pelo índice
+    hooks.list_object_keys(
+        "documentstore", "{}/{}/".format(xml_data["issn"], xml_data["scielo_id"])
+    )
     Logger.info('Putting XML file "%s" to Object Store', xml_filename)
     xml_data["xml_url"] = put_object_in_object_store(
         xml_file, xml_data["issn"], xml_data["scielo_id"], xml_filename
@@ -1,10 +1,21 @@
 import os
 import logging
-import json
+import functools
+from collections import deque
+from types import SimpleNamespace
+from concurrent.futures import wait, FIRST_COMPLETED
 from zipfile import ZipFile
 from copy import deepcopy
 
-from common.hooks import kernel_connect
+from common import json_codec
+from common.hooks import (
+    kernel_connect,
+    flush_kernel_writes,
+    spooled_writes,
+    OBJECT_STORE_PACKAGE_WORKERS,
+    OBJECT_STORE_PACKAGE_QUEUE_SIZE,
+    OBJECT_STORE_DEFER_MEDIA,
+)
 import requests
 from deepdiff import DeepDiff
 
@@ -22,6 +33,11 @@ from operations.docs_utils import (
     register_update_doc_into_kernel,
     put_assets_and_pdfs_in_object_store,
     put_xml_into_object_store,
+    document_uploads,
+    document_upload_lanes,
+    assets_and_pdfs_data,
+    UploadPipeline,
+    LANE_MEDIA,
     issue_id,
     register_document_to_documentsbundle,
 )
@@ -96,15 +112,122 @@ def delete_documents(sps_package, xmls_filenames):
     return list(set(xmls_filenames) - set(xmls_to_delete))
 
 
-def register_update_documents(sps_package, xmls_to_preserve):
+def register_update_document(xml_filename, xml_data, assets_and_pdfs_data):
     """
-    Registra/atualiza documentos informados e seus respectivos ativos digitais e
-    renditions no Minio e no Kernel.
-     list docs_to_preserve: lista de XMLs para manter no Kernel (Registrar ou atualizar)
+    Registra/atualiza no Kernel o documento cujos arquivos foram persistidos
+    no Minio. Retorna `True` caso o registro tenha sido realizado.
     """
-    Logger.debug("register_update_documents IN")
-    with ZipFile(sps_package) as zipfile:
-        synchronized_docs_metadata = []
+    _document_metadata = deepcopy(xml_data)
+    _document_metadata.update(assets_and_pdfs_data)
+    try:
+        register_update_doc_into_kernel(_document_metadata)
+
+    except RegisterUpdateDocIntoKernelException as exc:
+        Logger.info(
+            'Could not register or update document "%s" in Kernel: %s',
+            xml_filename,
+            str(exc),
+        )
+        return False
+    return True
+
+
+def register_update_documents_pipeline(
+    zipfile, sps_package, xmls_to_preserve, workers, max_pending, defer_media=False
+):
+    """
+    Registra/atualiza os documentos por meio de uma única fila de envios ao
+    Minio, compartilhada por todos os arquivos do pacote e executada por
+    `workers` threads. Cada documento é registrado no Kernel assim que os
+    seus arquivos são persistidos, enquanto os envios dos demais prosseguem.
+
+    Com `defer_media`, o documento é registrado, e enviado imediatamente ao
+    Kernel, assim que o XML, as figuras e os PDFs são persistidos; os demais
+    ativos digitais (ex.: vídeos) são adicionados ao documento por meio de um
+    novo registro, que inclui novamente as renditions.
+
+    Retorna os metadados dos documentos registrados, na ordem de
+    `xmls_to_preserve`.
+    """
+    synchronized_docs_metadata = {}
+    xml_uploads = deque()
+    documents = []
+
+    def pending(document):
+        # Até o registro antecipado, somente os envios prioritários importam
+        return [
+            future
+            for future, lane in zip(document.futures, document.lanes)
+            if not future.done()
+            and (document.stage != "critical" or lane < LANE_MEDIA)
+        ]
+
+    def process(document):
+        """Avança o documento cujos envios aguardados foram concluídos e indica
+        se ele foi finalizado."""
+        done = [future.done() for future in document.futures]
+        data = assets_and_pdfs_data(
+            document.xml_data,
+            [
+                future.result() if is_done else None
+                for future, is_done in zip(document.futures, done)
+            ],
+        )
+        if document.stage == "backfill":
+            register_update_document(document.xml_filename, document.xml_data, data)
+            return True
+        registered = register_update_document(
+            document.xml_filename, document.xml_data, data
+        )
+        if registered:
+            synchronized_docs_metadata[document.index] = document.xml_data
+            if not all(done):
+                # Registro antecipado, sem os ativos digitais adiados
+                flush_kernel_writes(
+                    "/documents/{}".format(document.xml_data["scielo_id"])
+                )
+                document.stage = "backfill"
+                return not pending(document) and process(document)
+        return True
+
+    with UploadPipeline(workers, max_pending) as pipeline:
+
+        def advance(block=False):
+            # Enfileira os ativos digitais e PDFs dos XMLs já persistidos
+            while xml_uploads and (block or xml_uploads[0][2].done()):
+                i, xml_filename, future = xml_uploads.popleft()
+                try:
+                    xml_data = future.result()
+                except PutXMLInObjectStoreException as exc:
+                    Logger.info(
+                        'Could not put document "%s" in object store: %s',
+                        xml_filename,
+                        str(exc),
+                    )
+                    continue
+                lanes = document_upload_lanes(xml_data)
+                documents.append(
+                    SimpleNamespace(
+                        index=i,
+                        xml_filename=xml_filename,
+                        xml_data=xml_data,
+                        lanes=lanes,
+                        futures=[
+                            pipeline.submit(upload, lane)
+                            for upload, lane in zip(
+                                document_uploads(zipfile, xml_data), lanes
+                            )
+                        ],
+                        stage="critical" if defer_media else "complete",
+                    )
+                )
+
+            # Registra no Kernel os documentos com os arquivos aguardados
+            # persistidos
+            for document in list(documents):
+                if not pending(document) and process(document):
+                    documents.remove(document)
+
         for i, xml_filename in enumerate(xmls_to_preserve):
             Logger.info(
                 'Reading XML file "%s" from ZIP file "%s" [%s/%s]',
@@ -113,29 +236,89 @@ def register_update_documents(sps_package, xmls_to_preserve):
                 i,
                 len(xmls_to_preserve),
             )
-            try:
-                xml_data = put_xml_into_object_store(zipfile, xml_filename)
-            except PutXMLInObjectStoreException as exc:
+            xml_uploads.append(
+                (
+                    i,
+                    xml_filename,
+                    pipeline.submit(
+                        functools.partial(
+                            put_xml_into_object_store, zipfile, xml_filename
+                        )
+                    ),
+                )
+            )
+            advance()
+
+        advance(block=True)
+        while documents:
+            wait(
+                [future for document in documents for future in pending(document)],
+                return_when=FIRST_COMPLETED,
+            )
+            advance()
+
+    return [
+        synchronized_docs_metadata[i] for i in sorted(synchronized_docs_metadata)
+    ]
+
+
+def register_update_documents(sps_package, xmls_to_preserve):
+    """
+    Registra/atualiza documentos informados e seus respectivos ativos digitais e
+    renditions no Minio e no Kernel.
+     list docs_to_preserve: lista de XMLs para manter no Kernel (Registrar ou atualizar)
+
+    Com `OBJECT_STORE_PACKAGE_WORKERS` maior que 1, os arquivos de todos os
+    documentos são enviados por `register_update_documents_pipeline`, que
+    adia os ativos digitais maiores caso `OBJECT_STORE_DEFER_MEDIA` esteja
+    habilitada.
+    """
+    Logger.debug("register_update_documents IN")
+    with ZipFile(sps_package) as zipfile, spooled_writes() as spool:
+        if OBJECT_STORE_PACKAGE_WORKERS > 1:
+            synchronized_docs_metadata = register_update_documents_pipeline(
+                zipfile,
+                sps_package,
+                xmls_to_preserve,
+                OBJECT_STORE_PACKAGE_WORKERS,
+                OBJECT_STORE_PACKAGE_QUEUE_SIZE,
+                defer_media=OBJECT_STORE_DEFER_MEDIA,
+            )
+        else:
+            synchronized_docs_metadata = []
+            for i, xml_filename in enumerate(xmls_to_preserve):
                 Logger.info(
-                    'Could not put document "%s" in object store: %s',
+                    'Reading XML file "%s" from ZIP file "%s" [%s/%s]',
                     xml_filename,
-                    str(exc),
+                    sps_package,
+                    i,
+                    len(xmls_to_preserve),
                 )
-            else:
-                assets_and_pdfs_data = put_assets_and_pdfs_in_object_store(zipfile, xml_data)
-                _document_metadata = deepcopy(xml_data)
-                _document_metadata.update(assets_and_pdfs_data)
                 try:
-                    register_update_doc_into_kernel(_document_metadata)
-
-                except RegisterUpdateDocIntoKernelException as exc:
+                    xml_data = put_xml_into_object_store(zipfile, xml_filename)
+                except PutXMLInObjectStoreException as exc:
                     Logger.info(
-                        'Could not register or update document "%s" in Kernel: %s',
+                        'Could not put document "%s" in object store: %s',
                         xml_filename,
                         str(exc),
                     )
                 else:
-                    synchronized_docs_metadata.append(xml_data)
+                    if register_update_document(
+                        xml_filename,
+                        xml_data,
+                        put_assets_and_pdfs_in_object_store(zipfile, xml_data),
+                    ):
+                        synchronized_docs_metadata.append(xml_data)
+
+    if spool.rejected:
+        # Escritas recusadas pelo Kernel ao final do registro dos documentos
+        for xml_data in list(synchronized_docs_metadata):
+            if "/documents/{}".format(xml_data.get("scielo_id")) in spool.rejected:
+                Logger.info(
+                    'Could not register or update document "%s" in Kernel',
+                    xml_data.get("xml_package_name"),
+                )
+                synchronized_docs_metadata.remove(xml_data)
 
     Logger.debug("register_update_documents OUT")
 
@@ -203,7 +386,7 @@ def link_documents_to_documentsbundle(documents, issn_index_json_path):
         Logger.info('Reading ISSN index file %s', issn_index_json_path)
         with open(issn_index_json_path) as issn_index_file:
             issn_index_json = issn_index_file.read()
-            issn_index = json.loads(issn_index_json)
+            issn_index = json_codec.loads(issn_index_json)
         for doc in documents:
             try:
                 issn_id = issn_index[doc["issn"]]
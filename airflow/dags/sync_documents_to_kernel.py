@@ -26,6 +26,7 @@ from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
 
 from operations import sync_documents_to_kernel_operations
+from common.hooks import report_kernel_stats
 
 
 Logger = logging.getLogger(__name__)
@@ -34,6 +35,8 @@ default_args = {
     "owner": "airflow",
     "depends_on_past": False,
     "start_date": datetime(2019, 7, 21),
+    "on_success_callback": report_kernel_stats,
+    "on_failure_callback": report_kernel_stats,
 }
 
 dag = DAG(dag_id="sync_documents_to_kernel", default_args=default_args, schedule_interval=None)
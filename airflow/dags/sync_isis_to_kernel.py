@@ -5,20 +5,18 @@ import os
 import shutil
 import logging
 import requests
-import json
 import http.client
 from typing import List
 from airflow import DAG
 from airflow.models import Variable
 from airflow.operators.bash_operator import BashOperator
 from airflow.operators.python_operator import PythonOperator
-from airflow.hooks.http_hook import HttpHook
 from airflow.exceptions import AirflowException
 from xylose.scielodocument import Journal, Issue
 from datetime import datetime, timedelta
 from deepdiff import DeepDiff
 
-from common import hooks
+from common import hooks, json_codec
 from operations.docs_utils import issue_id
 
 """
@@ -77,6 +75,8 @@ default_args = {
     "email_on_retry": False,
     "retries": 1,
     "retry_delay": timedelta(minutes=5),
+    "on_success_callback": hooks.report_kernel_stats,
+    "on_failure_callback": hooks.report_kernel_stats,
 }
 
 dag = DAG("sync_isis_to_kernel", default_args=default_args, schedule_interval=None)
@@ -257,7 +257,7 @@ def create_journal_issn_index(title_json_dirname, journals):
     _issn_index_json_path = os.path.join(title_json_dirname, "issn_index.json")
     logging.info("creating journal ISSN index file %s.", _issn_index_json_path)
     with open(_issn_index_json_path, "w") as index_file:
-        index_file.write(json.dumps(_issn_index))
+        index_file.write(json_codec.dumps(_issn_index))
     return _issn_index_json_path
 
 
@@ -273,7 +273,7 @@ def process_journals(**context):
         journals = f.read()
         logging.info("reading file from %s." % (title_json_path))
 
-    journals = json.loads(journals)
+    journals = json_codec.loads(journals)
     journals_as_kernel = [journal_as_kernel(Journal(journal)) for journal in journals]
     issn_index_json_path = create_journal_issn_index(
         os.path.dirname(title_json_path), journals_as_kernel
@@ -313,7 +313,7 @@ def process_issues(**context):
         issues = f.read()
         logging.info("reading file from %s." % (issue_json_path))
 
-    issues = json.loads(issues)
+    issues = json_codec.loads(issues)
     issues = [Issue({"issue": data}) for data in issues]
     issues = filter_issues(issues)
     issues_as_kernel = [issue_as_kernel(issue) for issue in issues]
@@ -407,20 +407,37 @@ def update_journals_and_issues_link(journal_issues: dict):
 
     for journal_id, issues in journal_issues.items():
         try:
-            api_hook = HttpHook(http_conn_id="kernel_conn", method="GET")
-            response = api_hook.run(endpoint="{}{}".format(KERNEL_API_JOURNAL_ENDPOINT, journal_id))
+            api_hook = hooks.KernelHttpHook(http_conn_id="kernel_conn", method="GET")
+            response = hooks.http_hook_run(
+                api_hook,
+                "GET",
+                "{}{}".format(KERNEL_API_JOURNAL_ENDPOINT, journal_id),
+                timeout=hooks.KERNEL_JOURNAL_LINK_TIMEOUT,
+            )
+            api_hook.check_response(response)
             journal_items = response.json()["items"]
 
             if DeepDiff(journal_items, issues):
                 BUNDLE_URL = KERNEL_API_JOURNAL_BUNDLES_ENDPOINT.format(
                     journal_id=journal_id
                 )
-                api_hook = HttpHook(http_conn_id="kernel_conn", method="PUT")
-                response = api_hook.run(endpoint=BUNDLE_URL, data=json.dumps(issues))
+                api_hook = hooks.KernelHttpHook(http_conn_id="kernel_conn", method="PUT")
+                response = hooks.http_hook_run(
+                    api_hook,
+                    "PUT",
+                    BUNDLE_URL,
+                    data=json_codec.dumpb(issues),
+                    timeout=hooks.KERNEL_JOURNAL_LINK_TIMEOUT,
+                )
+                api_hook.check_response(response)
                 logging.info("updating bundles of journal %s" % journal_id)
 
         except (AirflowException):
             logging.warning("journal %s cannot be found" % journal_id)
+        except requests.exceptions.RequestException as exc:
+            logging.warning(
+                "issues of journal %s could not be updated: %s" % (journal_id, exc)
+            )
 
 
 def link_journals_and_issues(**kwargs):
@@ -431,7 +448,7 @@ def link_journals_and_issues(**kwargs):
     )
 
     with open(issue_json_path) as f:
-        issues = json.load(f)
+        issues = json_codec.loads(f.read())
         logging.info("reading file from %s." % (issue_json_path))
 
     journal_issues = mount_journals_issues_link(issues)
@@ -1,18 +1,14 @@
 import os
 import re
-import json
 import logging
+import time
 from datetime import timedelta
 import itertools
 from typing import Dict, List, Tuple
 
-import tenacity
-from tenacity import retry
-
 import airflow
 from airflow import DAG
 from airflow.sensors.http_sensor import HttpSensor
-from airflow.hooks.http_hook import HttpHook
 from airflow.hooks.base_hook import BaseHook
 from airflow.models import Variable
 from airflow.operators.python_operator import PythonOperator, ShortCircuitOperator
@@ -29,7 +25,16 @@ from operations.kernel_changes_operations import (
     ArticleRenditionFactory,
     try_register_documents_renditions,
 )
-from common.hooks import mongo_connect
+from common import json_codec
+from common.hooks import (
+    mongo_connect,
+    report_kernel_stats,
+    budgeted_retry,
+    iter_json_items,
+    KernelHttpHook,
+    KERNEL_STREAM_CHUNK_SIZE,
+    RETRY_BUDGET,
+)
 
 failure_recipients = os.environ.get("EMIAL_ON_FAILURE_RECIPIENTS", None)
 EMIAL_ON_FAILURE_RECIPIENTS = (
@@ -37,6 +42,7 @@ EMIAL_ON_FAILURE_RECIPIENTS = (
 )
 
 EMAIL_SPLIT_REGEX = re.compile("[;\\/]+")
+CHANGES_RESUME_MAX_WAIT = 60
 
 default_args = {
     "owner": "airflow",
@@ -46,6 +52,8 @@ default_args = {
     "email_on_retry": True,
     "depends_on_past": False,
     "email": EMIAL_ON_FAILURE_RECIPIENTS,
+    "on_success_callback": report_kernel_stats,
+    "on_failure_callback": report_kernel_stats,
 }
 
 dag = DAG(
@@ -54,7 +62,7 @@ dag = DAG(
     schedule_interval=None,
 )
 
-api_hook = HttpHook(http_conn_id="kernel_conn", method="GET")
+api_hook = KernelHttpHook(http_conn_id="kernel_conn", method="GET")
 
 
 class EnqueuedState:
@@ -111,23 +119,38 @@ class Reader:
         return entities, last_timestamp
 
 
-@retry(
-    wait=tenacity.wait_exponential(),
-    stop=tenacity.stop_after_attempt(10),
-    retry=tenacity.retry_if_exception_type(requests.exceptions.ConnectionError),
-)
+@budgeted_retry(requests.exceptions.ConnectionError, attempts=10)
 def fetch_data(endpoint):
     """
     Obtém o JSON do endpoint do Kernel
     """
-    return api_hook.run(endpoint=endpoint).json()
+    return json_codec.response_json(api_hook.run(endpoint=endpoint))
+
+
+@budgeted_retry(requests.exceptions.ConnectionError, attempts=10)
+def open_stream(endpoint):
+    """
+    Obtém a resposta do endpoint do Kernel sem realizar a leitura do corpo
+    """
+    return api_hook.run(endpoint=endpoint, extra_options={"stream": True})
+
+
+def stream_data(endpoint, key):
+    """
+    Produz os elementos da lista `key` do JSON do endpoint do Kernel à medida
+    que são recebidos, sem carregar a resposta inteira em memória
+    """
+    with open_stream(endpoint) as response:
+        yield from iter_json_items(
+            response.iter_content(chunk_size=KERNEL_STREAM_CHUNK_SIZE), key
+        )
 
 
 def fetch_changes(since):
     """
-         Obtém o JSON das mudanças do Kernel com base no parametro 'since'
+         Produz as mudanças do Kernel com base no parametro 'since'
     """
-    return fetch_data("/changes?since=%s" % (since))
+    return stream_data("/changes?since=%s" % (since), "results")
 
 
 def fetch_journal(journal_id):
@@ -144,6 +167,13 @@ def fetch_bundles(bundle_id):
     return fetch_data("/bundles/%s" % (bundle_id))
 
 
+def fetch_bundle_items(bundle_id):
+    """
+         Produz os items do DocumentBundle do Kernel com base no parametro 'bundle_id'
+    """
+    return stream_data("/bundles/%s" % (bundle_id), "items")
+
+
 def fetch_documents_front(document_id):
     """
          Obtém o JSON do Document do Kernel com base no parametro 'document_id'
@@ -168,18 +198,43 @@ def changes(since=""):
     If none modification was found returns an empty generator. If
     modifications are found returns a generator that produces
     a list with every modification as dictionary
-    {'id: '...', 'timestamp': '..'}"""
+    {'id: '...', 'timestamp': '..'}
+
+    If the stream is interrupted, it is resumed from the last yielded
+    change while `RETRY_BUDGET` allows it, waiting exponentially longer
+    (up to `CHANGES_RESUME_MAX_WAIT` seconds) after each consecutive
+    interruption."""
 
     last_yielded = None
+    interruptions = 0
 
     while True:
-        resp_json = fetch_changes(since)
         has_changes = False
 
-        for result in resp_json["results"]:
-            last_yielded = result
-            has_changes = True
-            yield result
+        try:
+            for result in fetch_changes(since):
+                last_yielded = result
+                has_changes = True
+                interruptions = 0
+                yield result
+        except (
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.ConnectionError,
+        ) as exc:
+            if not RETRY_BUDGET.allow_retry():
+                raise
+            if last_yielded is not None:
+                since = last_yielded["timestamp"]
+            interruptions += 1
+            wait = min(2 ** (interruptions - 1), CHANGES_RESUME_MAX_WAIT)
+            logging.warning(
+                'Changes stream interrupted, resuming since "%s" in %s seconds: %s',
+                since,
+                wait,
+                exc,
+            )
+            time.sleep(wait)
+            continue
 
         if not has_changes:
             return
@@ -510,15 +565,32 @@ def register_issues(ds, **kwargs):
             if issue_id == issue["id"]:
                 return issue["order"]
 
+    bundle_items = {}
+
+    def _fetch_bundle(issue_id):
+        """Obtém o fascículo e guarda os seus items, reaproveitados pela
+        task `register_documents_task`."""
+        data = fetch_bundles(issue_id)
+        bundle_items[issue_id] = data.get("items", [])
+        return data
+
     issues_to_get = itertools.chain(
         Variable.get("orphan_issues", default_var=[], deserialize_json=True),
         (get_id(task["id"]) for task in filter_changes(tasks, "bundles", "get")),
     )
     orphans, known_documents = try_register_issues(
-        issues_to_get, _journal_id, _issue_order, fetch_bundles, IssueFactory
+        issues_to_get, _journal_id, _issue_order, _fetch_bundle, IssueFactory
     )
 
     kwargs["ti"].xcom_push(key="i_documents", value=known_documents)
+    kwargs["ti"].xcom_push(
+        key="orphan_issues_items",
+        value={
+            issue_id: items
+            for issue_id, items in bundle_items.items()
+            if issue_id not in known_documents
+        },
+    )
     Variable.set("orphan_issues", orphans, serialize_json=True)
 
     return tasks
@@ -580,12 +652,20 @@ def register_documents(**kwargs):
         e consequentemente o documento continuará órfão.
 
         Uma solução para este problema é atualizar a lista de documentos
-        conhecidos a partir da lista de eventos de `get` de `bundles`.
+        conhecidos a partir da lista de eventos de `get` de `bundles`. Os
+        items dos fascículos órfãos já obtidos pela task `register_issues_task`
+        são reaproveitados sem uma nova requisição ao Kernel.
         """
 
         known_documents = kwargs["ti"].xcom_pull(
             key="i_documents", task_ids="register_issues_task"
         )
+        orphan_issues_items = (
+            kwargs["ti"].xcom_pull(
+                key="orphan_issues_items", task_ids="register_issues_task"
+            )
+            or {}
+        )
 
         issues_recently_updated = [
             get_id(task["id"]) for task in filter_changes(tasks, "bundles", "get")
@@ -593,11 +673,13 @@ def register_documents(**kwargs):
         ]
 
         for issue_id in issues_recently_updated:
+            if issue_id in orphan_issues_items:
+                items = orphan_issues_items[issue_id]
+            else:
+                items = fetch_bundle_items(issue_id)
             known_documents.setdefault(issue_id, [])
             known_documents[issue_id] = list(
-                itertools.chain(
-                    known_documents[issue_id], fetch_bundles(issue_id).get("items", [])
-                )
+                itertools.chain(known_documents[issue_id], items)
             )
         return known_documents
 
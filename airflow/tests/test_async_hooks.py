@@ -0,0 +1,59 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from airflow import DAG
+
+from common import async_hooks
+
+
+class TestAsyncKernelConnect(TestCase):
+    @patch("common.async_hooks.hooks.kernel_connect")
+    def test_get_calls_kernel_connect(self, mk_kernel_connect):
+        result = asyncio.run(async_hooks.get("/bundles/0034-8910-2014-v48-n2"))
+        mk_kernel_connect.assert_called_once_with(
+            "/bundles/0034-8910-2014-v48-n2",
+            "GET",
+            data=None,
+            headers=async_hooks.hooks.DEFAULT_HEADER,
+            timeout=1,
+        )
+        self.assertEqual(result, mk_kernel_connect.return_value)
+
+    @patch("common.async_hooks.hooks.kernel_connect")
+    def test_put_patch_and_delete_use_their_http_methods(self, mk_kernel_connect):
+        asyncio.run(async_hooks.put("/documents/1", {"data": "x"}))
+        asyncio.run(async_hooks.patch("/documents/1/renditions", {"lang": "en"}))
+        asyncio.run(async_hooks.delete("/documents/1"))
+        methods = [call[0][1] for call in mk_kernel_connect.call_args_list]
+        self.assertEqual(methods, ["PUT", "PATCH", "DELETE"])
+
+
+class TestGatherBounded(TestCase):
+    def test_returns_results_in_the_same_order(self):
+        async def _request(value, delay):
+            await asyncio.sleep(delay)
+            return value
+
+        requests = [_request(1, 0.03), _request(2, 0.01), _request(3, 0.02)]
+        self.assertEqual(async_hooks.run_bounded(requests, limit=3), [1, 2, 3])
+
+    def test_never_exceeds_the_limit(self):
+        in_flight = []
+        max_in_flight = []
+
+        async def _request():
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+        async_hooks.run_bounded([_request() for _ in range(10)], limit=2)
+        self.assertEqual(max(max_in_flight), 2)
+
+    def test_returns_exceptions_when_asked(self):
+        async def _request():
+            raise ValueError("boom")
+
+        result = async_hooks.run_bounded([_request()], return_exceptions=True)
+        self.assertIsInstance(result[0], ValueError)
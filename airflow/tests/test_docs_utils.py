@@ -1,5 +1,11 @@
+import io
 import copy
+import functools
 import random
+import hashlib
+import threading
+import time
+import zipfile
 from unittest import TestCase, main
 from unittest.mock import patch, Mock, MagicMock
 
@@ -14,8 +20,16 @@ from operations.docs_utils import (
     files_sha1,
     register_update_doc_into_kernel,
     put_object_in_object_store,
+    put_zip_member_in_object_store,
     put_assets_and_pdfs_in_object_store,
     put_xml_into_object_store,
+    run_uploads,
+    upload_lane,
+    UploadPipeline,
+    LANE_XML,
+    LANE_FIGURE,
+    LANE_PDF,
+    LANE_MEDIA,
     register_document_to_documentsbundle,
 )
 from operations.exceptions import (
@@ -539,6 +553,100 @@ class TestPutAssetsAndPdfsInObjectStore(TestCase):
             self.assertEqual(expected_pdf["size_bytes"], result_pdf["size_bytes"])
 
 
+    @patch("operations.docs_utils.hooks.OBJECT_STORE_UPLOAD_WORKERS", 4)
+    @patch("operations.docs_utils.put_object_in_object_store")
+    def test_put_assets_and_pdfs_in_object_store_keeps_order_with_workers(
+        self, mk_put_object_in_object_store
+    ):
+        def put_object(file, journal, scielo_id, filename):
+            # O primeiro arquivo termina por último
+            if filename == self.xml_data["assets"][0]["asset_id"]:
+                time.sleep(0.05)
+            return "http://minio/documentstore/" + filename
+
+        mk_put_object_in_object_store.side_effect = put_object
+        MockZipFile = MagicMock()
+        MockZipFile.read.side_effect = lambda name: (
+            b"" if name != self.xml_data["assets"][1]["asset_id"] else self.missing()
+        )
+        result = put_assets_and_pdfs_in_object_store(MockZipFile, self.xml_data)
+        self.assertEqual(
+            [asset["asset_id"] for asset in result["assets"]],
+            [self.xml_data["assets"][0]["asset_id"]],
+        )
+        self.assertEqual(
+            [pdf["data_url"] for pdf in result["pdfs"]],
+            [
+                "http://minio/documentstore/" + pdf["filename"]
+                for pdf in self.xml_data["pdfs"]
+            ],
+        )
+
+    def missing(self):
+        raise KeyError("File not found in the archive")
+
+
+class TestRunUploads(TestCase):
+    def test_returns_results_in_order(self):
+        uploads = [lambda i=i: (time.sleep(0.01 * (3 - i)), i)[1] for i in range(3)]
+        self.assertEqual(run_uploads(uploads, workers=3), [0, 1, 2])
+
+    def test_runs_uploads_concurrently(self):
+        barrier = threading.Barrier(2, timeout=1)
+        results = run_uploads([barrier.wait, barrier.wait], workers=2)
+        self.assertEqual(sorted(results), [0, 1])
+
+    def test_runs_in_the_calling_thread_with_one_worker(self):
+        thread = threading.current_thread()
+        self.assertEqual(
+            run_uploads([lambda: threading.current_thread()], workers=1), [thread]
+        )
+
+
+class TestUploadPipeline(TestCase):
+    def test_submit_blocks_while_max_pending_uploads_are_running(self):
+        release = threading.Event()
+        with UploadPipeline(workers=2, max_pending=2) as pipeline:
+            futures = [pipeline.submit(release.wait) for _ in range(2)]
+            blocked = threading.Thread(target=pipeline.submit, args=(lambda: 3,))
+            blocked.start()
+            blocked.join(0.05)
+            self.assertTrue(blocked.is_alive())
+            release.set()
+            blocked.join(1)
+            self.assertFalse(blocked.is_alive())
+        self.assertEqual([future.result() for future in futures], [True, True])
+
+
+class TestUploadLanes(TestCase):
+    def test_upload_lane(self):
+        self.assertEqual(upload_lane("a.xml"), LANE_XML)
+        self.assertEqual(upload_lane("a-g01.JPG"), LANE_FIGURE)
+        self.assertEqual(upload_lane("a.pdf"), LANE_PDF)
+        self.assertEqual(upload_lane("a-v01.mp4"), LANE_MEDIA)
+
+    def test_upload_pipeline_runs_higher_priority_lanes_first(self):
+        release = threading.Event()
+        executed = []
+        with UploadPipeline(workers=1, max_pending=10) as pipeline:
+            pipeline.submit(release.wait)
+            for name, lane in (
+                ("media", LANE_MEDIA),
+                ("pdf", LANE_PDF),
+                ("figure-1", LANE_FIGURE),
+                ("xml", LANE_XML),
+                ("figure-2", LANE_FIGURE),
+            ):
+                pipeline.submit(functools.partial(executed.append, name), lane)
+            release.set()
+        self.assertEqual(executed, ["xml", "figure-1", "figure-2", "pdf", "media"])
+
+    def test_upload_pipeline_sets_exceptions_in_futures(self):
+        with UploadPipeline(workers=1, max_pending=1) as pipeline:
+            future = pipeline.submit(lambda: 1 / 0)
+        self.assertIsInstance(future.exception(), ZeroDivisionError)
+
+
 class TestPutObjectInObjectStore(TestCase):
     @patch("operations.docs_utils.files_sha1")
     @patch("operations.docs_utils.hooks")
@@ -621,6 +729,78 @@ class TestPutObjectInObjectStore(TestCase):
         )
 
 
+class TestPutZipMemberInObjectStore(TestCase):
+    def setUp(self):
+        self.content = b"video" * 10000
+        self.buffer = io.BytesIO()
+        with zipfile.ZipFile(self.buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("1806-907X-rba-53-01-1-8-v01.mp4", self.content)
+            archive.writestr("1806-907X-rba-53-01-1-8.pdf", b"%PDF")
+        self.zipfile = zipfile.ZipFile(self.buffer)
+        self.addCleanup(self.zipfile.close)
+        self.uploaded = []
+
+        def upload(fileobj, filepath, bucket_name, size):
+            self.uploaded.append((fileobj.read(), filepath, bucket_name, size))
+            return "http://minio/{}/{}".format(bucket_name, filepath)
+
+        patcher = patch("operations.docs_utils.hooks")
+        self.mk_hooks = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mk_hooks.OBJECT_STORE_SPOOL_MAX_SIZE = 1024
+        self.mk_hooks.KERNEL_STREAM_CHUNK_SIZE = 4096
+        self.mk_hooks.OBJECT_STORE_UPLOAD_WORKERS = 1
+        self.mk_hooks.object_store_upload_fileobj.side_effect = upload
+
+    def test_uploads_the_member_named_by_its_sha1(self):
+        sha1 = hashlib.sha1(self.content).hexdigest()
+        url, size = put_zip_member_in_object_store(
+            self.zipfile,
+            "1806-907X-rba-53-01-1-8-v01.mp4",
+            "1806-907X",
+            "FX6F3cbyYmmwvtGmMB7WCgr",
+        )
+        filepath = "1806-907X/FX6F3cbyYmmwvtGmMB7WCgr/{}.mp4".format(sha1)
+        self.assertEqual(url, "http://minio/documentstore/" + filepath)
+        self.assertEqual(size, len(self.content))
+        self.assertEqual(
+            self.uploaded,
+            [(self.content, filepath, "documentstore", len(self.content))],
+        )
+
+    def test_raises_object_store_error_if_upload_fails(self):
+        self.mk_hooks.object_store_upload_fileobj.side_effect = Exception("timeout")
+        with self.assertRaises(ObjectStoreError):
+            put_zip_member_in_object_store(
+                self.zipfile,
+                "1806-907X-rba-53-01-1-8-v01.mp4",
+                "1806-907X",
+                "FX6F3cbyYmmwvtGmMB7WCgr",
+            )
+
+    def test_put_assets_and_pdfs_streams_members_above_threshold(self):
+        self.mk_hooks.OBJECT_STORE_STREAM_THRESHOLD = 1000
+        self.mk_hooks.object_store_connect.return_value = "http://minio/pdf"
+        xml_data = {
+            "issn": "1806-907X",
+            "scielo_id": "FX6F3cbyYmmwvtGmMB7WCgr",
+            "assets": [{"asset_id": "1806-907X-rba-53-01-1-8-v01.mp4"}],
+            "pdfs": [
+                {
+                    "lang": "pt",
+                    "filename": "1806-907X-rba-53-01-1-8.pdf",
+                    "mimetype": "application/pdf",
+                }
+            ],
+        }
+        result = put_assets_and_pdfs_in_object_store(self.zipfile, xml_data)
+        self.assertEqual(len(self.uploaded), 1)
+        self.assertEqual(result["assets"][0]["asset_url"][:27], "http://minio/documentstore/")
+        self.mk_hooks.object_store_connect.assert_called_once()
+        self.assertEqual(result["pdfs"][0]["data_url"], "http://minio/pdf")
+        self.assertEqual(result["pdfs"][0]["size_bytes"], 4)
+
+
 class TestPutXMLIntoObjectStore(TestCase):
     def setUp(self):
         self.xml_data = {
@@ -714,6 +894,26 @@ class TestPutXMLIntoObjectStore(TestCase):
             "http://minio/documentstore/1806-907X-rba-53-01-1-8.xml", result["xml_url"]
         )
 
+    @patch("operations.docs_utils.hooks")
+    @patch("operations.docs_utils.put_object_in_object_store")
+    @patch("operations.docs_utils.get_xml_data")
+    def test_put_xml_into_object_store_lists_document_prefix_before_the_upload(
+        self, mk_get_xml_data, mk_put_object_in_object_store, mk_hooks
+    ):
+        calls = []
+        mk_hooks.list_object_keys.side_effect = lambda *args: calls.append(args)
+        mk_put_object_in_object_store.side_effect = (
+            lambda *args: calls.append("put")
+        )
+        MockZipFile = Mock()
+        MockZipFile.read.return_value = b""
+        mk_get_xml_data.return_value = self.xml_data
+        put_xml_into_object_store(MockZipFile, "1806-907X-rba-53-01-1-8.xml")
+        self.assertEqual(
+            calls,
+            [("documentstore", "1806-907X/FX6F3cbyYmmwvtGmMB7WCgr/"), "put"],
+        )
+
 
 class TestFilesSha1(TestCase):
     def test_files_sha1_return_value(self):
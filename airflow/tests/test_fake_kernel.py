@@ -0,0 +1,187 @@
+import gzip
+import json
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from common.hooks import iter_json_items, KernelResponseCache
+from utils.fake_kernel import (
+    FakeKernelConfig,
+    fixed,
+    running_fake_kernel,
+)
+
+
+class FakeKernelTestCase(TestCase):
+    config = None
+
+    def setUp(self):
+        context = running_fake_kernel(config=self.config or FakeKernelConfig())
+        self.server = context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def url(self, path):
+        return self.server.url + path
+
+
+class TestFakeKernelDocuments(FakeKernelTestCase):
+    def test_put_and_get_document_front(self):
+        payload = {"data": "http://minio/documents/1.xml", "assets": []}
+        response = self.session.put(self.url("/documents/S0034"), json=payload)
+        self.assertEqual(response.status_code, 201)
+        response = self.session.put(self.url("/documents/S0034"), json=payload)
+        self.assertEqual(response.status_code, 204)
+        response = self.session.get(self.url("/documents/S0034/front"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("article_meta", response.json())
+
+    def test_patch_and_get_renditions(self):
+        self.session.put(self.url("/documents/S0034"), json={"data": "x"})
+        rendition = {"filename": "a.pdf", "lang": "en", "data_url": "http://minio/a"}
+        response = self.session.patch(
+            self.url("/documents/S0034/renditions"), json=rendition
+        )
+        self.assertEqual(response.status_code, 204)
+        response = self.session.get(self.url("/documents/S0034/renditions"))
+        self.assertEqual(response.json(), [rendition])
+
+    def test_new_document_version_resets_renditions(self):
+        self.session.put(self.url("/documents/S0034"), json={"data": "v1"})
+        self.session.patch(
+            self.url("/documents/S0034/renditions"), json={"lang": "en"}
+        )
+        self.session.put(self.url("/documents/S0034"), json={"data": "v1"})
+        self.assertEqual(
+            self.session.get(self.url("/documents/S0034/renditions")).json(),
+            [{"lang": "en"}],
+        )
+        self.session.put(self.url("/documents/S0034"), json={"data": "v2"})
+        self.assertEqual(
+            self.session.get(self.url("/documents/S0034/renditions")).json(), []
+        )
+
+    def test_unknown_document_returns_404(self):
+        self.assertEqual(
+            self.session.get(self.url("/documents/missing/front")).status_code, 404
+        )
+
+    def test_accepts_gzip_request_bodies(self):
+        body = gzip.compress(json.dumps({"data": "x"}).encode("utf-8"))
+        response = self.session.put(
+            self.url("/documents/S0034"),
+            data=body,
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.server.store.documents["S0034"], {"data": "x"})
+
+
+class TestFakeKernelBundlesAndJournals(FakeKernelTestCase):
+    def test_put_bundle_documents(self):
+        self.session.put(self.url("/bundles/0034-8910-2014-v48-n2"), json={})
+        items = [{"id": "S0034", "order": "1"}]
+        response = self.session.put(
+            self.url("/bundles/0034-8910-2014-v48-n2/documents"), json=items
+        )
+        self.assertEqual(response.status_code, 204)
+        bundle = self.session.get(self.url("/bundles/0034-8910-2014-v48-n2")).json()
+        self.assertEqual(bundle["items"], items)
+
+    def test_put_journal_issues(self):
+        self.session.put(self.url("/journals/0034-8910"), json={"title": "RSP"})
+        issues = [{"id": "0034-8910-2014-v48-n2", "order": 1}]
+        self.session.put(self.url("/journals/0034-8910/issues"), json=issues)
+        journal = self.session.get(self.url("/journals/0034-8910")).json()
+        self.assertEqual(journal["metadata"], {"title": "RSP"})
+        self.assertEqual(
+            self.session.get(self.url("/journals/0034-8910/issues")).json(), issues
+        )
+
+
+class TestFakeKernelConditionalRequests(FakeKernelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session.put(self.url("/journals/0034-8910"), json={"title": "RSP"})
+
+    def test_get_returns_validators(self):
+        response = self.session.get(self.url("/journals/0034-8910"))
+        self.assertTrue(response.headers["ETag"])
+        self.assertTrue(response.headers["Last-Modified"])
+
+    def test_unchanged_resources_return_304(self):
+        response = self.session.get(self.url("/journals/0034-8910"))
+        for name, header in (
+            ("If-None-Match", "ETag"),
+            ("If-Modified-Since", "Last-Modified"),
+        ):
+            with self.subTest(name=name):
+                not_modified = self.session.get(
+                    self.url("/journals/0034-8910"),
+                    headers={name: response.headers[header]},
+                )
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b"")
+
+    def test_changed_resources_return_200(self):
+        response = self.session.get(self.url("/journals/0034-8910"))
+        self.session.put(self.url("/journals/0034-8910"), json={"title": "RSP 2"})
+        changed = self.session.get(
+            self.url("/journals/0034-8910"),
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["metadata"], {"title": "RSP 2"})
+
+    def test_kernel_response_cache_hits(self):
+        cache = KernelResponseCache(tempfile.mkdtemp())
+        for _ in range(2):
+            request = requests.Request("GET", self.url("/journals/0034-8910")).prepare()
+            response = cache.conditional_send(
+                request, lambda: self.session.send(request)
+            )
+            self.assertEqual(response.json()["metadata"], {"title": "RSP"})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class TestFakeKernelChanges(FakeKernelTestCase):
+    config = FakeKernelConfig(page_size=2)
+
+    def test_changes_are_paginated_by_timestamp(self):
+        for i in range(5):
+            self.session.put(self.url("/documents/%d" % i), json={"data": str(i)})
+
+        ids, since = [], ""
+        while True:
+            results = self.session.get(
+                self.url("/changes"), params={"since": since}
+            ).json()["results"]
+            if not results:
+                break
+            self.assertLessEqual(len(results), 2)
+            ids.extend(result["id"] for result in results)
+            since = results[-1]["timestamp"]
+        self.assertEqual(ids, ["/documents/%d" % i for i in range(5)])
+
+    def test_changes_can_be_streamed(self):
+        self.session.put(self.url("/documents/1"), json={"data": "1"})
+        response = self.session.get(self.url("/changes"), stream=True)
+        results = list(iter_json_items(response.iter_content(8), "results"))
+        self.assertEqual([result["id"] for result in results], ["/documents/1"])
+
+
+class TestFakeKernelFaults(FakeKernelTestCase):
+    config = FakeKernelConfig(error_rate=1.0, error_status=503, seed=1)
+
+    def test_injects_errors(self):
+        response = self.session.put(self.url("/documents/1"), json={"data": "1"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.store.documents, {})
+
+
+class TestFakeKernelLatency(TestCase):
+    def test_delay_follows_the_latency_distribution(self):
+        config = FakeKernelConfig(latency=fixed(0.25))
+        self.assertEqual(config.delay(), 0.25)
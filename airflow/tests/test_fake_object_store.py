@@ -0,0 +1,70 @@
+import time
+import threading
+from unittest import TestCase
+
+import requests
+
+from utils.fake_object_store import (
+    FakeObjectStore,
+    FakeObjectStoreConfig,
+    running_fake_object_store,
+)
+
+
+class TestFakeObjectStoreServer(TestCase):
+    def setUp(self):
+        context = running_fake_object_store()
+        self.server = context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def url(self, path):
+        return self.server.url + path
+
+    def test_put_and_get_object(self):
+        response = self.session.put(
+            self.url("/documentstore/0034/S0034/a.xml"),
+            data=b"<article/>",
+            headers={"Content-Type": "application/xml"},
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.session.get(self.url("/documentstore/0034/S0034/a.xml"))
+        self.assertEqual(response.content, b"<article/>")
+        self.assertEqual(response.headers["Content-Type"], "application/xml")
+
+    def test_head_of_missing_object_is_not_found(self):
+        response = self.session.head(self.url("/documentstore/0034/S0034/b.xml"))
+        self.assertEqual(response.status_code, 404)
+        response = self.session.head(self.url("/documentstore"))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestFakeObjectStorePartitions(TestCase):
+    def write_concurrently(self, store, keys):
+        threads = [
+            threading.Thread(target=store.put, args=("documentstore", key, b"", {}))
+            for key in keys
+        ]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started_at
+
+    def test_writes_to_the_same_partition_are_limited(self):
+        store = FakeObjectStore(
+            FakeObjectStoreConfig(latency=0.05, partition_concurrency=1)
+        )
+        elapsed = self.write_concurrently(store, ["0034/a.jpg", "0034/b.jpg"])
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertEqual(store.stats()["partitions"], 1)
+
+    def test_writes_to_distinct_partitions_run_concurrently(self):
+        store = FakeObjectStore(
+            FakeObjectStoreConfig(latency=0.05, partition_concurrency=1)
+        )
+        elapsed = self.write_concurrently(store, ["ab/0034/a.jpg", "cd/0034/b.jpg"])
+        self.assertLess(elapsed, 0.1)
+        self.assertEqual(store.stats()["partitions"], 2)
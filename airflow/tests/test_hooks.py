@@ -0,0 +1,1193 @@
+import gzip
+import http.client
+import io
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import requests
+from airflow import DAG
+
+from airflow.exceptions import AirflowException
+
+from common import hooks
+from common.spool import WriteSpool
+from common.hooks import (
+    AIMDLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConnectionCache,
+    iter_json_items,
+    HedgingPolicy,
+    KernelCompression,
+    SingleFlight,
+    KernelConnectionPool,
+    KernelHttpHook,
+    KernelResponseCache,
+    KERNEL_POOL,
+    ObjectStoreHook,
+    percentile,
+    report_kernel_stats,
+    resource_url,
+    budgeted_retry,
+    endpoint_template,
+    http_hook_run,
+    EndpointMetrics,
+    LatencyHistogram,
+    LazyJSON,
+    object_store_base_url,
+    object_store_connect,
+    RetryBudget,
+    TokenBucket,
+    WriteCoalescer,
+)
+
+
+def make_response(status_code, content=b"", headers=None, url="http://kernel/"):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = http.client.responses[status_code]
+    response._content = content
+    response.headers.update(headers or {})
+    response.url = url
+    return response
+
+
+class TestConnectionCache(TestCase):
+    def test_loads_connection_once_within_ttl(self):
+        cache = ConnectionCache(60)
+        loader = MagicMock()
+        cache.get("kernel_conn", loader)
+        result = cache.get("kernel_conn", loader)
+        loader.assert_called_once_with("kernel_conn")
+        self.assertEqual(result, loader.return_value)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+    @patch("common.hooks.time.monotonic")
+    def test_reloads_connection_after_ttl(self, mk_monotonic):
+        cache = ConnectionCache(60)
+        loader = MagicMock()
+        mk_monotonic.return_value = 0
+        cache.get("kernel_conn", loader)
+        mk_monotonic.return_value = 61
+        cache.get("kernel_conn", loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidate(self):
+        cache = ConnectionCache(60)
+        loader = MagicMock()
+        cache.get("kernel_conn", loader)
+        cache.invalidate("kernel_conn")
+        cache.get("kernel_conn", loader)
+        self.assertEqual(loader.call_count, 2)
+
+    @patch("common.hooks.cached_connection")
+    def test_hooks_get_connection_from_cache(self, mk_cached_connection):
+        self.assertEqual(
+            KernelHttpHook.get_connection("kernel_conn"),
+            mk_cached_connection.return_value,
+        )
+        self.assertEqual(
+            ObjectStoreHook.get_connection("aws_default"),
+            mk_cached_connection.return_value,
+        )
+
+
+class TestObjectStoreHook(TestCase):
+    def setUp(self):
+        ObjectStoreHook._clients.clear()
+        self.addCleanup(ObjectStoreHook._clients.clear)
+
+    @patch("common.hooks.ObjectStoreHook.get_client_type")
+    def test_shares_one_client_per_connection(self, mk_get_client_type):
+        first = ObjectStoreHook(aws_conn_id="aws_default").get_conn()
+        second = ObjectStoreHook(aws_conn_id="aws_default").get_conn()
+        self.assertIs(first, second)
+        mk_get_client_type.assert_called_once()
+        config = mk_get_client_type.call_args[1]["config"]
+        self.assertEqual(config.max_pool_connections, hooks.OBJECT_STORE_POOL_MAXSIZE)
+
+    @patch("common.hooks.cached_connection")
+    def test_base_url_follows_the_cached_connection(self, mk_cached_connection):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        self.assertEqual(
+            object_store_base_url("documentstore"), "http://minio/documentstore"
+        )
+        mk_cached_connection.assert_called_once_with("aws_default")
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio2"}
+        self.assertEqual(
+            object_store_base_url("documentstore"), "http://minio2/documentstore"
+        )
+
+    @patch("common.hooks.OBJECT_STORE_METRICS")
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    def test_object_store_connect_records_upload(
+        self, mk_load_bytes, mk_cached_connection, mk_metrics
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        url = object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        self.assertEqual(url, "http://minio/documentstore/0034/S0034/a.xml")
+        args = mk_metrics.record.call_args[0]
+        self.assertEqual(args[:3], ("PUT", "/documentstore", "ok"))
+        self.assertEqual(args[4], 10)
+
+    @patch("common.hooks.OBJECT_STORE_GZIP_EXTENSIONS", [".xml"])
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.get_client_type")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    def test_object_store_connect_stores_gzip_encoded_objects(
+        self, mk_load_bytes, mk_get_client_type, mk_cached_connection
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        url = object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        self.assertEqual(url, "http://minio/documentstore/0034/S0034/a.xml")
+        mk_load_bytes.assert_not_called()
+        kwargs = mk_get_client_type.return_value.put_object.call_args[1]
+        self.assertEqual(kwargs["Key"], "0034/S0034/a.xml")
+        self.assertEqual(kwargs["ContentEncoding"], "gzip")
+        self.assertIn("xml", kwargs["ContentType"])
+        self.assertEqual(gzip.decompress(kwargs["Body"]), b"<article/>")
+
+    @patch("common.hooks.OBJECT_STORE_GZIP_EXTENSIONS", [".xml"])
+    def test_is_gzip_object(self):
+        self.assertTrue(hooks.is_gzip_object("0034/S0034/a.XML"))
+        self.assertFalse(hooks.is_gzip_object("0034/S0034/a.pdf"))
+
+    @patch("common.hooks.OBJECT_STORE_INDEX")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    def test_object_store_connect_skips_indexed_objects(
+        self, mk_load_bytes, mk_index
+    ):
+        mk_index.lookup.return_value = "http://minio/documentstore/0034/S0034/a.xml"
+        url = object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        self.assertEqual(url, "http://minio/documentstore/0034/S0034/a.xml")
+        mk_load_bytes.assert_not_called()
+        mk_index.add.assert_not_called()
+
+    @patch("common.hooks.OBJECT_STORE_INDEX")
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    def test_object_store_connect_indexes_uploaded_objects(
+        self, mk_load_bytes, mk_cached_connection, mk_index
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        mk_index.lookup.return_value = None
+        object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        mk_load_bytes.assert_called_once()
+        mk_index.add.assert_called_once_with(
+            "documentstore",
+            "0034/S0034/a.xml",
+            "http://minio/documentstore/0034/S0034/a.xml",
+            10,
+            location="0034/S0034/a.xml",
+        )
+
+    @patch("common.hooks.OBJECT_STORE_KEY_LAYOUT", "hash")
+    @patch("common.hooks.OBJECT_STORE_INDEX")
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    def test_object_store_connect_stores_objects_under_the_layout_key(
+        self, mk_load_bytes, mk_cached_connection, mk_index
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        mk_index.lookup.return_value = None
+        key = hooks.hash_key_layout("0034/S0034/a.xml")
+        url = object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        self.assertEqual(url, "http://minio/documentstore/" + key)
+        self.assertEqual(mk_load_bytes.call_args[1]["key"], key)
+        mk_index.lookup.assert_called_once_with(
+            "documentstore", "0034/S0034/a.xml", exists=hooks.object_store_exists
+        )
+        mk_index.add.assert_called_once_with(
+            "documentstore", "0034/S0034/a.xml", url, 10, location=key
+        )
+
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.get_client_type")
+    def test_upload_fileobj_uses_multipart_transfer_config(
+        self, mk_get_client_type, mk_cached_connection
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        fileobj = io.BytesIO(b"video")
+        fileobj.read()
+        url = hooks.object_store_upload_fileobj(
+            fileobj, "0034/S0034/a.mp4", "documentstore", 5
+        )
+        self.assertEqual(url, "http://minio/documentstore/0034/S0034/a.mp4")
+        self.assertEqual(fileobj.tell(), 0)
+        mk_get_client_type.return_value.upload_fileobj.assert_called_once_with(
+            fileobj,
+            "documentstore",
+            "0034/S0034/a.mp4",
+            Config=hooks.OBJECT_STORE_TRANSFER_CONFIG,
+        )
+        config = hooks.OBJECT_STORE_TRANSFER_CONFIG
+        self.assertEqual(
+            config.multipart_chunksize, hooks.OBJECT_STORE_MULTIPART_CHUNK_SIZE
+        )
+        self.assertEqual(config.max_concurrency, hooks.OBJECT_STORE_MULTIPART_CONCURRENCY)
+
+
+class TestObjectStoreKey(TestCase):
+    def test_document_layout_keeps_the_canonical_key(self):
+        self.assertEqual(
+            hooks.object_store_key("0034/S0034/a.xml", "document"), "0034/S0034/a.xml"
+        )
+
+    def test_hash_layout_prefixes_a_stable_shard(self):
+        key = hooks.object_store_key("0034/S0034/a.xml", "hash")
+        shard, _, filepath = key.partition("/")
+        self.assertEqual(filepath, "0034/S0034/a.xml")
+        self.assertEqual(len(shard), hooks.OBJECT_STORE_KEY_HASH_LENGTH)
+        self.assertEqual(key, hooks.object_store_key("0034/S0034/a.xml", "hash"))
+        shards = {
+            hooks.object_store_key("0034/S0034/%d.jpg" % i, "hash").split("/")[0]
+            for i in range(100)
+        }
+        self.assertGreater(len(shards), 50)
+
+    @patch("common.hooks.time.gmtime")
+    def test_date_layout_prefixes_the_upload_date(self, mk_gmtime):
+        mk_gmtime.return_value = time.struct_time((2020, 3, 9, 0, 0, 0, 0, 69, 0))
+        self.assertEqual(
+            hooks.object_store_key("0034/S0034/a.xml", "date"),
+            "2020/03/09/0034/S0034/a.xml",
+        )
+
+    @patch("common.hooks.OBJECT_STORE_LIST_PREFIXES", True)
+    @patch("common.hooks.OBJECT_STORE_KEY_LAYOUT", "hash")
+    @patch("common.hooks.object_store_list_keys")
+    def test_prefixes_are_not_listed_in_sharded_layouts(self, mk_list_keys):
+        hooks.list_object_keys("documentstore", "0034/S0034/")
+        mk_list_keys.assert_not_called()
+
+
+class TestObjectStoreListings(TestCase):
+    def setUp(self):
+        self.listings = hooks.ObjectStoreListings(maxsize=2)
+
+    def test_contains_keys_of_listed_prefixes(self):
+        self.listings.add("documentstore", "0034/S0034/", ["0034/S0034/a.xml"])
+        self.assertTrue(self.listings.contains("documentstore", "0034/S0034/a.xml"))
+        self.assertFalse(self.listings.contains("documentstore", "0034/S0034/b.pdf"))
+        self.assertFalse(self.listings.contains("other", "0034/S0034/a.xml"))
+        self.assertEqual(self.listings.stats()["hits"], 1)
+
+    def test_keeps_only_the_most_recent_prefixes(self):
+        for prefix in ("0034/A/", "0034/B/", "0034/C/"):
+            self.listings.add("documentstore", prefix, [prefix + "a.xml"])
+        self.assertFalse(self.listings.contains("documentstore", "0034/A/a.xml"))
+        self.assertTrue(self.listings.contains("documentstore", "0034/C/a.xml"))
+        self.assertEqual(self.listings.stats()["prefixes"], 2)
+
+
+@patch("common.hooks.OBJECT_STORE_LIST_PREFIXES", True)
+@patch("common.hooks.OBJECT_STORE_INDEX", None)
+class TestListObjectKeys(TestCase):
+    def setUp(self):
+        patcher = patch(
+            "common.hooks.OBJECT_STORE_LISTINGS", hooks.ObjectStoreListings(10)
+        )
+        self.listings = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("common.hooks.ObjectStoreHook.list_keys", create=True)
+    def test_lists_the_prefix_once(self, mk_list_keys):
+        mk_list_keys.return_value = ["0034/S0034/a.xml"]
+        hooks.list_object_keys("documentstore", "0034/S0034/")
+        mk_list_keys.assert_called_once_with("documentstore", prefix="0034/S0034/")
+        self.assertTrue(self.listings.contains("documentstore", "0034/S0034/a.xml"))
+
+    @patch("common.hooks.ObjectStoreHook.list_keys", create=True)
+    def test_does_nothing_if_disabled(self, mk_list_keys):
+        with patch("common.hooks.OBJECT_STORE_LIST_PREFIXES", False):
+            hooks.list_object_keys("documentstore", "0034/S0034/")
+        mk_list_keys.assert_not_called()
+
+    @patch("common.hooks.ObjectStoreHook.list_keys", create=True)
+    def test_skips_prefixes_known_by_the_index(self, mk_list_keys):
+        with patch("common.hooks.OBJECT_STORE_INDEX") as mk_index:
+            mk_index.has_prefix.return_value = True
+            hooks.list_object_keys("documentstore", "0034/S0034/")
+        mk_list_keys.assert_not_called()
+
+    @patch("common.hooks.ObjectStoreHook.list_keys", create=True)
+    def test_listing_errors_are_not_raised(self, mk_list_keys):
+        mk_list_keys.side_effect = Exception("AccessDenied")
+        hooks.list_object_keys("documentstore", "0034/S0034/")
+        self.assertEqual(self.listings.stats()["prefixes"], 0)
+
+    @patch("common.hooks.cached_connection")
+    @patch("common.hooks.ObjectStoreHook.load_bytes")
+    @patch("common.hooks.ObjectStoreHook.list_keys", create=True)
+    def test_listed_objects_are_not_uploaded(
+        self, mk_list_keys, mk_load_bytes, mk_cached_connection
+    ):
+        mk_cached_connection.return_value.extra_dejson = {"host": "http://minio"}
+        mk_list_keys.return_value = ["0034/S0034/a.xml"]
+        hooks.list_object_keys("documentstore", "0034/S0034/")
+        url = object_store_connect(b"<article/>", "0034/S0034/a.xml", "documentstore")
+        self.assertEqual(url, "http://minio/documentstore/0034/S0034/a.xml")
+        mk_load_bytes.assert_not_called()
+        object_store_connect(b"<article/>", "0034/S0034/b.xml", "documentstore")
+        mk_load_bytes.assert_called_once()
+
+
+class TestKernelConnectionPool(TestCase):
+    def test_mount_uses_the_same_adapter_for_http_and_https(self):
+        pool = KernelConnectionPool(1, 5)
+        session = pool.mount(requests.Session())
+        self.assertIs(session.get_adapter("http://kernel"), pool.adapter)
+        self.assertIs(session.get_adapter("https://kernel"), pool.adapter)
+
+    def test_stats_counts_reused_connections_as_hits(self):
+        pool = KernelConnectionPool(1, 5)
+        mk_pool = MagicMock(num_requests=10, num_connections=2)
+        pool.adapter.poolmanager.pools[("http", "kernel", 80)] = mk_pool
+        self.assertEqual(pool.stats(), {"hits": 8, "misses": 2})
+
+    def test_stats_starts_empty(self):
+        self.assertEqual(
+            KernelConnectionPool(1, 5).stats(), {"hits": 0, "misses": 0}
+        )
+
+
+class TestKernelHttpHook(TestCase):
+    @patch("common.hooks.HttpHook.get_conn")
+    def test_get_conn_mounts_kernel_pool(self, mk_get_conn):
+        mk_get_conn.return_value = requests.Session()
+        session = KernelHttpHook(http_conn_id="kernel_conn").get_conn()
+        self.assertIs(session.get_adapter("http://kernel"), KERNEL_POOL.adapter)
+
+    @patch("common.hooks.KERNEL_LIMITER")
+    @patch("common.hooks.HttpHook.run_and_check")
+    def test_run_and_check_marks_limiter_overloaded_on_5xx(
+        self, mk_run_and_check, mk_limiter
+    ):
+        mk_run_and_check.return_value = make_response(503)
+        slot = mk_limiter.slot.return_value.__enter__.return_value
+        KernelHttpHook(method="PUT").run_and_check(
+            MagicMock(),
+            requests.Request("PUT", "http://kernel/documents/1").prepare(),
+            {"check_response": False},
+        )
+        self.assertTrue(slot.overloaded)
+
+    @patch("common.hooks.HttpHook.run_and_check")
+    def test_run_and_check_keeps_check_response_behaviour(self, mk_run_and_check):
+        mk_run_and_check.return_value = make_response(404)
+        with self.assertRaises(AirflowException):
+            KernelHttpHook(method="PUT").run_and_check(
+                MagicMock(),
+                requests.Request("PUT", "http://kernel/documents/1").prepare(),
+                {},
+            )
+        self.assertFalse(mk_run_and_check.call_args[0][2]["check_response"])
+
+    @patch("common.hooks.KERNEL_SINGLE_FLIGHT")
+    @patch("common.hooks.KERNEL_CACHE")
+    @patch("common.hooks.HttpHook.run_and_check")
+    def test_stream_requests_skip_cache_and_single_flight(
+        self, mk_run_and_check, mk_cache, mk_single_flight
+    ):
+        mk_run_and_check.return_value = make_response(200)
+        response = KernelHttpHook(method="GET").run_and_check(
+            MagicMock(),
+            requests.Request("GET", "http://kernel/changes").prepare(),
+            {"stream": True},
+        )
+        self.assertIs(response, mk_run_and_check.return_value)
+        mk_cache.conditional_send.assert_not_called()
+        mk_single_flight.do.assert_not_called()
+        self.assertTrue(mk_run_and_check.call_args[0][2]["stream"])
+
+
+class TestIterJsonItems(TestCase):
+    def chunked(self, text, size):
+        data = text.encode("utf-8")
+        return [data[i : i + size] for i in range(0, len(data), size)]
+
+    def test_yields_items_of_the_given_key(self):
+        document = {
+            "id": "0034-8910-2014-v48-n2",
+            "metadata": {"publication_year": "2014", "tags": ["a", "b"]},
+            "items": [{"id": "S0034-%d" % i, "order": i} for i in range(50)],
+            "after": 1,
+        }
+        text = json.dumps(document)
+        for size in (1, 3, 7, 64, len(text)):
+            with self.subTest(size=size):
+                items = list(iter_json_items(self.chunked(text, size), "items"))
+                self.assertEqual(items, document["items"])
+
+    def test_does_not_split_numbers_across_chunks(self):
+        chunks = [b'{"results": [12', b"34, 5", b"6]}"]
+        self.assertEqual(list(iter_json_items(chunks, "results")), [1234, 56])
+
+    def test_decodes_multibyte_characters_split_across_chunks(self):
+        text = json.dumps({"results": ["ação"]}, ensure_ascii=False)
+        items = iter_json_items(self.chunked(text, 1), "results")
+        self.assertEqual(list(items), ["ação"])
+
+    def test_yields_nothing_when_key_is_missing(self):
+        self.assertEqual(list(iter_json_items([b'{"since": ""}'], "results")), [])
+        self.assertEqual(list(iter_json_items([b"{}"], "results")), [])
+
+    def test_stops_reading_after_the_list(self):
+        chunks = iter([b'{"results": [1]', b", invalid"])
+        self.assertEqual(list(iter_json_items(chunks, "results")), [1])
+
+    def test_raises_on_truncated_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_items([b'{"results": [{"id": 1}, {"id"'], "results"))
+
+
+class TestAIMDLimiter(TestCase):
+    def test_limit_starts_between_minimum_and_maximum(self):
+        self.assertEqual(AIMDLimiter(20, 1, 8).limit, 8)
+        self.assertEqual(AIMDLimiter(0, 2, 8).limit, 2)
+
+    def test_increases_additively_while_latency_is_stable(self):
+        limiter = AIMDLimiter(2, 1, 10)
+        for _ in range(4):
+            with limiter.slot():
+                pass
+        self.assertGreater(limiter.limit, 2)
+        self.assertLess(limiter.limit, 4)
+        self.assertEqual(limiter.increases, 4)
+
+    def test_does_not_exceed_maximum(self):
+        limiter = AIMDLimiter(2, 1, 3)
+        for _ in range(50):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_decreases_multiplicatively_when_overloaded(self):
+        limiter = AIMDLimiter(8, 1, 10)
+        with limiter.slot() as slot:
+            slot.overloaded = True
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.decreases, 1)
+
+    def test_decreases_on_timeout(self):
+        limiter = AIMDLimiter(8, 1, 10)
+        with self.assertRaises(requests.Timeout):
+            with limiter.slot():
+                raise requests.Timeout()
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_does_not_decrease_below_minimum(self):
+        limiter = AIMDLimiter(2, 2, 10)
+        limiter.acquire()
+        limiter.release(overloaded=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_stats(self):
+        limiter = AIMDLimiter(2, 1, 10)
+        limiter.acquire()
+        self.assertEqual(limiter.stats()["in_flight"], 1)
+        self.assertEqual(limiter.stats()["max_in_flight"], 1)
+        self.assertEqual(limiter.stats()["limit"], 2)
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(
+            "kernel",
+            (requests.ConnectionError,),
+            failure_rate=0.5,
+            window=4,
+            min_calls=4,
+            reset_timeout=60,
+        )
+
+    def _fail(self, times=1):
+        for _ in range(times):
+            with self.assertRaises(requests.ConnectionError):
+                with self.breaker.guard():
+                    raise requests.ConnectionError()
+
+    def test_opens_when_failure_rate_is_reached(self):
+        with self.breaker.guard():
+            pass
+        self._fail(3)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_closed_below_minimum_calls(self):
+        self._fail(3)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_marked_failures_count(self):
+        for _ in range(4):
+            with self.breaker.guard() as call:
+                call.failed = True
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_fails_fast_when_open(self):
+        self._fail(4)
+        with self.assertRaises(CircuitOpenError):
+            with self.breaker.guard():
+                self.fail("should not be called")
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    @patch("common.hooks.time.monotonic")
+    def test_closes_after_successful_probe(self, mk_monotonic):
+        mk_monotonic.return_value = 0
+        self._fail(4)
+        mk_monotonic.return_value = 61
+        with self.breaker.guard():
+            self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    @patch("common.hooks.time.monotonic")
+    def test_reopens_after_failed_probe(self, mk_monotonic):
+        mk_monotonic.return_value = 0
+        self._fail(4)
+        mk_monotonic.return_value = 61
+        self._fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()["opened"], 2)
+
+    @patch("common.hooks.time.monotonic")
+    def test_allows_a_single_probe_while_half_open(self, mk_monotonic):
+        mk_monotonic.return_value = 0
+        self._fail(4)
+        mk_monotonic.return_value = 61
+        with self.breaker.guard():
+            with self.assertRaises(CircuitOpenError):
+                with self.breaker.guard():
+                    pass
+
+
+class TestRetryBudget(TestCase):
+    def test_allows_min_retries_without_successes(self):
+        budget = RetryBudget(ratio=0.1, min_retries=2)
+        self.assertEqual([budget.allow_retry() for _ in range(3)], [True, True, False])
+        self.assertEqual(budget.stats()["denied"], 1)
+
+    def test_successes_increase_the_budget(self):
+        budget = RetryBudget(ratio=0.1, min_retries=0)
+        self.assertFalse(budget.allow_retry())
+        for _ in range(20):
+            budget.record_success()
+        self.assertEqual([budget.allow_retry() for _ in range(3)], [True, True, False])
+
+
+class TestTokenBucket(TestCase):
+    def test_does_not_wait_within_the_burst(self):
+        sleep = MagicMock()
+        bucket = TokenBucket(rate=10, burst=3, clock=lambda: 0, sleep=sleep)
+        for _ in range(3):
+            bucket.acquire()
+        sleep.assert_not_called()
+
+    def test_waits_for_the_next_token(self):
+        sleep = MagicMock()
+        bucket = TokenBucket(rate=10, burst=1, clock=lambda: 0, sleep=sleep)
+        bucket.acquire()
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(
+            [round(call[0][0], 2) for call in sleep.call_args_list], [0.1, 0.2]
+        )
+
+    def test_refills_over_time(self):
+        now = [0]
+        sleep = MagicMock()
+        bucket = TokenBucket(rate=10, burst=1, clock=lambda: now[0], sleep=sleep)
+        bucket.acquire()
+        now[0] = 0.1
+        bucket.acquire()
+        sleep.assert_not_called()
+
+    def test_zero_rate_disables_the_limit(self):
+        sleep = MagicMock()
+        bucket = TokenBucket(rate=0, burst=1, sleep=sleep)
+        for _ in range(10):
+            bucket.acquire()
+        sleep.assert_not_called()
+
+
+@patch("common.hooks.wait_exponential", MagicMock(return_value=lambda *a, **k: 0))
+class TestBudgetedRetry(TestCase):
+    def test_retries_until_success_and_records_it(self):
+        budget = RetryBudget(ratio=0, min_retries=5)
+        func = MagicMock(side_effect=[requests.ConnectionError(), "ok"])
+        with patch("common.hooks.RETRY_BUDGET", budget):
+            self.assertEqual(budgeted_retry(requests.ConnectionError, 4)(func)(), "ok")
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(budget.stats(), {"successes": 1, "retries": 1, "denied": 0})
+
+    def test_gives_up_when_budget_is_exhausted(self):
+        budget = RetryBudget(ratio=0, min_retries=1)
+        func = MagicMock(side_effect=requests.ConnectionError())
+        with patch("common.hooks.RETRY_BUDGET", budget):
+            with self.assertRaises(requests.ConnectionError):
+                budgeted_retry(requests.ConnectionError, 4)(func)()
+        self.assertEqual(func.call_count, 2)
+
+    def test_last_attempt_does_not_spend_the_budget(self):
+        budget = RetryBudget(ratio=0, min_retries=5)
+        func = MagicMock(side_effect=requests.ConnectionError())
+        with patch("common.hooks.RETRY_BUDGET", budget):
+            with self.assertRaises(requests.ConnectionError):
+                budgeted_retry(requests.ConnectionError, 2)(func)()
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(budget.stats()["retries"], 1)
+
+    def test_does_not_retry_other_exceptions(self):
+        func = MagicMock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            budgeted_retry(requests.ConnectionError, 4)(func)()
+        self.assertEqual(func.call_count, 1)
+
+
+class TestPercentile(TestCase):
+    def test_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile(samples, 100), 100)
+
+    def test_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+
+class TestHedgingPolicy(TestCase):
+    def setUp(self):
+        self.request = requests.Request("GET", "http://kernel/bundles/1").prepare()
+
+    def _warm(self, policy, latency=0.01, samples=20):
+        policy._primary_latencies.extend([latency] * samples)
+        policy.requests = samples
+
+    def test_does_not_hedge_without_enough_samples(self):
+        policy = HedgingPolicy(True, 95, 1.0)
+        calls = []
+        policy.run(lambda request: calls.append(request), self.request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.hedges, 0)
+
+    def test_hedges_slow_requests_and_returns_first_response(self):
+        policy = HedgingPolicy(True, 95, 1.0)
+        self._warm(policy)
+        calls = []
+
+        def _send(request):
+            calls.append(request)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                return "slow"
+            return "fast"
+
+        self.assertEqual(policy.run(_send, self.request), "fast")
+        self.assertEqual(policy.hedges, 1)
+        self.assertEqual(policy.hedge_wins, 1)
+        self.assertIsNot(calls[1], self.request)
+
+    def test_respects_hedge_budget(self):
+        policy = HedgingPolicy(True, 95, 0.0)
+        self._warm(policy)
+
+        def _send(request):
+            time.sleep(0.05)
+            return "slow"
+
+        self.assertEqual(policy.run(_send, self.request), "slow")
+        self.assertEqual(policy.hedges, 0)
+
+    def test_raises_error_when_both_requests_fail(self):
+        policy = HedgingPolicy(True, 95, 1.0)
+        self._warm(policy)
+
+        def _send(request):
+            time.sleep(0.05)
+            raise requests.Timeout()
+
+        with self.assertRaises(requests.Timeout):
+            policy.run(_send, self.request)
+
+    def test_stats_report_latencies_before_and_after(self):
+        policy = HedgingPolicy(True, 95, 1.0)
+        policy.run(lambda request: None, self.request)
+        stats = policy.stats()
+        self.assertEqual(stats["requests"], 1)
+        self.assertIsNotNone(stats["before"]["p50"])
+        self.assertIsNotNone(stats["after"]["p99"])
+
+
+class TestResourceUrl(TestCase):
+    def test_returns_main_resource(self):
+        self.assertEqual(
+            resource_url("http://kernel/bundles/0034-8910-2014-v48-n2/documents"),
+            "http://kernel/bundles/0034-8910-2014-v48-n2",
+        )
+        self.assertEqual(
+            resource_url("http://kernel/journals/0034-8910"),
+            "http://kernel/journals/0034-8910",
+        )
+
+
+class TestSingleFlight(TestCase):
+    def test_concurrent_calls_share_one_request(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def _fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return "bundle"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(
+                executor.map(
+                    lambda _: single_flight.do("/bundles/1", _fetch), range(5)
+                )
+            )
+        self.assertEqual(results, ["bundle"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.stats()["saved"], 4)
+
+    def test_repeated_calls_reuse_remembered_result(self):
+        single_flight = SingleFlight()
+        fetch = MagicMock(return_value="bundle")
+        single_flight.do("/bundles/1", fetch)
+        single_flight.do("/bundles/1", fetch)
+        fetch.assert_called_once_with()
+
+    def test_does_not_remember_rejected_results(self):
+        single_flight = SingleFlight()
+        fetch = MagicMock(return_value="not found")
+        single_flight.do("/bundles/1", fetch, remember=lambda result: False)
+        single_flight.do("/bundles/1", fetch, remember=lambda result: False)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_does_not_remember_errors(self):
+        single_flight = SingleFlight()
+        fetch = MagicMock(side_effect=[requests.Timeout(), "bundle"])
+        with self.assertRaises(requests.Timeout):
+            single_flight.do("/bundles/1", fetch)
+        self.assertEqual(single_flight.do("/bundles/1", fetch), "bundle")
+
+    def test_forget_discards_resource_results(self):
+        single_flight = SingleFlight()
+        fetch = MagicMock(return_value="bundle")
+        single_flight.do("http://kernel/bundles/1", fetch)
+        single_flight.do("http://kernel/bundles/2", fetch)
+        single_flight.forget("http://kernel/bundles/1")
+        single_flight.do("http://kernel/bundles/1", fetch)
+        single_flight.do("http://kernel/bundles/2", fetch)
+        self.assertEqual(fetch.call_count, 3)
+
+    def test_remembers_only_the_most_recently_used_results(self):
+        single_flight = SingleFlight(maxsize=2)
+        fetch = MagicMock(return_value="bundle")
+        for key in ("/bundles/1", "/bundles/2", "/bundles/1", "/bundles/3"):
+            single_flight.do(key, fetch)
+        self.assertEqual(single_flight.stats()["remembered"], 2)
+        single_flight.do("/bundles/1", fetch)
+        self.assertEqual(fetch.call_count, 3)
+        single_flight.do("/bundles/2", fetch)
+        self.assertEqual(fetch.call_count, 4)
+
+    def test_zero_maxsize_shares_only_requests_in_flight(self):
+        single_flight = SingleFlight(maxsize=0)
+        fetch = MagicMock(return_value="bundle")
+        single_flight.do("/bundles/1", fetch)
+        single_flight.do("/bundles/1", fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+
+class TestKernelCompression(TestCase):
+    def make_request(self, url, body):
+        return requests.Request("PUT", url, data=body).prepare()
+
+    def test_compresses_large_bodies_of_matching_endpoints(self):
+        compression = KernelCompression(["/documents/*"], min_size=10)
+        body = json.dumps({"assets": ["asset"] * 100}).encode("utf-8")
+        request = self.make_request("http://kernel/documents/S0034", body)
+        compression.compress_request(request)
+        self.assertEqual(request.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(request.body), body)
+        self.assertEqual(request.headers["Content-Length"], str(len(request.body)))
+        stats = compression.stats()
+        self.assertEqual(stats["request_raw_bytes"], len(body))
+        self.assertEqual(stats["request_sent_bytes"], len(request.body))
+
+    def test_does_not_compress_small_bodies(self):
+        compression = KernelCompression(["/documents/*"], min_size=1024)
+        request = self.make_request("http://kernel/documents/S0034", b"{}")
+        compression.compress_request(request)
+        self.assertNotIn("Content-Encoding", request.headers)
+        self.assertEqual(request.body, b"{}")
+
+    def test_does_not_compress_other_endpoints(self):
+        compression = KernelCompression(["/documents/*"], min_size=1)
+        request = self.make_request("http://kernel/bundles/0034-8910", b"{}")
+        compression.compress_request(request)
+        self.assertNotIn("Content-Encoding", request.headers)
+
+    def test_advertises_accept_encoding(self):
+        compression = KernelCompression([], min_size=1024)
+        request = requests.Request("GET", "http://kernel/changes").prepare()
+        request.headers.pop("Accept-Encoding", None)
+        compression.compress_request(request)
+        self.assertEqual(request.headers["Accept-Encoding"], "gzip, deflate")
+
+    def test_records_received_response_bytes(self):
+        compression = KernelCompression([], min_size=1024)
+        response = make_response(200, b'{"results": []}')
+        response.raw = MagicMock(**{"tell.return_value": 10})
+        compression.record_response(response)
+        stats = compression.stats()
+        self.assertEqual(stats["response_raw_bytes"], 15)
+        self.assertEqual(stats["response_received_bytes"], 10)
+
+    def test_ignores_responses_without_raw_stream(self):
+        compression = KernelCompression([], min_size=1024)
+        compression.record_response(make_response(200, b"{}"))
+        self.assertEqual(compression.stats()["response_raw_bytes"], 0)
+
+
+class TestSpooledWrites(TestCase):
+    def setUp(self):
+        self.spool = WriteSpool(tempfile.mkdtemp(), fsync=False)
+        patcher = patch("common.hooks.KERNEL_SPOOL", self.spool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("common.hooks._kernel_connect")
+    def test_writes_are_spooled_and_sent_at_the_end(self, mk_kernel_connect):
+        with hooks.spooled_writes():
+            response = hooks.kernel_connect("/documents/1", "PUT", {"data": "x"})
+            self.assertEqual(response.status_code, 202)
+            mk_kernel_connect.assert_not_called()
+            self.assertEqual(self.spool.stats()["depth"], 1)
+        mk_kernel_connect.assert_called_once_with(
+            "/documents/1",
+            "PUT",
+            data={"data": "x"},
+            headers=hooks.DEFAULT_HEADER,
+            timeout=1,
+        )
+        self.assertEqual(self.spool.stats()["depth"], 0)
+
+    @patch("common.hooks._kernel_connect")
+    def test_reads_send_pending_writes_of_the_resource_first(
+        self, mk_kernel_connect
+    ):
+        with hooks.spooled_writes():
+            hooks.kernel_connect("/bundles/1/documents", "PUT", [{"id": "a"}])
+            hooks.kernel_connect("/bundles/1", "GET")
+            methods = [call[0][1] for call in mk_kernel_connect.call_args_list]
+            self.assertEqual(methods, ["PUT", "GET"])
+
+    @patch("common.hooks._kernel_connect")
+    def test_rejected_resources_are_reported(self, mk_kernel_connect):
+        error = requests.HTTPError(response=make_response(400))
+        mk_kernel_connect.side_effect = error
+        with hooks.spooled_writes() as spool:
+            hooks.kernel_connect("/documents/1", "PUT", {"data": "x"})
+        self.assertEqual(spool.rejected, {"/documents/1"})
+
+    @patch("common.hooks._kernel_connect")
+    def test_raises_when_writes_remain_pending(self, mk_kernel_connect):
+        mk_kernel_connect.side_effect = requests.ConnectionError()
+        with self.assertRaises(hooks.KernelSpoolError):
+            with hooks.spooled_writes():
+                hooks.kernel_connect("/documents/1", "PUT", {"data": "x"})
+        self.assertEqual(self.spool.stats()["depth"], 1)
+
+    @patch("common.hooks._kernel_connect")
+    def test_writes_outside_the_block_are_sent_directly(self, mk_kernel_connect):
+        hooks.kernel_connect("/documents/1", "PUT", {"data": "x"})
+        mk_kernel_connect.assert_called_once()
+        self.assertEqual(self.spool.stats()["depth"], 0)
+
+
+class TestEndpointTemplate(TestCase):
+    def test_replaces_identifiers_and_drops_query(self):
+        self.assertEqual(
+            endpoint_template("/documents/S0034/renditions"),
+            "/documents/{id}/renditions",
+        )
+        self.assertEqual(endpoint_template("/bundles/0034-8910"), "/bundles/{id}")
+        self.assertEqual(endpoint_template("/changes?since=2019"), "/changes")
+
+
+class TestLatencyHistogram(TestCase):
+    def test_counts_observations_in_buckets(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.001, 0.02, 0.02, 0.3, 60):
+            histogram.observe(seconds)
+        stats = histogram.stats()
+        self.assertEqual(stats["count"], 5)
+        self.assertEqual(stats["buckets"]["0.005"], 1)
+        self.assertEqual(stats["buckets"]["0.025"], 2)
+        self.assertEqual(stats["buckets"]["+Inf"], 1)
+        self.assertEqual(stats["p50"], 0.025)
+
+    def test_quantile_of_empty_histogram(self):
+        self.assertIsNone(LatencyHistogram().quantile(0.5))
+
+
+class TestEndpointMetrics(TestCase):
+    def test_groups_by_method_and_endpoint_template(self):
+        metrics = EndpointMetrics()
+        metrics.record("PUT", "/documents/1", "201", 0.1, 100, 0)
+        metrics.record("PUT", "/documents/2", "500", 0.2, 50, 10)
+        stats = metrics.stats()["PUT /documents/{id}"]
+        self.assertEqual(stats["latency"]["count"], 2)
+        self.assertEqual(stats["sent_bytes"], 150)
+        self.assertEqual(stats["received_bytes"], 10)
+        self.assertEqual(stats["status"], {"201": 1, "500": 1})
+
+
+class TestHttpHookRun(TestCase):
+    def test_records_metrics(self):
+        api_hook = MagicMock()
+        api_hook.run.return_value = make_response(200, b'{"id": 1}')
+        with patch("common.hooks.KERNEL_METRICS") as mk_metrics:
+            http_hook_run(api_hook, "GET", "/documents/1/front")
+        args = mk_metrics.record.call_args[0]
+        self.assertEqual(args[:3], ("GET", "/documents/1/front", "200"))
+        self.assertEqual(args[4:], (0, 9))
+
+    def test_does_not_serialize_payload_when_debug_is_disabled(self):
+        api_hook = MagicMock()
+        api_hook.run.return_value = make_response(201)
+        with patch("common.hooks.Logger.isEnabledFor", return_value=False), patch(
+            "common.hooks.json.dumps"
+        ) as mk_dumps:
+            http_hook_run(api_hook, "PUT", "/documents/1", data='{"data": "x"}')
+        mk_dumps.assert_not_called()
+
+    def test_lazy_json_pretty_prints_json_strings(self):
+        self.assertEqual(str(LazyJSON('{"a": 1}')), '{\n  "a": 1\n}')
+        self.assertEqual(str(LazyJSON("not json")), "not json")
+        self.assertEqual(str(LazyJSON(None)), "")
+
+
+class TestWriteCoalescer(TestCase):
+    def setUp(self):
+        self.coalescer = WriteCoalescer(["/journals/{id}"], max_buffered=100)
+
+    def writes(self, resource):
+        return [
+            (entry["method"], entry["endpoint"], entry["data"])
+            for entry in self.coalescer.resources.get(resource, [])
+        ]
+
+    def test_last_put_wins(self):
+        self.coalescer.add("PUT", "/documents/1", {"data": "a"})
+        self.coalescer.add("PATCH", "/documents/1/renditions", {"lang": "en"})
+        self.coalescer.add("PUT", "/documents/1", {"data": "b"})
+        self.assertEqual(
+            self.writes("/documents/1"),
+            [
+                ("PUT", "/documents/1", {"data": "b"}),
+                ("PATCH", "/documents/1/renditions", {"lang": "en"}),
+            ],
+        )
+        self.assertEqual(self.coalescer.stats()["eliminated"], 1)
+
+    def test_merges_patches_of_mergeable_endpoints(self):
+        self.coalescer.add("PATCH", "/journals/1", {"title": "a", "acronym": "x"})
+        self.coalescer.add("PATCH", "/journals/1", {"title": "b"})
+        self.assertEqual(
+            self.writes("/journals/1"),
+            [("PATCH", "/journals/1", {"title": "b", "acronym": "x"})],
+        )
+
+    def test_merges_patch_into_previous_put(self):
+        self.coalescer.add("PUT", "/journals/1", {"title": "a"})
+        self.coalescer.add("PATCH", "/journals/1", {"acronym": "x"})
+        self.assertEqual(
+            self.writes("/journals/1"),
+            [("PUT", "/journals/1", {"title": "a", "acronym": "x"})],
+        )
+
+    def test_keeps_patches_of_other_endpoints(self):
+        self.coalescer.add("PATCH", "/documents/1/renditions", {"lang": "en"})
+        self.coalescer.add("PATCH", "/documents/1/renditions", {"lang": "es"})
+        self.assertEqual(len(self.writes("/documents/1")), 2)
+        self.assertEqual(self.coalescer.stats()["eliminated"], 0)
+
+    def test_delete_drops_previous_writes_of_the_resource(self):
+        self.coalescer.add("PUT", "/documents/1", {"data": "a"})
+        self.coalescer.add("PATCH", "/documents/1/renditions", {"lang": "en"})
+        self.coalescer.add("DELETE", "/documents/1")
+        self.coalescer.add("PUT", "/documents/1", {"data": "b"})
+        self.assertEqual(
+            self.writes("/documents/1"),
+            [
+                ("DELETE", "/documents/1", None),
+                ("PUT", "/documents/1", {"data": "b"}),
+            ],
+        )
+
+    def test_restore_puts_writes_back_in_front(self):
+        self.coalescer.add("PUT", "/documents/1", {"data": "a"})
+        self.coalescer.add("PUT", "/documents/2", {"data": "b"})
+        resource, entries = self.coalescer.pop()
+        self.assertEqual(resource, "/documents/1")
+        self.coalescer.restore(resource, entries)
+        self.assertEqual(self.coalescer.oldest(), "/documents/1")
+
+
+class TestCoalescedWrites(TestCase):
+    def setUp(self):
+        patcher = patch(
+            "common.hooks.KERNEL_COALESCER",
+            WriteCoalescer(["/journals/{id}"], max_buffered=100),
+        )
+        self.coalescer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("common.hooks._kernel_connect")
+    def test_sends_coalesced_writes_at_the_end(self, mk_kernel_connect):
+        with hooks.coalesced_writes():
+            hooks.kernel_connect("/journals/1", "PATCH", {"title": "a"})
+            response = hooks.kernel_connect("/journals/1", "PATCH", {"title": "b"})
+            self.assertEqual(response.status_code, 202)
+            mk_kernel_connect.assert_not_called()
+        mk_kernel_connect.assert_called_once_with(
+            "/journals/1", "PATCH", {"title": "b"}, hooks.DEFAULT_HEADER, 1
+        )
+
+    @patch("common.hooks._kernel_connect")
+    def test_reads_flush_the_resource_first(self, mk_kernel_connect):
+        with hooks.coalesced_writes():
+            hooks.kernel_connect("/journals/1", "PUT", {"title": "a"})
+            hooks.kernel_connect("/journals/2", "PUT", {"title": "b"})
+            hooks.kernel_connect("/journals/1", "GET")
+            self.assertEqual(
+                [call[0][:2] for call in mk_kernel_connect.call_args_list],
+                [("/journals/1", "PUT"), ("/journals/1", "GET")],
+            )
+
+    @patch("common.hooks._kernel_connect")
+    def test_flushes_oldest_resource_above_the_threshold(self, mk_kernel_connect):
+        self.coalescer.max_buffered = 1
+        with hooks.coalesced_writes():
+            hooks.kernel_connect("/journals/1", "PUT", {"title": "a"})
+            hooks.kernel_connect("/journals/2", "PUT", {"title": "b"})
+            mk_kernel_connect.assert_called_once()
+
+    @patch("common.hooks._kernel_connect")
+    def test_reports_rejected_resources(self, mk_kernel_connect):
+        mk_kernel_connect.side_effect = requests.HTTPError(
+            response=make_response(400)
+        )
+        with hooks.coalesced_writes() as writes:
+            hooks.kernel_connect("/journals/1", "PUT", {"title": "a"})
+        self.assertEqual(writes.rejected, {"/journals/1"})
+
+    @patch("common.hooks._kernel_connect")
+    def test_strict_raises_rejections(self, mk_kernel_connect):
+        mk_kernel_connect.side_effect = requests.HTTPError(
+            response=make_response(400)
+        )
+        with self.assertRaises(requests.HTTPError):
+            with hooks.coalesced_writes(strict=True):
+                hooks.kernel_connect("/journals/1", "PUT", {"title": "a"})
+
+    @patch("common.hooks._kernel_connect")
+    def test_keeps_writes_on_transient_errors(self, mk_kernel_connect):
+        mk_kernel_connect.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            with hooks.coalesced_writes():
+                hooks.kernel_connect("/journals/1", "PUT", {"title": "a"})
+        self.assertEqual(self.coalescer.buffered(), 1)
+
+    @patch("common.hooks._kernel_connect")
+    def test_flush_kernel_writes_sends_the_resource_immediately(
+        self, mk_kernel_connect
+    ):
+        with hooks.coalesced_writes():
+            hooks.kernel_connect("/documents/1", "PUT", {"data": "a"})
+            hooks.kernel_connect("/documents/2", "PUT", {"data": "b"})
+            hooks.flush_kernel_writes("/documents/1/renditions")
+            self.assertEqual(
+                [call[0][:2] for call in mk_kernel_connect.call_args_list],
+                [("/documents/1", "PUT")],
+            )
+
+
+class TestReportKernelStats(TestCase):
+    def test_pushes_stats_to_xcom(self):
+        mk_ti = MagicMock()
+        report_kernel_stats({"ti": mk_ti})
+        key = mk_ti.xcom_push.call_args[1]["key"]
+        value = mk_ti.xcom_push.call_args[1]["value"]
+        self.assertEqual(key, "kernel_stats")
+        self.assertIn("limiter", value)
+
+
+class TestKernelResponseCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = KernelResponseCache(self.tmpdir.name)
+        self.body = json.dumps({"id": "0034-8910", "items": []}).encode("utf-8")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _prepped(self, url="http://kernel/journals/0034-8910"):
+        return requests.Request("GET", url).prepare()
+
+    def test_is_disabled_without_path(self):
+        self.assertFalse(KernelResponseCache(None).enabled)
+
+    def test_stores_response_with_validators(self):
+        response = make_response(200, self.body, {"ETag": '"abc"'})
+        self.cache.conditional_send(self._prepped(), lambda: response)
+        entry = self.cache.load("http://kernel/journals/0034-8910")
+        self.assertEqual(entry["etag"], '"abc"')
+        self.assertEqual(entry["body"], self.body.decode("utf-8"))
+
+    def test_does_not_store_response_without_validators(self):
+        self.cache.conditional_send(
+            self._prepped(), lambda: make_response(200, self.body)
+        )
+        self.assertIsNone(self.cache.load("http://kernel/journals/0034-8910"))
+
+    def test_sends_conditional_headers(self):
+        response = make_response(
+            200, self.body, {"ETag": '"abc"', "Last-Modified": "Mon, 01 Jul 2019"}
+        )
+        self.cache.conditional_send(self._prepped(), lambda: response)
+        prepped = self._prepped()
+        self.cache.conditional_send(prepped, lambda: make_response(304))
+        self.assertEqual(prepped.headers["If-None-Match"], '"abc"')
+        self.assertEqual(prepped.headers["If-Modified-Since"], "Mon, 01 Jul 2019")
+
+    def test_returns_cached_body_on_not_modified(self):
+        response = make_response(200, self.body, {"ETag": '"abc"'})
+        self.cache.conditional_send(self._prepped(), lambda: response)
+        result = self.cache.conditional_send(
+            self._prepped(), lambda: make_response(304)
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json(), {"id": "0034-8910", "items": []})
+        self.assertEqual(result.headers["X-Cache"], "HIT")
+
+    def test_stats(self):
+        response = make_response(200, self.body, {"ETag": '"abc"'})
+        self.cache.conditional_send(self._prepped(), lambda: response)
+        self.cache.conditional_send(self._prepped(), lambda: make_response(304))
+        self.assertEqual(
+            self.cache.stats(),
+            {
+                "hits": 1,
+                "misses": 1,
+                "hit_ratio": 0.5,
+                "bytes_saved": len(self.body),
+            },
+        )
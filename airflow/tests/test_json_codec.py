@@ -0,0 +1,50 @@
+import os
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from airflow import DAG
+
+from common import json_codec
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class TestJsonCodecs(TestCase):
+    def setUp(self):
+        with open(
+            os.path.join(FIXTURES_PATH, "kernel-journals-1678-4464.json"), "rb"
+        ) as f:
+            self.data = f.read()
+        self.expected = json.loads(self.data)
+
+    def test_stdlib_is_always_available(self):
+        self.assertIn("json", json_codec.CODECS)
+
+    def test_codecs_round_trip_fixtures(self):
+        for codec in json_codec.CODECS.values():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.loads(self.data), self.expected)
+                self.assertEqual(codec.loads(self.data.decode("utf-8")), self.expected)
+                self.assertEqual(json.loads(codec.dumps(self.expected)), self.expected)
+                self.assertEqual(json.loads(codec.dumpb(self.expected)), self.expected)
+
+    def test_dumpb_encodes_utf8(self):
+        for codec in json_codec.CODECS.values():
+            with self.subTest(codec=codec.name):
+                data = codec.dumpb({"title": "Saúde Pública"})
+                self.assertIsInstance(data, bytes)
+                self.assertEqual(
+                    json.loads(data.decode("utf-8")), {"title": "Saúde Pública"}
+                )
+
+    def test_select_codec_falls_back_to_the_fastest(self):
+        fastest = next(iter(json_codec.CODECS.values()))
+        self.assertIs(json_codec.select_codec("missing"), fastest)
+        self.assertIs(json_codec.select_codec(), fastest)
+        self.assertIs(json_codec.select_codec("json"), json_codec.CODECS["json"])
+
+    def test_response_json(self):
+        response = MagicMock(content=b'{"items": []}')
+        self.assertEqual(json_codec.response_json(response), {"items": []})
@@ -3,9 +3,16 @@ import unittest
 from unittest.mock import patch, MagicMock
 import json
 
+import requests
 from airflow import DAG
 
-from sync_kernel_to_website import JournalFactory
+from sync_kernel_to_website import (
+    JournalFactory,
+    changes,
+    register_documents,
+    stream_data,
+)
+from common.hooks import RetryBudget
 from operations.kernel_changes_operations import (
     ArticleFactory,
     try_register_documents,
@@ -382,3 +389,141 @@ class RegisterDocumentRenditionsTest(unittest.TestCase):
         )
 
         self.assertEqual(self.documents, orphans)
+
+
+class RegisterDocumentsTests(unittest.TestCase):
+    def setUp(self):
+        self.xcom = {
+            "tasks": [{"id": "/bundles/0034-8910-2019-v53", "task": "get"}],
+            "i_documents": {},
+            "orphan_issues_items": {
+                "0034-8910-2019-v53": [{"id": "67TH7T7CyPPmgtVrGXhWXVs"}]
+            },
+        }
+        self.ti = MagicMock()
+        self.ti.xcom_pull.side_effect = lambda key, task_ids: self.xcom[key]
+
+    @patch("sync_kernel_to_website.Variable")
+    @patch("sync_kernel_to_website.try_register_documents", return_value=[])
+    @patch("sync_kernel_to_website.fetch_bundle_items")
+    @patch("sync_kernel_to_website.mongo_connect")
+    def test_reuses_items_of_orphan_issues_fetched_by_register_issues(
+        self, mk_mongo_connect, mk_fetch_bundle_items, mk_try_register, mk_variable
+    ):
+        mk_variable.get.return_value = []
+        register_documents(ti=self.ti)
+        mk_fetch_bundle_items.assert_not_called()
+        get_relation_data = mk_try_register.call_args[0][1]
+        self.assertEqual(
+            get_relation_data("67TH7T7CyPPmgtVrGXhWXVs"),
+            ("0034-8910-2019-v53", {"id": "67TH7T7CyPPmgtVrGXhWXVs"}),
+        )
+
+    @patch("sync_kernel_to_website.Variable")
+    @patch("sync_kernel_to_website.try_register_documents", return_value=[])
+    @patch("sync_kernel_to_website.fetch_bundle_items")
+    @patch("sync_kernel_to_website.mongo_connect")
+    def test_fetches_items_of_issues_not_fetched_by_register_issues(
+        self, mk_mongo_connect, mk_fetch_bundle_items, mk_try_register, mk_variable
+    ):
+        mk_variable.get.return_value = []
+        mk_fetch_bundle_items.return_value = iter([{"id": "a"}])
+        self.xcom["orphan_issues_items"] = None
+        register_documents(ti=self.ti)
+        mk_fetch_bundle_items.assert_called_once_with("0034-8910-2019-v53")
+
+
+class ChangesTests(unittest.TestCase):
+    @patch("sync_kernel_to_website.fetch_changes")
+    def test_changes_follows_the_last_timestamp(self, mk_fetch_changes):
+        mk_fetch_changes.side_effect = [
+            iter([{"id": "/documents/1", "timestamp": "t1"}]),
+            iter([{"id": "/documents/2", "timestamp": "t2"}]),
+            iter([]),
+        ]
+        result = [change["id"] for change in changes(since="t0")]
+        self.assertEqual(result, ["/documents/1", "/documents/2"])
+        self.assertEqual(
+            [call[0][0] for call in mk_fetch_changes.call_args_list],
+            ["t0", "t1", "t2"],
+        )
+
+    @patch("sync_kernel_to_website.time.sleep")
+    @patch("sync_kernel_to_website.fetch_changes")
+    def test_changes_resumes_interrupted_stream_from_the_last_change(
+        self, mk_fetch_changes, mk_sleep
+    ):
+        def interrupted():
+            yield {"id": "/documents/1", "timestamp": "t1"}
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+        mk_fetch_changes.side_effect = [
+            interrupted(),
+            iter([{"id": "/documents/2", "timestamp": "t2"}]),
+            iter([]),
+        ]
+        with patch("sync_kernel_to_website.RETRY_BUDGET", RetryBudget(0, 1)):
+            result = [change["id"] for change in changes(since="t0")]
+        self.assertEqual(result, ["/documents/1", "/documents/2"])
+        self.assertEqual(
+            [call[0][0] for call in mk_fetch_changes.call_args_list],
+            ["t0", "t1", "t2"],
+        )
+
+    @patch("sync_kernel_to_website.time.sleep")
+    @patch("sync_kernel_to_website.fetch_changes")
+    def test_changes_raises_interruptions_when_budget_is_exhausted(
+        self, mk_fetch_changes, mk_sleep
+    ):
+        mk_fetch_changes.side_effect = requests.exceptions.ConnectionError()
+        with patch("sync_kernel_to_website.RETRY_BUDGET", RetryBudget(0, 1)):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                list(changes(since="t0"))
+        self.assertEqual(mk_fetch_changes.call_count, 2)
+
+    @patch("sync_kernel_to_website.time.sleep")
+    @patch("sync_kernel_to_website.fetch_changes")
+    def test_changes_waits_exponentially_before_resuming(
+        self, mk_fetch_changes, mk_sleep
+    ):
+        def interrupted():
+            yield {"id": "/documents/1", "timestamp": "t1"}
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+        mk_fetch_changes.side_effect = [
+            requests.exceptions.ConnectionError(),
+            requests.exceptions.ConnectionError(),
+            requests.exceptions.ConnectionError(),
+            interrupted(),
+            iter([]),
+        ]
+        with patch("sync_kernel_to_website.RETRY_BUDGET", RetryBudget(0, 10)):
+            result = [change["id"] for change in changes(since="t0")]
+        self.assertEqual(result, ["/documents/1"])
+        # A espera é reiniciada após o recebimento de uma nova mudança
+        self.assertEqual(
+            [call[0][0] for call in mk_sleep.call_args_list], [1, 2, 4, 1]
+        )
+
+    @patch("sync_kernel_to_website.time.sleep")
+    @patch("sync_kernel_to_website.fetch_changes")
+    def test_changes_limits_the_wait_before_resuming(
+        self, mk_fetch_changes, mk_sleep
+    ):
+        mk_fetch_changes.side_effect = [requests.exceptions.ConnectionError()] * 8 + [
+            iter([])
+        ]
+        with patch("sync_kernel_to_website.RETRY_BUDGET", RetryBudget(0, 10)):
+            list(changes(since="t0"))
+        self.assertEqual(mk_sleep.call_args_list[-1][0][0], 60)
+
+    @patch("sync_kernel_to_website.open_stream")
+    def test_stream_data_yields_items_and_closes_response(self, mk_open_stream):
+        response = mk_open_stream.return_value.__enter__.return_value
+        response.iter_content.return_value = [
+            b'{"items": [{"id": "a"}',
+            b', {"id": "b"}]}',
+        ]
+        items = list(stream_data("/bundles/0034-8910-2014-v48-n2", "items"))
+        self.assertEqual(items, [{"id": "a"}, {"id": "b"}])
+        mk_open_stream.return_value.__exit__.assert_called_once()
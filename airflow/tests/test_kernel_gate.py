@@ -2,12 +2,16 @@ import os
 import json
 import unittest
 import tempfile
+from unittest.mock import patch
 
+import requests
 from airflow import DAG
+from airflow.exceptions import AirflowException
 from xylose.scielodocument import Issue
 
 from sync_isis_to_kernel import (
     mount_journals_issues_link,
+    update_journals_and_issues_link,
     issue_data_to_link,
     create_journal_issn_index
 )
@@ -112,6 +116,65 @@ class UpdateJournalAndIssueLink(unittest.TestCase):
 
         self.assertDictEqual(journals_issues_link, {})
 
+    @patch("sync_isis_to_kernel.hooks.KernelHttpHook")
+    @patch("sync_isis_to_kernel.hooks.http_hook_run")
+    def test_update_journals_and_issues_link_uses_http_hook_run(
+        self, mk_http_hook_run, MockKernelHttpHook
+    ):
+        issues = [{"id": "1678-4464-2018-v1-n1", "order": "1001"}]
+        mk_http_hook_run.return_value.json.return_value = {"items": []}
+        update_journals_and_issues_link({"1678-4464": issues})
+        self.assertEqual(
+            [call[0][1:3] for call in mk_http_hook_run.call_args_list],
+            [("GET", "/journals/1678-4464"), ("PUT", "/journals/1678-4464/issues")],
+        )
+        self.assertEqual(
+            json.loads(mk_http_hook_run.call_args[1]["data"]), issues
+        )
+
+    @patch("sync_isis_to_kernel.hooks.KernelHttpHook")
+    @patch("sync_isis_to_kernel.hooks.http_hook_run")
+    def test_update_journals_and_issues_link_skips_missing_journals(
+        self, mk_http_hook_run, MockKernelHttpHook
+    ):
+        MockKernelHttpHook.return_value.check_response.side_effect = (
+            AirflowException("404:NOT FOUND")
+        )
+        update_journals_and_issues_link({"1678-4464": []})
+        mk_http_hook_run.assert_called_once()
+
+    @patch("sync_isis_to_kernel.hooks.KernelHttpHook")
+    @patch("sync_isis_to_kernel.hooks.http_hook_run")
+    def test_update_journals_and_issues_link_waits_for_the_configured_timeout(
+        self, mk_http_hook_run, MockKernelHttpHook
+    ):
+        mk_http_hook_run.return_value.json.return_value = {"items": []}
+        with patch("sync_isis_to_kernel.hooks.KERNEL_JOURNAL_LINK_TIMEOUT", 120):
+            update_journals_and_issues_link({"1678-4464": [{"id": "1"}]})
+        self.assertEqual(
+            [call[1]["timeout"] for call in mk_http_hook_run.call_args_list],
+            [120, 120],
+        )
+
+    @patch("sync_isis_to_kernel.hooks.KernelHttpHook")
+    @patch("sync_isis_to_kernel.hooks.http_hook_run")
+    def test_update_journals_and_issues_link_skips_journals_that_time_out(
+        self, mk_http_hook_run, MockKernelHttpHook
+    ):
+        response = mk_http_hook_run.return_value
+        response.json.return_value = {"items": []}
+        mk_http_hook_run.side_effect = [
+            requests.exceptions.Timeout(),
+            response,
+            response,
+        ]
+        update_journals_and_issues_link(
+            {"1678-4464": [{"id": "1"}], "0034-8910": [{"id": "2"}]}
+        )
+        self.assertEqual(
+            mk_http_hook_run.call_args[0][2], "/journals/0034-8910/issues"
+        )
+
 
 class TestSaveJournalIssnIndex(unittest.TestCase):
 
@@ -137,20 +200,18 @@ class TestSaveJournalIssnIndex(unittest.TestCase):
                 "electronic_issn": "0004-000X",
             },
         ]
-        expected = json.dumps(
-            {
-                "0001-0001": "0001-0001",
-                "0001-000X": "0001-0001",
-                "0002-0001": "0002-0001",
-                "0002-0002": "0002-0001",
-                "0002-000X": "0002-0001",
-                "0003-000X": "0003-000X",
-                "0003-0001": "0003-000X",
-                "0004-000X": "0004-000X",
-            }
-        )
+        expected = {
+            "0001-0001": "0001-0001",
+            "0001-000X": "0001-0001",
+            "0002-0001": "0002-0001",
+            "0002-0002": "0002-0001",
+            "0002-000X": "0002-0001",
+            "0003-000X": "0003-000X",
+            "0003-0001": "0003-000X",
+            "0004-000X": "0004-000X",
+        }
         with tempfile.TemporaryDirectory() as tmpdirname:
             create_journal_issn_index(tmpdirname, self.journals)
             with open(os.path.join(tmpdirname, "issn_index.json")) as index_file:
-                result = index_file.read()
+                result = json.loads(index_file.read())
                 self.assertEqual(result, expected)
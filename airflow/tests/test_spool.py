@@ -0,0 +1,170 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import requests
+from airflow import DAG
+
+from common.spool import WriteSpool, is_rejected, main, resource_path
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+class TestResourcePath(TestCase):
+    def test_returns_main_resource_of_endpoint(self):
+        self.assertEqual(
+            resource_path("/documents/S0034/renditions"), "/documents/S0034"
+        )
+        self.assertEqual(resource_path("/bundles/0034-8910"), "/bundles/0034-8910")
+
+
+class TestIsRejected(TestCase):
+    def test_client_errors_are_rejections(self):
+        self.assertTrue(is_rejected(http_error(400)))
+
+    def test_server_errors_and_connection_errors_are_transient(self):
+        self.assertFalse(is_rejected(http_error(503)))
+        self.assertFalse(is_rejected(http_error(429)))
+        self.assertFalse(is_rejected(requests.ConnectionError()))
+
+
+class TestWriteSpool(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.spool = WriteSpool(self.path, fsync=False)
+
+    def test_pending_writes_survive_a_restart(self):
+        self.spool.enqueue("PUT", "/documents/1", {"data": "x"})
+        self.spool.enqueue("PATCH", "/documents/1/renditions", {"lang": "en"})
+        reloaded = WriteSpool(self.path, fsync=False)
+        self.assertEqual(
+            [(e["method"], e["endpoint"]) for e in reloaded.pending()],
+            [("PUT", "/documents/1"), ("PATCH", "/documents/1/renditions")],
+        )
+        self.assertEqual(reloaded.enqueue("DELETE", "/documents/2"), 3)
+
+    def test_ignores_truncated_records(self):
+        self.spool.enqueue("PUT", "/documents/1", {"data": "x"})
+        with open(self.spool.log_path, "a") as f:
+            f.write('{"seq": 2, "meth')
+        self.assertEqual(len(WriteSpool(self.path, fsync=False).pending()), 1)
+
+    def test_drain_sends_writes_of_a_resource_in_order(self):
+        sent = []
+        lock = threading.Lock()
+
+        def _send(entry):
+            with lock:
+                sent.append(entry["endpoint"])
+
+        for i in range(3):
+            self.spool.enqueue("PUT", "/documents/%d" % i)
+            self.spool.enqueue("PATCH", "/documents/%d/renditions" % i)
+        self.spool.drain(_send, workers=3)
+
+        for i in range(3):
+            self.assertLess(
+                sent.index("/documents/%d" % i),
+                sent.index("/documents/%d/renditions" % i),
+            )
+        self.assertEqual(self.spool.stats()["depth"], 0)
+        self.assertEqual(self.spool.stats()["sent"], 6)
+        self.assertEqual(WriteSpool(self.path, fsync=False).pending(), [])
+
+    def test_transient_failure_keeps_the_remaining_writes_of_the_resource(self):
+        send = MagicMock(side_effect=[requests.ConnectionError(), None])
+        self.spool.enqueue("PUT", "/documents/1")
+        self.spool.enqueue("PATCH", "/documents/1/renditions")
+        self.spool.enqueue("PUT", "/documents/2")
+        self.spool.drain(send)
+        self.assertEqual(
+            [e["endpoint"] for e in self.spool.pending()],
+            ["/documents/1", "/documents/1/renditions"],
+        )
+        self.assertEqual(self.spool.stats()["failed"], 1)
+
+    def test_rejected_writes_are_removed_and_returned(self):
+        send = MagicMock(side_effect=[http_error(400), None])
+        self.spool.enqueue("PUT", "/documents/1")
+        self.spool.enqueue("PUT", "/documents/2")
+        rejected = self.spool.drain(send)
+        self.assertEqual([e["endpoint"] for e in rejected], ["/documents/1"])
+        self.assertEqual(self.spool.pending(), [])
+        self.assertEqual(self.spool.stats()["rejected"], 1)
+
+    def test_drain_only_the_given_resource(self):
+        send = MagicMock()
+        self.spool.enqueue("PUT", "/documents/1")
+        self.spool.enqueue("PUT", "/bundles/1/documents")
+        self.spool.drain(send, resource="/bundles/1")
+        self.assertEqual(send.call_args[0][0]["endpoint"], "/bundles/1/documents")
+        self.assertEqual(len(self.spool.pending()), 1)
+
+    def test_spools_sharing_a_directory_keep_each_others_writes(self):
+        other = WriteSpool(self.path, fsync=False)
+        seqs = {
+            self.spool.enqueue("PUT", "/documents/1"),
+            other.enqueue("PUT", "/documents/2"),
+        }
+        self.assertEqual(len(seqs), 2)
+
+        other.drain(MagicMock())
+        self.assertEqual(
+            [e["endpoint"] for e in WriteSpool(self.path, fsync=False).pending()],
+            ["/documents/1"],
+        )
+
+        self.spool.drain(MagicMock())
+        self.assertEqual(WriteSpool(self.path, fsync=False).pending(), [])
+        self.assertGreater(self.spool.enqueue("PUT", "/documents/3"), max(seqs))
+
+    def test_writes_already_sent_by_another_spool_are_not_replayed(self):
+        self.spool.enqueue("PUT", "/documents/X", {"v": 1})
+        other = WriteSpool(self.path, fsync=False)
+        self.spool.drain(MagicMock())
+        self.spool.enqueue("PUT", "/documents/X", {"v": 2})
+        self.spool.drain(MagicMock())
+        send = MagicMock()
+        other.drain(send)
+        send.assert_not_called()
+
+    def test_does_not_send_writes_of_other_running_processes(self):
+        other = WriteSpool(self.path, fsync=False)
+        other.enqueue("PUT", "/documents/1", {"v": 1})
+        self.spool.enqueue("PUT", "/documents/1", {"v": 2})
+        self.spool.enqueue("PUT", "/documents/2")
+        send = MagicMock()
+        self.spool.drain(send)
+        # A escrita de /documents/1 aguarda a escrita anterior do outro processo
+        self.assertEqual(
+            [call[0][0]["endpoint"] for call in send.call_args_list],
+            ["/documents/2"],
+        )
+        self.assertEqual(len(self.spool.pending(own=True)), 1)
+
+    @patch("common.spool.owner_is_alive", return_value=False)
+    def test_claims_writes_of_finished_processes(self, mk_owner_is_alive):
+        WriteSpool(self.path, fsync=False).enqueue("PUT", "/documents/1")
+        send = MagicMock()
+        self.spool.drain(send)
+        send.assert_called_once()
+        self.assertEqual(self.spool.pending(), [])
+
+    def test_creating_a_spool_does_not_touch_the_directory(self):
+        path = os.path.join(self.path, "spool")
+        spool = WriteSpool(path, fsync=False)
+        self.assertFalse(os.path.exists(path))
+        spool.enqueue("PUT", "/documents/1")
+        self.assertEqual(len(spool.pending()), 1)
+
+    def test_status_command_returns_error_while_writes_are_pending(self):
+        self.spool.enqueue("PUT", "/documents/1")
+        self.assertEqual(main(["status", "--path", self.path]), 1)
+        self.spool.drain(MagicMock())
+        self.assertEqual(main(["status", "--path", self.path]), 0)
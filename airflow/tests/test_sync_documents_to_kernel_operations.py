@@ -3,6 +3,7 @@ import copy
 import tempfile
 import builtins
 import json
+import threading
 from unittest import TestCase, main
 from unittest.mock import patch, Mock
 
@@ -12,6 +13,7 @@ from operations.sync_documents_to_kernel_operations import (
     list_documents,
     delete_documents,
     register_update_documents,
+    register_update_documents_pipeline,
     link_documents_to_documentsbundle,
 )
 from operations.exceptions import (
@@ -507,6 +509,162 @@ class TestRegisterUpdateDocuments(TestCase):
         result = register_update_documents(**self.kwargs)
         self.assertEqual(result, expected)
 
+    @patch("operations.sync_documents_to_kernel_operations.spooled_writes")
+    @patch(
+        "operations.sync_documents_to_kernel_operations.register_update_doc_into_kernel"
+    )
+    @patch(
+        "operations.sync_documents_to_kernel_operations.put_assets_and_pdfs_in_object_store"
+    )
+    @patch("operations.sync_documents_to_kernel_operations.put_xml_into_object_store")
+    @patch("operations.sync_documents_to_kernel_operations.ZipFile")
+    def test_register_update_documents_removes_documents_rejected_by_spool(
+        self,
+        MockZipFile,
+        mk_put_xml_into_object_store,
+        mk_put_assets_and_pdfs_in_object_store,
+        mk_register_update_doc_into_kernel,
+        mk_spooled_writes,
+    ):
+        spool = mk_spooled_writes.return_value.__enter__.return_value
+        spool.rejected = {"/documents/GZ5K2cbyYmmwvtGmMB71243"}
+        mk_put_xml_into_object_store.side_effect = self.xmls_data
+
+        result = register_update_documents(**self.kwargs)
+        self.assertEqual(result, [self.xmls_data[0], self.xmls_data[2]])
+
+    @patch(
+        "operations.sync_documents_to_kernel_operations.register_update_doc_into_kernel"
+    )
+    @patch(
+        "operations.sync_documents_to_kernel_operations.put_assets_and_pdfs_in_object_store"
+    )
+    @patch("operations.sync_documents_to_kernel_operations.put_xml_into_object_store")
+    @patch("operations.sync_documents_to_kernel_operations.ZipFile")
+    def test_register_update_documents_does_not_coalesce_writes(
+        self,
+        MockZipFile,
+        mk_put_xml_into_object_store,
+        mk_put_assets_and_pdfs_in_object_store,
+        mk_register_update_doc_into_kernel,
+    ):
+        from common import hooks
+
+        sessions = []
+        mk_register_update_doc_into_kernel.side_effect = (
+            lambda *args: sessions.append(hooks._COALESCE_SESSION)
+        )
+        mk_put_xml_into_object_store.side_effect = self.xmls_data
+
+        register_update_documents(**self.kwargs)
+        self.assertEqual(sessions, [None] * len(self.xmls_data))
+
+
+class TestRegisterUpdateDocumentsPipeline(TestCase):
+    def setUp(self):
+        self.xmls = ["a.xml", "b.xml", "c.xml"]
+        self.release_a = threading.Event()
+        self.registered = []
+
+        def put_xml(zipfile, xml_filename):
+            if xml_filename == "b.xml":
+                raise PutXMLInObjectStoreException("invalid XML")
+            return {
+                "scielo_id": xml_filename[0],
+                "assets": [{"asset_id": xml_filename[0] + ".jpg"}],
+                "pdfs": [],
+            }
+
+        def uploads(zipfile, xml_data):
+            if xml_data["scielo_id"] == "a":
+                # Os arquivos de "a" são persistidos após o registro de "c"
+                return [lambda: self.release_a.wait(1) and {"asset_id": "a.jpg"}]
+            return [lambda: {"asset_id": "c.jpg"}]
+
+        def register(document_metadata):
+            self.registered.append(document_metadata)
+            self.release_a.set()
+
+        for target, side_effect in (
+            ("put_xml_into_object_store", put_xml),
+            ("document_uploads", uploads),
+            ("register_update_doc_into_kernel", register),
+        ):
+            patcher = patch(
+                "operations.sync_documents_to_kernel_operations." + target,
+                side_effect=side_effect,
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch("operations.sync_documents_to_kernel_operations.Logger")
+    def test_registers_each_document_once_its_uploads_complete(self, MockLogger):
+        result = register_update_documents_pipeline(
+            Mock(), "rba_v53n1.zip", self.xmls, workers=3, max_pending=3
+        )
+        self.assertEqual([doc["scielo_id"] for doc in result], ["a", "c"])
+        self.assertEqual(
+            [(doc["scielo_id"], doc["assets"]) for doc in self.registered],
+            [("c", [{"asset_id": "c.jpg"}]), ("a", [{"asset_id": "a.jpg"}])],
+        )
+        MockLogger.info.assert_any_call(
+            'Could not put document "%s" in object store: %s',
+            "b.xml",
+            "invalid XML",
+        )
+
+    @patch("operations.sync_documents_to_kernel_operations.flush_kernel_writes")
+    def test_defer_media_registers_before_media_uploads_complete(
+        self, mk_flush_kernel_writes
+    ):
+        video_stored = threading.Event()
+        pdf = {"lang": "en", "filename": "d.pdf", "url": "http://minio/d.pdf"}
+        xml_data = {
+            "scielo_id": "d",
+            "assets": [{"asset_id": "d-g01.jpg"}, {"asset_id": "d-v01.mp4"}],
+            "pdfs": [{"lang": "en", "filename": "d.pdf"}],
+        }
+        self.release_a.clear()
+
+        def video():
+            # O vídeo é persistido somente após o registro do documento
+            self.release_a.wait(1)
+            video_stored.set()
+            return {"asset_id": "d-v01.mp4"}
+
+        with patch(
+            "operations.sync_documents_to_kernel_operations.put_xml_into_object_store",
+            return_value=xml_data,
+        ), patch(
+            "operations.sync_documents_to_kernel_operations.document_uploads",
+            return_value=[lambda: {"asset_id": "d-g01.jpg"}, video, lambda: pdf],
+        ):
+            result = register_update_documents_pipeline(
+                Mock(), "rba.zip", ["d.xml"], workers=2, max_pending=4, defer_media=True
+            )
+
+        self.assertEqual(result, [xml_data])
+        self.assertTrue(video_stored.is_set())
+        # O registro antecipado é enviado ao Kernel sem aguardar o final do
+        # pacote
+        mk_flush_kernel_writes.assert_called_once_with("/documents/d")
+        self.assertEqual(
+            [(doc["assets"], doc["pdfs"]) for doc in self.registered],
+            [
+                ([{"asset_id": "d-g01.jpg"}], [pdf]),
+                ([{"asset_id": "d-g01.jpg"}, {"asset_id": "d-v01.mp4"}], [pdf]),
+            ],
+        )
+
+    @patch(
+        "operations.sync_documents_to_kernel_operations.OBJECT_STORE_PACKAGE_WORKERS",
+        4,
+    )
+    @patch("operations.sync_documents_to_kernel_operations.ZipFile")
+    def test_register_update_documents_uses_the_pipeline(self, MockZipFile):
+        result = register_update_documents("rba_v53n1.zip", self.xmls)
+        self.assertEqual([doc["scielo_id"] for doc in result], ["a", "c"])
+
 
 class TestLinkDocumentToDocumentsbundle(TestCase):
     def setUp(self):
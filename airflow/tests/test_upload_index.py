@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from airflow import DAG
+
+from common.upload_index import UploadIndex
+
+
+class TestUploadIndex(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "index.sqlite")
+        self.now = 1000.0
+        self.index = UploadIndex(self.path, clock=lambda: self.now)
+        self.addCleanup(self.index.close)
+
+    def test_lookup_returns_none_for_unknown_keys(self):
+        self.assertIsNone(self.index.lookup("documentstore", "0034/S0034/a.xml"))
+        self.assertEqual(self.index.stats()["misses"], 1)
+
+    def test_lookup_returns_the_stored_url(self):
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml", 10)
+        self.assertEqual(
+            self.index.lookup("documentstore", "0034/S0034/a.xml"),
+            "http://minio/a.xml",
+        )
+        self.assertIsNone(self.index.lookup("other", "0034/S0034/a.xml"))
+
+    def test_entries_survive_reopening_the_index(self):
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        self.index.close()
+        index = UploadIndex(self.path)
+        self.addCleanup(index.close)
+        self.assertEqual(
+            index.lookup("documentstore", "0034/S0034/a.xml"), "http://minio/a.xml"
+        )
+
+    def test_recently_verified_entries_are_not_checked(self):
+        self.index.verify_after = 60
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        exists = MagicMock(return_value=False)
+        self.now += 30
+        self.assertEqual(
+            self.index.lookup("documentstore", "0034/S0034/a.xml", exists=exists),
+            "http://minio/a.xml",
+        )
+        exists.assert_not_called()
+
+    def test_old_entries_are_checked_against_the_bucket(self):
+        self.index.verify_after = 60
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        self.now += 120
+        exists = MagicMock(return_value=True)
+        self.assertEqual(
+            self.index.lookup("documentstore", "0034/S0034/a.xml", exists=exists),
+            "http://minio/a.xml",
+        )
+        exists.assert_called_once_with("documentstore", "0034/S0034/a.xml")
+        self.now += 30
+        self.index.lookup("documentstore", "0034/S0034/a.xml", exists=exists)
+        exists.assert_called_once()
+        self.assertEqual(self.index.stats()["verified"], 1)
+
+    def test_objects_missing_from_the_bucket_are_discarded(self):
+        self.index.verify_after = 60
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        self.now += 120
+        exists = MagicMock(return_value=False)
+        self.assertIsNone(
+            self.index.lookup("documentstore", "0034/S0034/a.xml", exists=exists)
+        )
+        self.assertEqual(self.index.stats()["size"], 0)
+        self.assertEqual(self.index.stats()["stale"], 1)
+
+    def test_verify_returns_missing_objects(self):
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        self.index.add("documentstore", "0034/S0034/b.pdf", "http://minio/b.pdf")
+        missing = self.index.verify(lambda bucket, key: key.endswith(".xml"))
+        self.assertEqual(missing, [("documentstore", "0034/S0034/b.pdf")])
+        self.assertEqual(self.index.entries(), [("documentstore", "0034/S0034/a.xml")])
+
+    def test_has_prefix(self):
+        self.index.add("documentstore", "0034/S0034/a.xml", "http://minio/a.xml")
+        self.assertTrue(self.index.has_prefix("documentstore", "0034/S0034/"))
+        self.assertFalse(self.index.has_prefix("documentstore", "0034/S0035/"))
+        self.assertFalse(self.index.has_prefix("other", "0034/S0034/"))
+
+    def test_objects_are_verified_at_their_location(self):
+        self.index.verify_after = 60
+        self.index.add(
+            "documentstore",
+            "0034/S0034/a.xml",
+            "http://minio/documentstore/ab/0034/S0034/a.xml",
+            location="ab/0034/S0034/a.xml",
+        )
+        self.now += 120
+        exists = MagicMock(return_value=True)
+        self.index.lookup("documentstore", "0034/S0034/a.xml", exists=exists)
+        exists.assert_called_once_with("documentstore", "ab/0034/S0034/a.xml")
+        exists.reset_mock()
+        self.index.verify(exists)
+        exists.assert_called_once_with("documentstore", "ab/0034/S0034/a.xml")
+
+    def test_adds_location_column_to_existing_indexes(self):
+        path = os.path.join(tempfile.mkdtemp(), "index.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE objects (bucket TEXT NOT NULL, key TEXT NOT NULL,"
+            " url TEXT NOT NULL, size INTEGER, stored_at REAL NOT NULL,"
+            " verified_at REAL NOT NULL, PRIMARY KEY (bucket, key))"
+        )
+        conn.execute(
+            "INSERT INTO objects VALUES ('documentstore', 'a.xml', 'http://a', 1, 0, 0)"
+        )
+        conn.commit()
+        conn.close()
+        index = UploadIndex(path, verify_after=1, clock=lambda: 10)
+        self.addCleanup(index.close)
+        exists = MagicMock(return_value=True)
+        self.assertEqual(index.lookup("documentstore", "a.xml", exists=exists), "http://a")
+        exists.assert_called_once_with("documentstore", "a.xml")
@@ -0,0 +1,482 @@
+"""Servidor local que simula a API do Kernel para testes de carga das DAGs.
+
+Implementa, com armazenamento em memória, os endpoints utilizados pelas
+DAGs de ingestão e de espelhamento do site:
+
+    /documents/{id}, /documents/{id}/front, /documents/{id}/renditions,
+    /bundles/{id}, /bundles/{id}/documents, /journals/{id},
+    /journals/{id}/issues e /changes
+
+A latência das respostas, a taxa de erros e o tamanho das páginas de
+`/changes` são configuráveis, o que permite medir localmente o efeito das
+políticas de concorrência, cache e novas tentativas dos hooks. As respostas
+GET trazem os validadores `ETag` e `Last-Modified` e as requisições
+condicionais (`If-None-Match` e `If-Modified-Since`) recebem
+`304 Not Modified` caso o recurso não tenha sido alterado. Uso:
+
+    python utils/fake_kernel.py --port 6543 --latency-dist lognormal \\
+        --latency 0.05 --error-rate 0.01
+
+A conexão `kernel_conn` do Airflow deve então apontar para
+`http://localhost:6543`.
+"""
+import re
+import gzip
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def fixed(seconds):
+    return lambda rng: seconds
+
+
+def exponential(mean):
+    return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0
+
+
+def lognormal(median, sigma=0.5):
+    return lambda rng: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0
+
+
+LATENCY_DISTRIBUTIONS = {
+    "fixed": fixed,
+    "exponential": exponential,
+    "lognormal": lognormal,
+}
+
+
+class FakeKernelConfig:
+    """Parâmetros de comportamento do servidor.
+
+    `latency` é uma função que recebe um `random.Random` e retorna os
+    segundos de espera de cada resposta (ver `fixed`, `exponential` e
+    `lognormal`). Uma fração `error_rate` das requisições recebe
+    `error_status`. `/changes` retorna no máximo `page_size` mudanças por
+    página.
+    """
+
+    def __init__(
+        self, latency=None, error_rate=0.0, error_status=503, page_size=500, seed=None
+    ):
+        self.latency = latency or fixed(0)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            return self.latency(self.random)
+
+    def fail(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+
+class FakeKernelStore:
+    """Armazenamento em memória dos documentos, bundles, periódicos e do
+    registro de mudanças."""
+
+    def __init__(self):
+        self.documents = {}
+        self.fronts = {}
+        self.renditions = {}
+        self.bundles = {}
+        self.journals = {}
+        self.changes = []
+        self.modified = {}
+        self._last_timestamp = None
+        self._lock = threading.RLock()
+
+    def _now(self):
+        # Os timestamps de /changes devem ser únicos e crescentes
+        with self._lock:
+            now = datetime.utcnow()
+            if self._last_timestamp is not None and now <= self._last_timestamp:
+                now = self._last_timestamp + timedelta(microseconds=1)
+            self._last_timestamp = now
+            return now
+
+    def _timestamp(self):
+        return self._now().isoformat(timespec="microseconds") + "Z"
+
+    def record_change(self, entity_id, deleted=False):
+        with self._lock:
+            now = self._now()
+            # As alterações de `/documents/{id}/renditions` alteram o documento
+            self.modified["/".join(entity_id.split("/")[:3])] = now
+            change = {
+                "timestamp": now.isoformat(timespec="microseconds") + "Z",
+                "id": entity_id,
+            }
+            if deleted:
+                change["deleted"] = True
+            self.changes.append(change)
+            return change
+
+    def last_modified(self, path):
+        """Data da última alteração do recurso ao qual `path` se refere."""
+        with self._lock:
+            return self.modified.get("/".join(path.split("/")[:3]))
+
+    def changes_since(self, since, limit):
+        with self._lock:
+            return [c for c in self.changes if c["timestamp"] > since][:limit]
+
+    def put_document(self, document_id, payload, front=None):
+        with self._lock:
+            self.documents[document_id] = payload
+            self.fronts[document_id] = front or {
+                "article_meta": [{"article_publisher_id": [document_id]}]
+            }
+            # Uma nova versão do documento não possui renditions
+            self.renditions[document_id] = []
+            self.record_change("/documents/%s" % document_id)
+
+    def put_bundle(self, bundle_id, metadata=None, items=None):
+        with self._lock:
+            bundle = self.bundles.setdefault(
+                bundle_id, {"id": bundle_id, "metadata": {}, "items": []}
+            )
+            bundle["metadata"].update(metadata or {})
+            if items is not None:
+                bundle["items"] = items
+            bundle["updated"] = self._timestamp()
+            self.record_change("/bundles/%s" % bundle_id)
+
+    def put_journal(self, journal_id, metadata=None, items=None):
+        with self._lock:
+            journal = self.journals.setdefault(
+                journal_id, {"id": journal_id, "metadata": {}, "items": []}
+            )
+            journal["metadata"].update(metadata or {})
+            if items is not None:
+                journal["items"] = items
+            journal["updated"] = self._timestamp()
+            self.record_change("/journals/%s" % journal_id)
+
+
+class FakeKernelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("GET", r"/documents/(?P<id>[^/]+)", "get_document"),
+        ("PUT", r"/documents/(?P<id>[^/]+)", "put_document"),
+        ("DELETE", r"/documents/(?P<id>[^/]+)", "delete_document"),
+        ("GET", r"/documents/(?P<id>[^/]+)/front", "get_front"),
+        ("GET", r"/documents/(?P<id>[^/]+)/renditions", "get_renditions"),
+        ("PATCH", r"/documents/(?P<id>[^/]+)/renditions", "patch_renditions"),
+        ("GET", r"/bundles/(?P<id>[^/]+)", "get_bundle"),
+        ("PUT", r"/bundles/(?P<id>[^/]+)", "put_bundle"),
+        ("PATCH", r"/bundles/(?P<id>[^/]+)", "put_bundle"),
+        ("DELETE", r"/bundles/(?P<id>[^/]+)", "delete_bundle"),
+        ("PUT", r"/bundles/(?P<id>[^/]+)/documents", "put_bundle_documents"),
+        ("GET", r"/journals/(?P<id>[^/]+)", "get_journal"),
+        ("PUT", r"/journals/(?P<id>[^/]+)", "put_journal"),
+        ("PATCH", r"/journals/(?P<id>[^/]+)", "put_journal"),
+        ("DELETE", r"/journals/(?P<id>[^/]+)", "delete_journal"),
+        ("GET", r"/journals/(?P<id>[^/]+)/issues", "get_journal_issues"),
+        ("PUT", r"/journals/(?P<id>[^/]+)/issues", "put_journal_issues"),
+        ("GET", r"/changes", "get_changes"),
+    ]
+    COMPILED_ROUTES = [
+        (method, re.compile(pattern + "/?$"), name) for method, pattern, name in ROUTES
+    ]
+
+    @property
+    def store(self):
+        return self.server.store
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body.decode("utf-8")) if body else None
+
+    def _send(self, status, body=None, content_type="application/json"):
+        if body is None:
+            data = b""
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode("utf-8")
+        if self.command == "GET" and status == 200:
+            validators = self._validators(data)
+            if self._not_modified(*validators):
+                return self._send_not_modified(*validators)
+        else:
+            validators = None
+        if data and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            data = gzip.compress(data)
+            gzipped = True
+        else:
+            gzipped = False
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", content_type)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if validators is not None:
+            self._send_validators(*validators)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _validators(self, data):
+        etag = 'W/"%s"' % hashlib.sha1(data).hexdigest()[:16]
+        modified = self.store.last_modified(urlsplit(self.path).path.rstrip("/"))
+        if modified is not None:
+            modified = modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return etag, modified
+
+    def _not_modified(self, etag, modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or etag in [
+                value.strip() for value in if_none_match.split(",")
+            ]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None or modified is None:
+            return False
+        try:
+            return modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    def _send_validators(self, etag, modified):
+        self.send_header("ETag", etag)
+        if modified is not None:
+            self.send_header("Last-Modified", format_datetime(modified, usegmt=True))
+
+    def _send_not_modified(self, etag, modified):
+        self.send_response(304)
+        self._send_validators(etag, modified)
+        self.end_headers()
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        time.sleep(self.config.delay())
+        # O corpo deve ser lido mesmo nas falhas para manter a conexão
+        body = self._body() if method in ("PUT", "PATCH") else None
+        if self.config.fail():
+            return self._send(self.config.error_status, {"message": "injected error"})
+
+        for route_method, pattern, name in self.COMPILED_ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                return getattr(self, name)(match.groupdict().get("id"), body, query)
+        self._send(405 if self._path_exists(url.path) else 404)
+
+    def _path_exists(self, path):
+        return any(pattern.match(path) for _, pattern, _ in self.COMPILED_ROUTES)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # Documents
+
+    def get_document(self, document_id, body, query):
+        document = self.store.documents.get(document_id)
+        if document is None:
+            return self._send(404)
+        xml = '<article data-url="{}"/>'.format(document.get("data", ""))
+        self._send(200, xml.encode("utf-8"), content_type="text/xml")
+
+    def put_document(self, document_id, body, query):
+        status = 204 if self.store.documents.get(document_id) == body else 201
+        if status == 201:
+            self.store.put_document(document_id, body)
+        self._send(status)
+
+    def delete_document(self, document_id, body, query):
+        if self.store.documents.pop(document_id, None) is None:
+            return self._send(404)
+        self.store.record_change("/documents/%s" % document_id, deleted=True)
+        self._send(204)
+
+    def get_front(self, document_id, body, query):
+        front = self.store.fronts.get(document_id)
+        if front is None:
+            return self._send(404)
+        self._send(200, front)
+
+    def get_renditions(self, document_id, body, query):
+        if document_id not in self.store.documents:
+            return self._send(404)
+        self._send(200, self.store.renditions.get(document_id, []))
+
+    def patch_renditions(self, document_id, body, query):
+        if document_id not in self.store.documents:
+            return self._send(404)
+        renditions = [
+            rendition
+            for rendition in self.store.renditions.get(document_id, [])
+            if rendition.get("lang") != body.get("lang")
+        ]
+        self.store.renditions[document_id] = renditions + [body]
+        self.store.record_change("/documents/%s/renditions" % document_id)
+        self._send(204)
+
+    # Bundles
+
+    def get_bundle(self, bundle_id, body, query):
+        bundle = self.store.bundles.get(bundle_id)
+        if bundle is None:
+            return self._send(404)
+        self._send(200, bundle)
+
+    def put_bundle(self, bundle_id, body, query):
+        status = 204 if bundle_id in self.store.bundles else 201
+        self.store.put_bundle(bundle_id, metadata=body)
+        self._send(status)
+
+    def delete_bundle(self, bundle_id, body, query):
+        if self.store.bundles.pop(bundle_id, None) is None:
+            return self._send(404)
+        self.store.record_change("/bundles/%s" % bundle_id, deleted=True)
+        self._send(204)
+
+    def put_bundle_documents(self, bundle_id, body, query):
+        if bundle_id not in self.store.bundles:
+            return self._send(404)
+        self.store.put_bundle(bundle_id, items=body)
+        self._send(204)
+
+    # Journals
+
+    def get_journal(self, journal_id, body, query):
+        journal = self.store.journals.get(journal_id)
+        if journal is None:
+            return self._send(404)
+        self._send(200, journal)
+
+    def put_journal(self, journal_id, body, query):
+        status = 204 if journal_id in self.store.journals else 201
+        self.store.put_journal(journal_id, metadata=body)
+        self._send(status)
+
+    def delete_journal(self, journal_id, body, query):
+        if self.store.journals.pop(journal_id, None) is None:
+            return self._send(404)
+        self.store.record_change("/journals/%s" % journal_id, deleted=True)
+        self._send(204)
+
+    def get_journal_issues(self, journal_id, body, query):
+        journal = self.store.journals.get(journal_id)
+        if journal is None:
+            return self._send(404)
+        self._send(200, journal["items"])
+
+    def put_journal_issues(self, journal_id, body, query):
+        if journal_id not in self.store.journals:
+            return self._send(404)
+        self.store.put_journal(journal_id, items=body)
+        self._send(204)
+
+    # Changes
+
+    def get_changes(self, _, body, query):
+        since = query.get("since", "")
+        limit = min(int(query.get("limit", self.config.page_size)), self.config.page_size)
+        results = self.store.changes_since(since, limit)
+        self._send(200, {"since": since, "limit": limit, "results": results})
+
+
+class FakeKernelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), config=None, store=None, verbose=False):
+        super().__init__(address, FakeKernelHandler)
+        self.config = config or FakeKernelConfig()
+        self.store = store or FakeKernelStore()
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+
+@contextmanager
+def running_fake_kernel(**kwargs):
+    """Executa um `FakeKernelServer` em uma thread durante o bloco,
+    produzindo o servidor (a URL base está em `server.url`)."""
+    server = FakeKernelServer(**kwargs)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que simula o Kernel.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6543)
+    parser.add_argument(
+        "--latency-dist", choices=sorted(LATENCY_DISTRIBUTIONS), default="fixed"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="segundos (média ou mediana)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = FakeKernelConfig(
+        latency=LATENCY_DISTRIBUTIONS[args.latency_dist](args.latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        page_size=args.page_size,
+        seed=args.seed,
+    )
+    server = FakeKernelServer((args.host, args.port), config=config, verbose=args.verbose)
+    print("Fake Kernel listening on %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
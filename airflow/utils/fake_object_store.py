@@ -0,0 +1,210 @@
+"""Servidor local que simula um object store compatível com S3 para testes de
+carga dos envios das DAGs.
+
+Implementa, com armazenamento em memória, `PUT`, `GET` e `HEAD` de objetos
+em `/{bucket}/{chave}` (endereçamento por caminho). Para reproduzir o
+particionamento por prefixo dos backends S3, cada partição, formada pelos
+`prefix_depth` primeiros segmentos da chave, atende no máximo
+`partition_concurrency` escritas simultâneas, cada uma com duração `latency`.
+Uso:
+
+    python utils/fake_object_store.py --port 9000 --latency 0.02 \\
+        --partition-concurrency 4
+
+A conexão `aws_default` do Airflow deve então apontar para
+`http://localhost:9000`.
+"""
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
+
+
+class FakeObjectStoreConfig:
+    """Parâmetros de comportamento do servidor.
+
+    As escritas em uma mesma partição (os `prefix_depth` primeiros segmentos
+    da chave) são limitadas a `partition_concurrency` simultâneas, cada uma
+    ocupando a partição por `latency` segundos.
+    """
+
+    def __init__(self, latency=0.0, partition_concurrency=4, prefix_depth=1):
+        self.latency = latency
+        self.partition_concurrency = partition_concurrency
+        self.prefix_depth = prefix_depth
+
+
+class FakeObjectStore:
+    def __init__(self, config):
+        self.config = config
+        self.objects = {}
+        self.partitions = {}
+        self.writes = {}
+        self._lock = threading.Lock()
+
+    def partition(self, bucket, key):
+        return (bucket, "/".join(key.split("/")[: self.config.prefix_depth]))
+
+    @contextmanager
+    def writing(self, bucket, key):
+        partition = self.partition(bucket, key)
+        with self._lock:
+            slots = self.partitions.get(partition)
+            if slots is None:
+                slots = self.partitions[partition] = threading.BoundedSemaphore(
+                    self.config.partition_concurrency
+                )
+            self.writes[partition] = self.writes.get(partition, 0) + 1
+        with slots:
+            if self.config.latency:
+                time.sleep(self.config.latency)
+            yield
+
+    def put(self, bucket, key, body, headers):
+        with self.writing(bucket, key):
+            with self._lock:
+                self.objects[(bucket, key)] = (body, headers)
+
+    def get(self, bucket, key):
+        with self._lock:
+            return self.objects.get((bucket, key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "objects": len(self.objects),
+                "partitions": len(self.writes),
+                "max_partition_writes": max(self.writes.values(), default=0),
+            }
+
+
+class FakeObjectStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _target(self):
+        path = unquote(urlsplit(self.path).path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def _respond(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if not size:
+                    # Trailers, encerrados por uma linha vazia
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_PUT(self):
+        bucket, key = self._target()
+        body = self._read_body()
+        if not key:
+            return self._respond(200)
+        headers = {
+            name: self.headers[name]
+            for name in ("Content-Type", "Content-Encoding")
+            if self.headers.get(name)
+        }
+        self.store.put(bucket, key, body, headers)
+        self._respond(200, headers={"ETag": '"%d"' % len(body)})
+
+    def do_GET(self):
+        bucket, key = self._target()
+        if not key:
+            # Todos os buckets existem
+            return self._respond(200)
+        stored = self.store.get(bucket, key)
+        if stored is None:
+            return self._respond(404, b"<Error><Code>NoSuchKey</Code></Error>")
+        body, headers = stored
+        self._respond(200, body, headers)
+
+    do_HEAD = do_GET
+
+
+class FakeObjectStoreServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), config=None, verbose=False):
+        super().__init__(address, FakeObjectStoreHandler)
+        self.store = FakeObjectStore(config or FakeObjectStoreConfig())
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+
+@contextmanager
+def running_fake_object_store(**kwargs):
+    """Executa um `FakeObjectStoreServer` em uma thread durante o bloco,
+    produzindo o servidor (a URL base está em `server.url`)."""
+    server = FakeObjectStoreServer(**kwargs)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Servidor local que simula um object store compatível com S3."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos")
+    parser.add_argument("--partition-concurrency", type=int, default=4)
+    parser.add_argument("--prefix-depth", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = FakeObjectStoreConfig(
+        latency=args.latency,
+        partition_concurrency=args.partition_concurrency,
+        prefix_depth=args.prefix_depth,
+    )
+    server = FakeObjectStoreServer(
+        (args.host, args.port), config=config, verbose=args.verbose
+    )
+    print("Fake object store listening on %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compara o desempenho das implementações de JSON disponíveis
+(`common.json_codec.CODECS`) na decodificação e codificação dos fixtures
+reais do projeto (`airflow/tests/fixtures`). Uso:
+
+    python utils/json_codec_benchmark.py [--number 200]
+"""
+import os
+import sys
+import glob
+import timeit
+import argparse
+
+AIRFLOW_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(AIRFLOW_HOME, "dags"))
+
+from common.json_codec import CODECS, CODEC  # noqa: E402
+
+
+FIXTURES_PATH = os.path.join(AIRFLOW_HOME, "tests", "fixtures")
+
+
+def load_fixtures():
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_PATH, "*.json"))):
+        with open(path, "rb") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def benchmark(codec, data, number):
+    obj = codec.loads(data)
+    loads = min(timeit.repeat(lambda: codec.loads(data), number=number, repeat=3))
+    dumps = min(timeit.repeat(lambda: codec.dumpb(obj), number=number, repeat=3))
+    return loads / number, dumps / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print("selected codec: %s" % CODEC.name)
+    print(
+        "%-55s %-10s %12s %12s"
+        % ("fixture", "codec", "loads (us)", "dumps (us)")
+    )
+    for name, data in load_fixtures().items():
+        for codec in CODECS.values():
+            loads, dumps = benchmark(codec, data, args.number)
+            print(
+                "%-55s %-10s %12.1f %12.1f"
+                % (name, codec.name, loads * 1e6, dumps * 1e6)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compara a vazão de escrita dos layouts de chaves do object store
+(`common.hooks.KEY_LAYOUTS`) em um object store local que limita as escritas
+simultâneas por prefixo (`utils/fake_object_store.py`), simulando a carga
+em massa dos documentos de um mesmo periódico. Uso:
+
+    python utils/key_layout_benchmark.py [--documents 50] [--objects 10] \\
+        [--workers 32] [--latency 0.05] [--partition-concurrency 4]
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+AIRFLOW_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(AIRFLOW_HOME, "dags"))
+sys.path.insert(0, AIRFLOW_HOME)
+
+from common.hooks import KEY_LAYOUTS  # noqa: E402
+from utils.fake_object_store import (  # noqa: E402
+    FakeObjectStoreConfig,
+    running_fake_object_store,
+)
+
+
+BUCKET = "documentstore"
+
+
+def canonical_keys(documents, objects, issn="0034-8910"):
+    """Chaves canônicas dos objetos de `documents` documentos de um mesmo
+    periódico, com `objects` objetos cada."""
+    keys = []
+    for document in range(documents):
+        scielo_id = hashlib.sha1(b"document-%d" % document).hexdigest()[:23]
+        for number in range(objects):
+            sha1 = hashlib.sha1(b"%d-%d" % (document, number)).hexdigest()
+            keys.append("{}/{}/{}.jpg".format(issn, scielo_id, sha1))
+    return keys
+
+
+def benchmark(layout, keys, body, workers, config):
+    with running_fake_object_store(config=config) as server:
+        client = boto3.client(
+            "s3",
+            endpoint_url=server.url,
+            aws_access_key_id="fake",
+            aws_secret_access_key="fake",
+            region_name="us-east-1",
+            config=Config(
+                s3={"addressing_style": "path"}, max_pool_connections=workers
+            ),
+        )
+
+        def put(key):
+            client.put_object(Bucket=BUCKET, Key=KEY_LAYOUTS[layout](key), Body=body)
+
+        # Estabelece a conexão e carrega os modelos do botocore antes da medição
+        client.head_bucket(Bucket=BUCKET)
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(put, keys))
+        elapsed = time.perf_counter() - started_at
+        return elapsed, server.store.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--objects", type=int, default=10)
+    parser.add_argument("--size", type=int, default=1024, help="bytes por objeto")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos")
+    parser.add_argument("--partition-concurrency", type=int, default=4)
+    parser.add_argument("--prefix-depth", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    config = FakeObjectStoreConfig(
+        latency=args.latency,
+        partition_concurrency=args.partition_concurrency,
+        prefix_depth=args.prefix_depth,
+    )
+    keys = canonical_keys(args.documents, args.objects)
+    body = os.urandom(args.size)
+    print(
+        "%-10s %8s %10s %12s %11s"
+        % ("layout", "objects", "seconds", "objects/s", "partitions")
+    )
+    for layout in KEY_LAYOUTS:
+        elapsed, stats = benchmark(layout, keys, body, args.workers, config)
+        print(
+            "%-10s %8d %10.2f %12.1f %11d"
+            % (layout, len(keys), elapsed, len(keys) / elapsed, stats["partitions"])
+        )
+
+
+if __name__ == "__main__":
+    main()